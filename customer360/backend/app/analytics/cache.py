@@ -0,0 +1,160 @@
+"""
+On-disk cache for preprocessed upload data.
+
+One upload is preprocessed when its mapping is validated and again when the
+analysis job runs. Entries are keyed by the file's content hash plus whatever
+else shapes the result (mapping, parser options), so the job can start from
+the canonical frame validation already built instead of re-parsing the file.
+
+Each entry is a JSON payload, optionally with a Parquet frame beside it. Entries
+are evicted least-recently-used first once the directory exceeds its byte budget.
+"""
+import hashlib
+import json
+import logging
+import os
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa_parquet = None
+
+from ..config import CACHE_DIR, PREPROCESS_CACHE_MAX_MB
+from .ingestion import _columnar_to_pandas
+
+logger = logging.getLogger(__name__)
+
+# Bump when the canonical frame or its metadata change shape, so old entries miss.
+CACHE_VERSION = 1
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 of a file's contents, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(**parts: Any) -> str:
+    """Stable key for the given JSON-serialisable parts (order-insensitive)."""
+    payload = json.dumps({'version': CACHE_VERSION, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _json_default(value: Any) -> Any:
+    """Make numpy scalars and timestamps in metadata JSON-serialisable."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class FrameCache:
+    """
+    Byte-bounded LRU cache of JSON payloads and DataFrames in one directory.
+
+    Reads bump an entry's modification time, which is what eviction orders by,
+    so entries survive restarts and are shared by every worker on the host.
+    Writes go to a temporary name and are renamed into place.
+    """
+
+    def __init__(self, directory: Path = CACHE_DIR / 'preprocess', max_bytes: int = PREPROCESS_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        return self.directory / f"{key}.json", self.directory / f"{key}.parquet"
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], Optional[pd.DataFrame]]]:
+        """Return (payload, frame or None) for a key, or None on a miss."""
+        if not self.enabled:
+            return None
+        payload_path, frame_path = self._paths(key)
+        try:
+            with open(payload_path, encoding='utf-8') as handle:
+                payload = json.load(handle)
+            # Same Arrow-backed text columns the loaders produce
+            frame = _columnar_to_pandas(pa_parquet.read_table(frame_path)) if payload.get('has_frame') else None
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning("Discarding unreadable cache entry %s: %s", key, exc)
+            self.discard(key)
+            return None
+
+        for path in (payload_path, frame_path):
+            if path.exists():
+                os.utime(path)
+        return payload['data'], frame
+
+    def put(self, key: str, data: Dict[str, Any], frame: Optional[pd.DataFrame] = None) -> bool:
+        """Store a payload (and optional frame). Returns False when caching is unavailable."""
+        if not self.enabled or (frame is not None and pa_parquet is None):
+            return False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        payload_path, frame_path = self._paths(key)
+        suffix = f".{uuid.uuid4().hex}.tmp"
+        try:
+            # The frame goes first: a payload on disk always has its frame beside it.
+            if frame is not None:
+                temp_frame = frame_path.with_name(frame_path.name + suffix)
+                frame.to_parquet(temp_frame)
+                os.replace(temp_frame, frame_path)
+            temp_payload = payload_path.with_name(payload_path.name + suffix)
+            with open(temp_payload, 'w', encoding='utf-8') as handle:
+                json.dump({'has_frame': frame is not None, 'data': data}, handle, default=_json_default)
+            os.replace(temp_payload, payload_path)
+        except Exception as exc:
+            logger.warning("Could not write cache entry %s: %s", key, exc)
+            for path in self.directory.glob(f"{key}.*{suffix}"):
+                path.unlink(missing_ok=True)
+            return False
+
+        self.evict()
+        return True
+
+    def discard(self, key: str) -> None:
+        for path in self._paths(key):
+            path.unlink(missing_ok=True)
+
+    def evict(self) -> List[str]:
+        """Drop least recently used entries until the directory fits the budget."""
+        entries: Dict[str, Dict[str, float]] = {}
+        for path in self.directory.glob('*'):
+            if path.suffix not in {'.json', '.parquet'}:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entry = entries.setdefault(path.stem, {'bytes': 0, 'used': 0.0})
+            entry['bytes'] += stat.st_size
+            entry['used'] = max(entry['used'], stat.st_mtime)
+
+        total = sum(entry['bytes'] for entry in entries.values())
+        evicted = []
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]['used']):
+            if total <= self.max_bytes:
+                break
+            self.discard(key)
+            total -= entry['bytes']
+            evicted.append(key)
+        if evicted:
+            logger.info("Evicted %d preprocessing cache entries", len(evicted))
+        return evicted
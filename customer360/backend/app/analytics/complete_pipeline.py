@@ -61,6 +61,8 @@ import plotly.graph_objects as go
 import squarify
 from fpdf import FPDF
 
+from .rfm import compute_rfm
+
 warnings.filterwarnings('ignore')
 sns.set_style('whitegrid')
 plt.rcParams.update({'figure.dpi': 150, 'font.family': 'sans-serif',
@@ -367,19 +369,14 @@ class CompletePipeline:
         if not all([customer_col, date_col, rev_col]):
             raise ValueError("Missing required columns for RFM")
         
-        reference_date = self.df[date_col].max() + pd.Timedelta(days=1)
-        
-        self.rfm = self.df.groupby(customer_col).agg({
-            date_col: lambda x: (reference_date - x.max()).days,
-            rev_col: ['count', 'sum']
-        }).reset_index()
-        
-        self.rfm.columns = ['customer_id', 'recency', 'frequency', 'monetary']
-        
-        # Ensure positive values
-        self.rfm['recency'] = self.rfm['recency'].clip(lower=0)
-        self.rfm['frequency'] = self.rfm['frequency'].clip(lower=1)
-        self.rfm['monetary'] = self.rfm['monetary'].clip(lower=0)
+        # Frequency counts transaction rows, so no invoice column is passed
+        self.rfm = compute_rfm(
+            self.df,
+            customer_col=customer_col,
+            date_col=date_col,
+            amount_col=rev_col,
+            invoice_col=None,
+        )
         
         logger.info(f"RFM computed for {len(self.rfm)} customers")
         
@@ -0,0 +1,194 @@
+"""
+Exploratory summary of the cleaned transaction frame, built in one pass.
+
+The summary used to walk the frame once per statistic (duplicates, missing values,
+five aggregates per numeric column, one value_counts per label column). The
+accumulator here visits each chunk once and keeps only mergeable state, so it can
+be fed chunk by chunk, or filled on separate chunks and combined with merge().
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .quantiles import QuantileSummary
+from .sketches import HeavyHitters
+
+# Numeric columns summarised with mean/median/std/min/max when present
+NUMERIC_COLUMNS = ('amount', 'qty', 'price', 'discount')
+
+# Label columns whose most frequent values are reported, and the summary key for each
+TOP_VALUE_COLUMNS = {'category': 'top_categories', 'product': 'top_products', 'payment': 'top_payments'}
+
+TOP_VALUES = 10
+
+# Columns the pipeline adds for its own use (see compact_frame); not uploaded data
+INTERNAL_COLUMNS = ('customer_code',)
+
+# Odd multiplier folding per-column hashes into one row hash
+_ROW_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+class _Moments:
+    """Count, mean, sum of squared deviations, min and max, merged with Chan's formula."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        # The median comes from a quantile summary: exact for small columns
+        self.quantiles = QuantileSummary()
+
+    def add(self, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        chunk = _Moments()
+        chunk.count = int(values.size)
+        chunk.mean = float(values.mean())
+        chunk.m2 = float(np.square(values - chunk.mean).sum())
+        chunk.minimum = float(values.min())
+        chunk.maximum = float(values.max())
+        chunk.quantiles.add(values)
+        self.merge(chunk)
+
+    def merge(self, other: "_Moments") -> None:
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.count = total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.quantiles.merge(other.quantiles)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'mean': float(self.mean),
+            'median': float(self.quantiles.quantile(0.5)),
+            'std': float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else 0.0,
+            'min': float(self.minimum),
+            'max': float(self.maximum),
+        }
+
+
+class EDAAccumulator:
+    """
+    Mergeable single-pass summary: rows, duplicate rows, missing cells, numeric
+    moments and the most frequent labels.
+
+    Duplicate rows are found by hashing each row to 64 bits; a row counts as a
+    duplicate when its hash was already seen, in this chunk or an earlier one.
+    Top labels come from a HeavyHitters summary per column, which is exact until a
+    column has more than `top_capacity` distinct values.
+
+    Usage:
+        accumulator = EDAAccumulator()
+        for chunk in chunks:
+            accumulator.add(chunk)
+        summary = accumulator.summary()
+    """
+
+    def __init__(self, top_capacity: int = 16384):
+        self.top_capacity = top_capacity
+        self.rows = 0
+        self.columns: Optional[int] = None
+        self.missing_values = 0
+        self._row_hashes: List[np.ndarray] = []
+        self._moments: Dict[str, _Moments] = {}
+        self._top_values: Dict[str, HeavyHitters] = {}
+        # Per categorical column: (dtype, hashes of its categories plus a trailing
+        # hash for missing values), reused while chunks share the dtype
+        self._category_hashes: Dict[str, tuple] = {}
+
+    def _column_hashes(self, column: str, series: pd.Series) -> np.ndarray:
+        """64-bit hashes of a column's values; equal values hash equally in any chunk."""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            cached = self._category_hashes.get(column)
+            if cached is None or cached[0] is not series.dtype:
+                values = np.append(series.cat.categories.to_numpy(dtype=object), None)
+                cached = (series.dtype, pd.util.hash_array(values, categorize=False))
+                self._category_hashes[column] = cached
+            # Code -1 (missing) picks the trailing entry
+            return cached[1][series.cat.codes.to_numpy()]
+        return pd.util.hash_pandas_object(series, index=False, categorize=False).to_numpy()
+
+    def add(self, chunk: pd.DataFrame) -> "EDAAccumulator":
+        """Fold one chunk of rows into the summary."""
+        columns = [column for column in chunk.columns if column not in INTERNAL_COLUMNS]
+        if self.columns is None:
+            self.columns = len(columns)
+        self.rows += int(len(chunk))
+        if chunk.empty:
+            return self
+
+        row_hashes = np.zeros(len(chunk), dtype=np.uint64)
+        for column in columns:
+            series = chunk[column]
+            row_hashes = row_hashes * _ROW_HASH_MULTIPLIER ^ self._column_hashes(column, series)
+            self.missing_values += int(series.isna().sum())
+
+            if column in NUMERIC_COLUMNS and pd.api.types.is_numeric_dtype(series):
+                values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+                values = values[~np.isnan(values)]
+                self._moments.setdefault(column, _Moments()).add(values)
+            elif column in TOP_VALUE_COLUMNS:
+                # Count the raw values, then key them by their text: missing labels
+                # show as "nan" and values with the same text are counted together,
+                # without casting every row to a string first.
+                counts = series.value_counts(dropna=False, sort=False)
+                counts.index = counts.index.astype(str)
+                counts = counts.groupby(level=0, sort=False).sum()
+                self._top_values.setdefault(column, HeavyHitters(self.top_capacity)).add_counts(counts)
+
+        # Distinct row hashes per chunk; duplicates are rows minus distinct hashes overall
+        self._row_hashes.append(np.unique(row_hashes))
+        return self
+
+    def merge(self, other: "EDAAccumulator") -> "EDAAccumulator":
+        """Combine with an accumulator filled on other rows of the same frame."""
+        if self.columns is None:
+            self.columns = other.columns
+        self.rows += other.rows
+        self.missing_values += other.missing_values
+        self._row_hashes.extend(other._row_hashes)
+        for column, moments in other._moments.items():
+            self._moments.setdefault(column, _Moments()).merge(moments)
+        for column, top_values in other._top_values.items():
+            self._top_values.setdefault(column, HeavyHitters(self.top_capacity)).merge(top_values)
+        return self
+
+    @property
+    def duplicates(self) -> int:
+        if not self._row_hashes:
+            return 0
+        # Keep the compacted set so repeated reads and later chunks start from it
+        self._row_hashes = [np.unique(np.concatenate(self._row_hashes))]
+        return self.rows - int(self._row_hashes[0].size)
+
+    def summary(self) -> Dict[str, Any]:
+        """The EDA summary in the shape the pipeline stores under preprocessing['eda']."""
+        summary: Dict[str, Any] = {
+            'rows': int(self.rows),
+            'columns': int(self.columns or 0),
+            'duplicates': self.duplicates,
+            'missing_values': int(self.missing_values),
+            'numeric_summary': {},
+            'top_categories': [],
+            'top_products': [],
+            'top_payments': [],
+        }
+        for column in NUMERIC_COLUMNS:
+            moments = self._moments.get(column)
+            if moments is not None and moments.count:
+                summary['numeric_summary'][column] = moments.summary()
+        for column, key in TOP_VALUE_COLUMNS.items():
+            if column in self._top_values:
+                summary[key] = [
+                    {'label': str(label), 'count': int(count)}
+                    for label, count in self._top_values[column].top(TOP_VALUES)
+                ]
+        return summary
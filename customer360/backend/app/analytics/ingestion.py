@@ -0,0 +1,1091 @@
+"""
+Streaming ingestion helpers for Customer360.
+
+Uploads used to be read into memory in one go, so a file was only found to be too
+large after it had already been parsed. These helpers read the source in fixed-size
+chunks, drop fully blank rows, and enforce the row and memory limits chunk by chunk
+so an oversized upload is rejected before it can exhaust the worker.
+"""
+import codecs
+import gzip
+import io
+import json
+import logging
+import os
+import random
+import re
+import struct
+import zipfile
+from contextlib import contextmanager
+from datetime import date, datetime, time
+from time import monotonic
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+import sqlalchemy as sa
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..config import (
+    CSV_READER_ENGINE,
+    INGEST_CHUNK_ROWS,
+    INGEST_MAX_MEMORY_MB,
+    MAX_ROWS,
+    MAX_UNCOMPRESSED_MB,
+    PREVIEW_HEAD_KB,
+    PREVIEW_SAMPLE_COUNT,
+    PREVIEW_SAMPLE_KB,
+    PREVIEW_SHEET_ROWS,
+    SQL_BATCH_ROWS,
+    SQL_SOURCES,
+    SQL_STATEMENT_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+    pa_csv = None
+    pa_parquet = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Raised by the Arrow reader for malformed rows and undecodable bytes; empty when
+# pyarrow is missing so `except ARROW_ERRORS` is a no-op.
+ARROW_ERRORS = (pa.ArrowInvalid,) if pa is not None else ()
+
+READER_ENGINES = ('pandas', 'pyarrow')
+
+# Bytes per Arrow record batch when streaming. Arrow chunks by bytes rather than rows;
+# 16 MB keeps batches in the same range as INGEST_CHUNK_ROWS rows of a typical export.
+ARROW_BLOCK_BYTES = 16 * 1024 * 1024
+
+# Upload formats read through Arrow rather than a text parser, keyed by file suffix.
+COLUMNAR_FORMATS = {'.parquet': 'parquet', '.feather': 'feather'}
+
+# Spreadsheet uploads, keyed by file suffix. Rows are streamed from the sheet XML in
+# openpyxl's read-only mode; the workbook is never loaded as a whole.
+SPREADSHEET_FORMATS = {'.xlsx': 'xlsx'}
+
+# Jobs that query a configured database instead of reading an upload are described by
+# a small JSON file with this suffix: {"connection": <SQL_SOURCES name>, "query": <SELECT>}.
+# Only the connection name is stored with the job; its URL stays in configuration.
+SQL_FORMATS = {'.sqlquery': 'sql'}
+
+# Databases whose sessions can be made read-only with a statement timeout
+SQL_DIALECTS = ('postgresql', 'mysql', 'sqlite')
+
+# Words that make a SELECT write or lock (SELECT ... INTO OUTFILE, data-modifying
+# CTEs, FOR UPDATE) and functions that read server files, sleep or signal other
+# sessions. Checked outside literals and comments.
+SQL_BLOCKED_KEYWORDS = ('delete', 'insert', 'into', 'lock', 'merge', 'update')
+SQL_BLOCKED_FUNCTIONS = (
+    'benchmark', 'dblink', 'dblink_exec', 'get_lock', 'lo_export', 'lo_import', 'load_extension',
+    'load_file', 'pg_advisory_lock', 'pg_cancel_backend', 'pg_ls_dir', 'pg_read_binary_file',
+    'pg_read_file', 'pg_reload_conf', 'pg_sleep', 'pg_sleep_for', 'pg_sleep_until',
+    'pg_terminate_backend', 'readfile', 'set_config', 'sleep', 'writefile',
+)
+
+# Literals, quoted names and comments. Databases disagree on these: backslash
+# escapes a quote in MySQL strings but not in standard SQL ones, so a query is
+# checked under both readings and text one database would run cannot pass as a
+# string. MySQL runs /*! ... */ comments and needs whitespace after "--", so those
+# stay in the checked text.
+_SQL_LITERAL_PATTERNS = tuple(
+    re.compile(rf"(?P<quoted>\"(?:{quoted})*\"|`(?:[^`]|``)*`)|'(?:{string})*'|--(?=\s)[^\n]*|/\*(?!!).*?\*/", re.DOTALL)
+    for string, quoted in (
+        (r"[^']|''", r'[^"]|""'),
+        (r"[^'\\]|\\.|''", r'[^"\\]|\\.|""'),
+    )
+)
+_SQL_WORD = re.compile(r"[a-z_][a-z0-9_$]*", re.IGNORECASE)
+_SQL_CALL = re.compile(r"([a-z_][a-z0-9_$]*)\s*\(", re.IGNORECASE)
+
+# Compressed CSV uploads, keyed by the final file suffix. Both are decompressed as a
+# stream while reading; the inflated file is never written to disk.
+COMPRESSED_FORMATS = {'.gz': 'gzip', '.zip': 'zip'}
+
+# Byte-order marks, longest first: the UTF-32 LE mark starts with the UTF-16 LE mark.
+_BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Bytes that cp1252 leaves undefined. Files containing them can only be latin-1.
+_CP1252_UNDEFINED_BYTES = frozenset(b'\x81\x8d\x8f\x90\x9d')
+
+# Encodings tried, in order, if the detected one still fails somewhere the sampler
+# did not look. latin-1 maps every byte, so the chain always ends in a parse.
+FALLBACK_ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
+
+
+def compression_of(file_path: str) -> Optional[str]:
+    """Return 'gzip' or 'zip' for compressed uploads (by file suffix), else None."""
+    return COMPRESSED_FORMATS.get(os.path.splitext(str(file_path))[1].lower())
+
+
+def _zip_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    # Archivers add folders and macOS resource forks; the one real entry must be a CSV.
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+        and not os.path.basename(info.filename).startswith('.')
+    ]
+    if len(members) != 1 or not members[0].filename.lower().endswith('.csv'):
+        raise ValueError("Zip uploads must contain exactly one CSV file")
+    return members[0]
+
+
+def source_size(file_path: str) -> int:
+    """
+    Size in bytes of the data a reader sees: the file size, or the inflated size of a
+    compressed upload as recorded in the archive (zip entry header, gzip trailer).
+
+    Raises:
+        ValueError: If a compressed upload is not a valid archive
+    """
+    compression = compression_of(file_path)
+    try:
+        if compression == 'zip':
+            with zipfile.ZipFile(file_path) as archive:
+                return _zip_member(archive).file_size
+        if compression == 'gzip':
+            with open(file_path, 'rb') as handle:
+                if handle.read(2) != b'\x1f\x8b':
+                    raise ValueError("The uploaded .gz file is not gzip-compressed")
+                # ISIZE: the last four bytes hold the inflated size modulo 4 GiB
+                handle.seek(-4, os.SEEK_END)
+                return struct.unpack('<I', handle.read(4))[0]
+    except (zipfile.BadZipFile, OSError, struct.error) as e:
+        raise ValueError(f"Could not read the compressed upload: {str(e)}")
+    return os.path.getsize(file_path)
+
+
+class _SizeLimitedReader(io.RawIOBase):
+    """Pass reads through, failing once more than `max_bytes` have been read."""
+
+    def __init__(self, raw: BinaryIO, max_bytes: int):
+        super().__init__()
+        self._raw = raw
+        self._max_bytes = max_bytes
+        self._bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self._raw.readinto(buffer)
+        self._bytes_read += count
+        if self._bytes_read > self._max_bytes:
+            raise ValueError(
+                f"File is larger than {self._max_bytes / 1024 / 1024:,.0f} MB once decompressed. "
+                f"Please reduce the file size or contact support."
+            )
+        return count
+
+    def close(self) -> None:
+        self._raw.close()
+        super().close()
+
+
+def open_source(file_path: str, max_bytes: Optional[int] = None) -> BinaryIO:
+    """
+    Open an upload for binary reading, decompressing gzip and zip uploads on the fly.
+
+    Decompressed streams still support seek (forward seeks read and discard), which
+    the samplers rely on. With `max_bytes` the stream is forward-only and raises
+    ValueError once more than that many bytes have been read.
+
+    Raises:
+        ValueError: If a compressed upload is not a valid archive
+    """
+    compression = compression_of(file_path)
+    try:
+        if compression == 'gzip':
+            handle = gzip.open(file_path, 'rb')
+        elif compression == 'zip':
+            archive = zipfile.ZipFile(file_path)
+            handle = archive.open(_zip_member(archive))
+            # The member stream keeps its own file handle; the archive object can go.
+            archive.close()
+        else:
+            handle = open(file_path, 'rb')
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ValueError(f"Could not read the compressed upload: {str(e)}")
+    if max_bytes is not None:
+        return io.BufferedReader(_SizeLimitedReader(handle, max_bytes))
+    return handle
+
+
+@contextmanager
+def open_csv_source(file_path: str) -> Iterator[Union[str, BinaryIO]]:
+    """
+    What to hand a CSV reader: the path itself for a plain file, or a decompressed
+    stream capped at MAX_UNCOMPRESSED_MB for a compressed one.
+    """
+    if compression_of(file_path) is None:
+        yield file_path
+        return
+    with open_source(file_path, max_bytes=MAX_UNCOMPRESSED_MB * 1024 * 1024) as handle:
+        yield handle
+
+
+def sample_file_bytes(
+    file_path: str,
+    *,
+    head_bytes: int = 64 * 1024,
+    sample_count: int = 8,
+    sample_bytes: int = 16 * 1024,
+) -> List[bytes]:
+    """
+    Read the head of a file plus `sample_count` ranges spread evenly through the rest,
+    ending with the tail.
+
+    The ranges let encoding detection see accented names or currency symbols that
+    only appear deep into a large export without reading the whole file.
+    """
+    file_size = source_size(file_path)
+    with open_source(file_path) as handle:
+        samples = [handle.read(head_bytes)]
+        if file_size <= head_bytes:
+            return samples
+
+        # Evenly spaced ranges; the last one is clamped so it always covers the tail.
+        remaining = file_size - head_bytes
+        for index in range(1, sample_count + 1):
+            offset = head_bytes + (remaining * index) // sample_count
+            handle.seek(min(offset, max(file_size - sample_bytes, head_bytes)))
+            samples.append(handle.read(sample_bytes))
+    return samples
+
+
+def _is_valid_utf8(sample: bytes, starts_mid_file: bool) -> bool:
+    if starts_mid_file:
+        # A range can start inside a multi-byte character; skip its continuation bytes.
+        skip = 0
+        while skip < min(3, len(sample)) and 0x80 <= sample[skip] <= 0xBF:
+            skip += 1
+        sample = sample[skip:]
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        # final=False tolerates a character cut off at the end of the range.
+        decoder.decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _detect_utf16_without_bom(head: bytes) -> Optional[str]:
+    if len(head) < 4:
+        return None
+    even_nulls = head[0::2].count(0)
+    odd_nulls = head[1::2].count(0)
+    half = len(head) / 2
+    if odd_nulls > 0.3 * half and even_nulls < 0.05 * half:
+        return 'utf-16-le'
+    if even_nulls > 0.3 * half and odd_nulls < 0.05 * half:
+        return 'utf-16-be'
+    return None
+
+
+def detect_encoding(file_path: str, samples: Optional[List[bytes]] = None) -> str:
+    """
+    Pick the text encoding of an upload from a sample of its bytes.
+
+    Checks for a byte-order mark, then UTF-16 without one, then whether every sampled
+    range is valid UTF-8. Anything else is treated as a Windows export: cp1252 unless
+    a byte cp1252 does not define is present, in which case latin-1.
+
+    Args:
+        file_path: Path to the file
+        samples: Pre-read byte ranges (head first); read with sample_file_bytes if omitted
+
+    Returns:
+        A codec name that pandas and pyarrow both accept
+    """
+    samples = samples if samples is not None else sample_file_bytes(file_path)
+    head = samples[0] if samples else b''
+
+    for bom, encoding in _BYTE_ORDER_MARKS:
+        if head.startswith(bom):
+            return encoding
+
+    utf16 = _detect_utf16_without_bom(head)
+    if utf16:
+        return utf16
+
+    if all(_is_valid_utf8(sample, starts_mid_file=index > 0) for index, sample in enumerate(samples)):
+        return 'utf-8'
+
+    if any(_CP1252_UNDEFINED_BYTES.intersection(sample) for sample in samples):
+        return 'latin-1'
+    return 'cp1252'
+
+
+def fallback_encodings(encoding: str) -> List[str]:
+    """Return the detected encoding followed by the remaining fallbacks."""
+    return [encoding] + [candidate for candidate in FALLBACK_ENCODINGS if candidate != encoding]
+
+
+def _new_ingestion_stats(stats: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    stats = stats if stats is not None else {}
+    stats.update({
+        'raw_rows': 0,
+        'removed_blank_rows': 0,
+        'usable_rows': 0,
+        'chunks': 0,
+        'memory_bytes': 0,
+    })
+    return stats
+
+
+def limit_chunks(
+    chunks: Iterable[pd.DataFrame],
+    *,
+    max_rows: int = MAX_ROWS,
+    max_memory_mb: Optional[float] = INGEST_MAX_MEMORY_MB,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Drop blank rows from each chunk and enforce the dataset limits as chunks arrive.
+
+    Args:
+        chunks: Raw chunks straight from a reader
+        max_rows: Maximum number of usable (non-blank) rows across all chunks
+        max_memory_mb: Ceiling for the combined in-memory size of the yielded chunks
+        stats: Optional dict that is filled with running row, chunk, and byte counts
+
+    Yields:
+        Non-empty chunks with fully blank rows removed
+
+    Raises:
+        ValueError: As soon as the row or memory limit is crossed
+    """
+    stats = _new_ingestion_stats(stats)
+    memory_limit = int(max_memory_mb * 1024 * 1024) if max_memory_mb else None
+
+    for chunk in chunks:
+        raw_rows = len(chunk)
+        chunk = chunk.dropna(how='all')
+        stats['raw_rows'] += raw_rows
+        stats['removed_blank_rows'] += raw_rows - len(chunk)
+        stats['usable_rows'] += len(chunk)
+        stats['chunks'] += 1
+
+        if stats['usable_rows'] > max_rows:
+            raise ValueError(
+                f"File has at least {stats['usable_rows']:,} rows which exceeds the maximum of {max_rows:,}. "
+                f"Please reduce the file size or contact support."
+            )
+
+        stats['memory_bytes'] += int(chunk.memory_usage(deep=True).sum())
+        if memory_limit and stats['memory_bytes'] > memory_limit:
+            raise ValueError(
+                f"File needs more than {max_memory_mb:,.0f} MB of memory to process. "
+                f"Please reduce the file size or contact support."
+            )
+
+        if not chunk.empty:
+            yield chunk
+
+
+def iter_csv_chunks(
+    file_path: str,
+    *,
+    encoding: str = 'utf-8',
+    chunksize: int = INGEST_CHUNK_ROWS,
+    max_rows: int = MAX_ROWS,
+    max_memory_mb: Optional[float] = INGEST_MAX_MEMORY_MB,
+    stats: Optional[Dict[str, Any]] = None,
+    **read_kwargs: Any,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream a CSV file in chunks of `chunksize` rows.
+
+    Columns are read as text unless `dtype` is passed explicitly. Type inference per
+    chunk is not stable (a column can be int in one chunk and float in the next), and
+    the preprocessing stage parses dates and amounts from text anyway.
+
+    Raises:
+        ValueError: If the row or memory limit is crossed while streaming
+    """
+    read_kwargs.setdefault('dtype', str)
+    with open_csv_source(file_path) as source:
+        reader = pd.read_csv(source, encoding=encoding, chunksize=chunksize, **read_kwargs)
+        with reader:
+            yield from limit_chunks(reader, max_rows=max_rows, max_memory_mb=max_memory_mb, stats=stats)
+
+
+def read_csv_header(file_path: str, *, encoding: str = 'utf-8', **read_kwargs: Any) -> List[str]:
+    """
+    Parse only the header row of a CSV file.
+
+    Duplicate names come back de-duplicated ("Amount", "Amount.1") exactly as a full
+    read would label them, so positions and names line up with a later projected read.
+    """
+    with open_csv_source(file_path) as source:
+        return list(pd.read_csv(source, encoding=encoding, nrows=0, **read_kwargs).columns)
+
+
+def resolve_reader_engine(engine: Optional[str] = None) -> str:
+    """
+    Return the CSV reader engine to use: the requested one (default CSV_READER_ENGINE),
+    or 'pandas' if pyarrow was requested but is not installed.
+    """
+    engine = (engine or CSV_READER_ENGINE or 'pandas').strip().lower()
+    if engine not in READER_ENGINES:
+        raise ValueError(f"Unknown CSV reader engine '{engine}'. Use one of: {', '.join(READER_ENGINES)}")
+    if engine == 'pyarrow' and pa_csv is None:
+        logger.warning("CSV reader engine 'pyarrow' requested but pyarrow is not installed; using pandas")
+        return 'pandas'
+    return engine
+
+
+def is_arrow_decode_error(error: Exception) -> bool:
+    """Arrow reports undecodable bytes as ArrowInvalid rather than UnicodeDecodeError."""
+    return 'UTF8' in str(error) or 'decode' in str(error).lower()
+
+
+def _arrow_read_options(
+    file_path: str,
+    *,
+    encoding: str,
+    usecols: Optional[List[int]],
+    block_size: Optional[int] = None,
+    infer_types: bool = False,
+):
+    # Supplying the pandas-style header keeps duplicate names ("Amount", "Amount.1")
+    # and projected positions identical between engines.
+    header = read_csv_header(file_path, encoding=encoding)
+    include = [header[position] for position in usecols] if usecols is not None else header
+    read_options = pa_csv.ReadOptions(
+        encoding=encoding,
+        column_names=header,
+        skip_rows=1,
+        use_threads=True,
+        **({'block_size': block_size} if block_size else {}),
+    )
+    # Every column is read as text, matching the pandas path: dates and amounts are
+    # parsed later with the user's format and locale options.
+    column_types = {name: pa.string() for name in include}
+    if infer_types:
+        # Numbers and booleans are inferred as pandas would; columns Arrow would turn
+        # into dates or timestamps stay text, as pandas leaves them unparsed. Their
+        # types are taken from the first block only.
+        with open_csv_source(file_path) as source:
+            schema = pa_csv.open_csv(
+                source,
+                read_options=read_options,
+                convert_options=pa_csv.ConvertOptions(include_columns=include, strings_can_be_null=True),
+            ).schema
+        column_types = {field.name: pa.string() for field in schema if pa.types.is_temporal(field.type)}
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        include_columns=include,
+        strings_can_be_null=True,
+    )
+    return read_options, convert_options
+
+
+def _arrow_to_pandas(table_or_batch) -> pd.DataFrame:
+    return table_or_batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_csv_arrow(
+    file_path: str,
+    *,
+    encoding: str = 'utf-8',
+    usecols: Optional[List[int]] = None,
+    infer_types: bool = False,
+) -> pd.DataFrame:
+    """
+    Read a whole CSV file with the multi-threaded Arrow reader.
+
+    Columns come back as Arrow-backed strings (string[pyarrow]). With
+    `infer_types`, numeric and boolean columns get numpy dtypes as pandas would
+    infer them, and the other columns stay Arrow-backed strings.
+
+    Raises:
+        pyarrow.ArrowInvalid: If the file is malformed or not valid in `encoding`
+    """
+    read_options, convert_options = _arrow_read_options(
+        file_path, encoding=encoding, usecols=usecols, infer_types=infer_types,
+    )
+    with open_csv_source(file_path) as source:
+        table = pa_csv.read_csv(source, read_options=read_options, convert_options=convert_options)
+    return _columnar_to_pandas(table) if infer_types else _arrow_to_pandas(table)
+
+
+def iter_arrow_csv_chunks(
+    file_path: str,
+    *,
+    encoding: str = 'utf-8',
+    usecols: Optional[List[int]] = None,
+    block_size: int = ARROW_BLOCK_BYTES,
+    max_rows: int = MAX_ROWS,
+    max_memory_mb: Optional[float] = INGEST_MAX_MEMORY_MB,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream a CSV file as Arrow record batches of about `block_size` bytes, converted
+    to pandas one batch at a time and checked against the dataset limits.
+
+    Raises:
+        ValueError: If the row or memory limit is crossed while streaming
+        pyarrow.ArrowInvalid: If the file is malformed or not valid in `encoding`
+    """
+    read_options, convert_options = _arrow_read_options(
+        file_path, encoding=encoding, usecols=usecols, block_size=block_size,
+    )
+    with open_csv_source(file_path) as source:
+        reader = pa_csv.open_csv(source, read_options=read_options, convert_options=convert_options)
+        batches = (_arrow_to_pandas(batch) for batch in reader)
+        yield from limit_chunks(batches, max_rows=max_rows, max_memory_mb=max_memory_mb, stats=stats)
+
+
+def _complete_lines(block: bytes, *, starts_mid_line: bool, at_end_of_file: bool) -> bytes:
+    # Drop the partial line a byte range starts in (unless it starts a line) and the
+    # partial line it is cut off in (unless the range reaches the end of the file).
+    if starts_mid_line:
+        newline = block.find(b'\n')
+        block = block[newline + 1:] if newline >= 0 else b''
+    if not at_end_of_file:
+        newline = block.rfind(b'\n')
+        block = block[:newline + 1] if newline >= 0 else b''
+    return block
+
+
+def _parse_sample_block(block: bytes, header: List[str], encoding: str, strict: bool) -> pd.DataFrame:
+    if not block.strip():
+        return pd.DataFrame(columns=header, dtype=object)
+    text = block.decode(encoding, errors='replace')
+    # Rows from a random offset can start inside a quoted multi-line field; skip
+    # anything that does not tokenise cleanly instead of failing the preview.
+    return pd.read_csv(
+        io.StringIO(text),
+        header=None,
+        names=header,
+        dtype=str,
+        on_bad_lines='error' if strict else 'skip',
+    )
+
+
+def read_csv_sample(
+    file_path: str,
+    *,
+    encoding: str = 'utf-8',
+    head_bytes: int = PREVIEW_HEAD_KB * 1024,
+    sample_count: int = PREVIEW_SAMPLE_COUNT,
+    sample_bytes: int = PREVIEW_SAMPLE_KB * 1024,
+) -> Optional[Tuple[pd.DataFrame, pd.DataFrame, Dict[str, Any]]]:
+    """
+    Read the head of a large CSV file plus `sample_count` random byte ranges behind it,
+    and estimate the row count from the average sampled line length.
+
+    The work is bounded by the sample sizes, not the file size. Offsets are drawn at
+    random within evenly sized strata so the samples cover the whole file.
+
+    Returns:
+        (head rows, head plus sampled rows, estimate) where estimate holds
+        'raw_rows' and 'removed_blank_rows', or None when the file is small enough
+        (or its encoding too wide for byte-level line splitting) to read exactly.
+    """
+    file_size = source_size(file_path)
+    if file_size <= head_bytes + sample_count * sample_bytes:
+        return None
+    if codecs.lookup(encoding).name.startswith(('utf-16', 'utf-32')):
+        return None
+
+    header = read_csv_header(file_path, encoding=encoding)
+    rng = random.Random(file_size)
+    # Offsets only move forward, so this also works on a decompressing stream.
+    with open_source(file_path) as handle:
+        head = handle.read(head_bytes)
+        header_end = head.find(b'\n') + 1
+        if not header_end:
+            return None
+        head_block = _complete_lines(head[header_end:], starts_mid_line=False, at_end_of_file=False)
+        blocks = [head_block]
+
+        body_start = header_end + len(head_block)
+        stratum = (file_size - body_start) // sample_count
+        for index in range(sample_count):
+            offset = body_start + index * stratum + rng.randrange(max(stratum - sample_bytes, 1))
+            handle.seek(offset)
+            block = handle.read(sample_bytes)
+            blocks.append(_complete_lines(
+                block, starts_mid_line=True, at_end_of_file=offset + len(block) >= file_size,
+            ))
+
+    sampled_bytes = sum(len(block) for block in blocks)
+    sampled_lines = sum(block.count(b'\n') for block in blocks)
+    head_df = _parse_sample_block(head_block, header, encoding, strict=True)
+    sample_df = pd.concat(
+        [head_df] + [_parse_sample_block(block, header, encoding, strict=False) for block in blocks[1:]],
+        ignore_index=True,
+    )
+
+    average_line_bytes = sampled_bytes / max(sampled_lines, 1)
+    raw_rows = int(round((file_size - header_end) / average_line_bytes))
+    usable = sample_df.dropna(how='all')
+    blank_rate = 1 - len(usable) / max(len(sample_df), 1)
+    estimate = {
+        'raw_rows': raw_rows,
+        'removed_blank_rows': int(round(raw_rows * blank_rate)),
+        'sampled_rows': len(sample_df),
+        'sampled_bytes': sampled_bytes,
+    }
+    return head_df.dropna(how='all'), usable, estimate
+
+
+def source_format(file_path: str) -> str:
+    """Return 'csv', 'parquet', 'feather', 'xlsx' or 'sql' from the file suffix."""
+    suffix = os.path.splitext(str(file_path))[1].lower()
+    return COLUMNAR_FORMATS.get(suffix) or SPREADSHEET_FORMATS.get(suffix) or SQL_FORMATS.get(suffix, 'csv')
+
+
+def _require_pyarrow(file_format: str) -> None:
+    if pa is None:
+        raise ValueError(f"{file_format.title()} uploads need pyarrow installed on the server. Please upload a CSV file.")
+
+
+def _open_feather(file_path: str):
+    # Memory-mapped, so batches that are skipped or projected away are never read.
+    return pa.ipc.open_file(pa.memory_map(str(file_path), 'r'))
+
+
+def _string_columns_as_arrow(data_type):
+    # Text columns stay Arrow-backed like the Arrow CSV engine; numbers and timestamps
+    # convert to their numpy dtypes so downstream parsing can take its fast paths.
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return pd.ArrowDtype(pa.string())
+    return None
+
+
+def _columnar_to_pandas(table_or_batch) -> pd.DataFrame:
+    return table_or_batch.to_pandas(types_mapper=_string_columns_as_arrow)
+
+
+def _pandas_index_columns(schema) -> List[str]:
+    # Frames saved with to_parquet(index=True) carry their index as a hidden column.
+    pandas_metadata = schema.pandas_metadata or {}
+    return [name for name in pandas_metadata.get('index_columns', []) if isinstance(name, str)]
+
+
+def read_columnar_header(file_path: str) -> List[str]:
+    """Read the column names of a Parquet or Feather file from its schema alone."""
+    file_format = source_format(file_path)
+    _require_pyarrow(file_format)
+    if file_format == 'parquet':
+        schema = pa_parquet.read_schema(file_path)
+    else:
+        schema = _open_feather(file_path).schema
+    return [name for name in schema.names if name not in _pandas_index_columns(schema)]
+
+
+def count_columnar_rows(file_path: str) -> int:
+    """Row count from Parquet footer metadata or Feather batch headers, without reading data."""
+    file_format = source_format(file_path)
+    _require_pyarrow(file_format)
+    if file_format == 'parquet':
+        return pa_parquet.ParquetFile(file_path).metadata.num_rows
+    reader = _open_feather(file_path)
+    return sum(reader.get_batch(index).num_rows for index in range(reader.num_record_batches))
+
+
+def iter_columnar_chunks(
+    file_path: str,
+    *,
+    columns: Optional[List[str]] = None,
+    max_rows: int = MAX_ROWS,
+    max_memory_mb: Optional[float] = INGEST_MAX_MEMORY_MB,
+    stats: Optional[Dict[str, Any]] = None,
+    first_chunk_only: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream a Parquet file one row group at a time, or a Feather file one record batch
+    at a time, reading only `columns`.
+
+    Args:
+        file_path: Path to a .parquet or .feather file
+        columns: Column names to read (all columns if omitted)
+        first_chunk_only: Stop after the first row group or batch (used for previews)
+
+    Raises:
+        ValueError: If the row or memory limit is crossed while streaming
+    """
+    file_format = source_format(file_path)
+    _require_pyarrow(file_format)
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        if file_format == 'parquet':
+            parquet_file = pa_parquet.ParquetFile(file_path)
+            for index in range(parquet_file.num_row_groups):
+                yield _columnar_to_pandas(parquet_file.read_row_group(index, columns=columns))
+                if first_chunk_only:
+                    return
+        else:
+            reader = _open_feather(file_path)
+            for index in range(reader.num_record_batches):
+                batch = reader.get_batch(index)
+                if columns is not None:
+                    batch = batch.select(columns)
+                yield _columnar_to_pandas(batch)
+                if first_chunk_only:
+                    return
+
+    yield from limit_chunks(chunks(), max_rows=max_rows, max_memory_mb=max_memory_mb, stats=stats)
+
+
+@contextmanager
+def open_workbook(file_path: str) -> Iterator[Any]:
+    """Open an .xlsx workbook in read-only mode (cached formula values, not formulas)."""
+    if openpyxl is None:
+        raise ValueError("Excel uploads need openpyxl installed on the server. Please upload a CSV file.")
+    try:
+        # Opening reads each sheet's stored dimensions; sheets written without them
+        # are scanned once to find their size, so callers open a workbook sparingly.
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, openpyxl.utils.exceptions.InvalidFileException) as e:
+        raise ValueError(f"Error reading Excel file: {str(e)}")
+    try:
+        yield workbook
+    finally:
+        # Read-only workbooks keep the archive open until closed
+        workbook.close()
+
+
+def _worksheet(workbook: Any, sheet: Optional[str]) -> Any:
+    # The first worksheet unless one is named; chartsheets have no rows to read
+    if sheet is None:
+        if not workbook.worksheets:
+            raise ValueError("The uploaded workbook has no worksheets")
+        return workbook.worksheets[0]
+    names = [worksheet.title for worksheet in workbook.worksheets]
+    if sheet not in names:
+        raise ValueError(f"Sheet '{sheet}' not found in the workbook. Available sheets: {', '.join(names)}")
+    return workbook[sheet]
+
+
+def _cell_text(value: Any) -> Optional[str]:
+    """Render a cell as the text a CSV export of the sheet would hold."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d') if value.time() == time() else value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _sheet_header(worksheet: Any) -> List[str]:
+    first_row = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+    cells = list(first_row)
+    # Formatted but empty cells to the right of the data are not columns
+    while cells and _cell_text(cells[-1]) is None:
+        cells.pop()
+
+    header: List[str] = []
+    seen: Dict[str, int] = {}
+    for position, value in enumerate(cells):
+        name = _cell_text(value)
+        name = name.strip() if name is not None else f"Unnamed: {position}"
+        # Repeated names get ".1", ".2" like pandas.read_csv
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        header.append(name)
+    return header
+
+
+def read_sheet_header(file_path: str, sheet: Optional[str] = None) -> List[str]:
+    """Column names from the first row of a worksheet (the first sheet by default)."""
+    with open_workbook(file_path) as workbook:
+        header = _sheet_header(_worksheet(workbook, sheet))
+    if not header:
+        raise ValueError("The uploaded file is empty or has no valid data")
+    return header
+
+
+def _sheet_frames(
+    worksheet: Any,
+    usecols: Optional[List[int]],
+    chunk_rows: int,
+    first_chunk_only: bool = False,
+) -> Iterator[pd.DataFrame]:
+    header = _sheet_header(worksheet)
+    if not header:
+        return
+    positions = sorted(usecols) if usecols is not None else list(range(len(header)))
+    names = [header[position] for position in positions]
+    first = positions[0]
+    offsets = [position - first for position in positions]
+    # Bounding the column range makes openpyxl pad short rows and skip cells outside it
+    rows = worksheet.iter_rows(min_row=2, min_col=first + 1, max_col=positions[-1] + 1, values_only=True)
+
+    start = 0
+    batch: List[List[Optional[str]]] = []
+    for row in rows:
+        batch.append([_cell_text(row[offset]) for offset in offsets])
+        if len(batch) == chunk_rows:
+            yield pd.DataFrame(batch, columns=names, index=range(start, start + len(batch)), dtype=object)
+            if first_chunk_only:
+                return
+            start += len(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, columns=names, index=range(start, start + len(batch)), dtype=object)
+
+
+def iter_sheet_chunks(
+    file_path: str,
+    *,
+    sheet: Optional[str] = None,
+    usecols: Optional[List[int]] = None,
+    chunk_rows: int = INGEST_CHUNK_ROWS,
+    max_rows: int = MAX_ROWS,
+    max_memory_mb: Optional[float] = INGEST_MAX_MEMORY_MB,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream a worksheet in chunks of `chunk_rows` rows, reading only `usecols`.
+
+    Rows come from openpyxl's read-only iterator, which parses the sheet XML as it
+    goes, so memory holds one chunk rather than the workbook. Cells are rendered as
+    text (dates as ISO strings) to match the CSV readers.
+
+    Args:
+        file_path: Path to an .xlsx file
+        sheet: Worksheet name (the first worksheet if omitted)
+        usecols: Header positions to read (all columns if omitted)
+
+    Raises:
+        ValueError: If the sheet is missing, or the row or memory limit is crossed
+    """
+    def chunks() -> Iterator[pd.DataFrame]:
+        with open_workbook(file_path) as workbook:
+            yield from _sheet_frames(_worksheet(workbook, sheet), usecols, chunk_rows or INGEST_CHUNK_ROWS)
+
+    yield from limit_chunks(chunks(), max_rows=max_rows, max_memory_mb=max_memory_mb, stats=stats)
+
+
+def read_sheet_sample(
+    file_path: str,
+    sheet: Optional[str] = None,
+    max_rows: int = PREVIEW_SHEET_ROWS,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Read up to `max_rows` rows from the top of a worksheet for the mapping preview,
+    opening the workbook once.
+
+    Returns (frame without blank rows, stats). Besides the row counts, stats holds
+    the workbook's `sheets`, the `sheet_name` read, whether the sheet ended within
+    the sample (`complete`, so the counts are exact) and, otherwise, the data rows
+    the sheet's stored dimensions claim (`dimension_rows`; None when the workbook
+    was written without them, and possibly stale if another tool edited the sheet).
+    """
+    stats: Dict[str, Any] = {}
+    with open_workbook(file_path) as workbook:
+        worksheet = _worksheet(workbook, sheet)
+        frame = concat_chunks(limit_chunks(
+            _sheet_frames(worksheet, None, max_rows + 1, first_chunk_only=True),
+            max_rows=float('inf'), max_memory_mb=None, stats=stats,
+        ))
+        stats['sheets'] = [candidate.title for candidate in workbook.worksheets]
+        stats['sheet_name'] = worksheet.title
+        stats['dimension_rows'] = max(worksheet.max_row - 1, 0) if worksheet.max_row else None
+    stats['complete'] = stats['raw_rows'] <= max_rows
+    return frame.head(max_rows) if len(frame) > max_rows else frame, stats
+
+_SQL_ENGINES: Dict[str, Any] = {}
+
+
+def validate_sql_query(query: str) -> str:
+    """
+    Return a single read-only SELECT (or WITH ... SELECT) without its trailing semicolon.
+
+    Literals, quoted identifiers and comments are blanked out first, then the
+    statement is rejected if it uses SQL_BLOCKED_KEYWORDS or calls any of
+    SQL_BLOCKED_FUNCTIONS. The session the query runs in is read-only as well
+    (see _read_only_connection); this check turns mistakes into clear errors.
+    """
+    statement = (query or '').strip().rstrip(';').strip()
+    for literals in _SQL_LITERAL_PATTERNS:
+        code = literals.sub(' ', statement)
+        # A quoted name can still be called ("pg_sleep"(5)), so calls see the names
+        names = literals.sub(
+            lambda match: f" {re.sub(r'[^a-z0-9_$]', '_', match.group(0)[1:-1], flags=re.IGNORECASE)} "
+            if match.group('quoted') else ' ',
+            statement,
+        )
+        if ';' in code:
+            raise ValueError("SQL sources take a single SELECT statement")
+        words = [word.lower() for word in _SQL_WORD.findall(code)]
+        if not words or words[0] not in {'select', 'with'}:
+            raise ValueError("SQL sources take a SELECT query")
+        blocked = sorted(set(words) & set(SQL_BLOCKED_KEYWORDS))
+        if blocked:
+            raise ValueError(f"SQL sources take a read-only SELECT query; remove {', '.join(blocked).upper()}")
+        blocked = sorted({name.lower() for name in _SQL_CALL.findall(names)} & set(SQL_BLOCKED_FUNCTIONS))
+        if blocked:
+            raise ValueError(f"SQL sources cannot call {', '.join(blocked)}")
+    return statement
+
+
+def sql_sources_for(email: str) -> List[str]:
+    """Names of the configured SQL sources the account with this email may query."""
+    email = (email or '').strip().lower()
+    return sorted(name for name, source in SQL_SOURCES.items() if email in source['users'])
+
+
+def write_sql_source(destination: str, connection: str, query: str) -> None:
+    """Write the descriptor for a query against a configured SQL_SOURCES connection."""
+    if connection not in SQL_SOURCES:
+        raise ValueError(f"Unknown SQL source '{connection}'")
+    with open(destination, 'w', encoding='utf-8') as handle:
+        json.dump({'connection': connection, 'query': validate_sql_query(query)}, handle)
+
+
+def _sql_source(file_path: str) -> Tuple[Any, str]:
+    """Return (engine, query) for a descriptor, reusing one engine per connection."""
+    with open(file_path, encoding='utf-8') as handle:
+        descriptor = json.load(handle)
+    connection = descriptor['connection']
+    if connection not in SQL_SOURCES:
+        raise ValueError(f"SQL source '{connection}' is no longer configured")
+    url = SQL_SOURCES[connection]['url']
+    if url not in _SQL_ENGINES:
+        engine_kwargs: Dict[str, Any] = {'pool_pre_ping': True}
+        if url.lower().startswith('sqlite'):
+            engine_kwargs['connect_args'] = {'check_same_thread': False}
+        engine = sa.create_engine(url, **engine_kwargs)
+        if engine.dialect.name not in SQL_DIALECTS:
+            raise ValueError(f"SQL source '{connection}' uses {engine.dialect.name}; supported: PostgreSQL, MySQL, SQLite")
+        _SQL_ENGINES[url] = engine
+    return _SQL_ENGINES[url], validate_sql_query(descriptor['query'])
+
+
+@contextmanager
+def _read_only_connection(engine) -> Iterator[Any]:
+    """
+    Connection whose transactions cannot write and whose statements are cancelled
+    after SQL_STATEMENT_TIMEOUT_SECONDS.
+
+    The engines only ever serve these reads, so the settings are made per session.
+    SQLite has no statement timeout; a progress handler interrupts the query instead.
+    """
+    timeout = SQL_STATEMENT_TIMEOUT_SECONDS
+    with engine.connect() as connection:
+        driver_connection = connection.connection.driver_connection
+        if engine.dialect.name == 'postgresql':
+            connection.exec_driver_sql("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+            connection.exec_driver_sql(f"SET statement_timeout = {int(timeout * 1000)}")
+        elif engine.dialect.name == 'mysql':
+            if getattr(engine.dialect, 'is_mariadb', False):
+                connection.exec_driver_sql(f"SET SESSION max_statement_time = {int(timeout)}")
+            else:
+                connection.exec_driver_sql(f"SET SESSION max_execution_time = {int(timeout * 1000)}")
+            connection.exec_driver_sql("SET SESSION TRANSACTION READ ONLY")
+        else:
+            connection.exec_driver_sql("PRAGMA query_only = ON")
+            deadline = monotonic() + timeout
+            driver_connection.set_progress_handler(lambda: monotonic() > deadline, 10_000)
+        # End the transaction the settings ran in, so the query starts a read-only one
+        connection.commit()
+        try:
+            yield connection
+        finally:
+            if engine.dialect.name == 'sqlite':
+                driver_connection.set_progress_handler(None, 0)
+
+
+def _wrapped_query(query: str, columns: Optional[List[str]] = None):
+    # The user's query becomes a derived table, so projection, limits and the header
+    # probe are compiled for whichever dialect the connection uses.
+    source = sa.text(f"({query}) AS source_query")
+    selected = [sa.column(name) for name in columns] if columns is not None else [sa.text('*')]
+    return sa.select(*selected).select_from(source)
+
+
+def read_sql_header(file_path: str) -> List[str]:
+    """Column names of a SQL source, from a probe that returns no rows."""
+    engine, query = _sql_source(file_path)
+    try:
+        with _read_only_connection(engine) as connection:
+            return list(connection.execute(_wrapped_query(query).where(sa.false())).keys())
+    except SQLAlchemyError as e:
+        raise ValueError(f"Error reading SQL source: {getattr(e, 'orig', None) or e}")
+
+
+def iter_sql_chunks(
+    file_path: str,
+    *,
+    usecols: Optional[List[int]] = None,
+    batch_rows: int = SQL_BATCH_ROWS,
+    limit: Optional[int] = None,
+    max_rows: int = MAX_ROWS,
+    max_memory_mb: Optional[float] = INGEST_MAX_MEMORY_MB,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream the rows of a SQL source in batches of `batch_rows`, selecting only `usecols`.
+
+    The query runs with a server-side cursor (stream_results), so the driver holds one
+    batch at a time rather than the whole result. Values keep the types the cursor
+    returns: numbers and DECIMALs arrive as floats and DATETIME columns as
+    timestamps, so there is no text parsing; text columns stay text.
+
+    Args:
+        file_path: Path to a .sqlquery descriptor (see write_sql_source)
+        usecols: Header positions to select (all columns if omitted)
+        limit: Stop after this many rows, applied in the query (used for previews)
+
+    Raises:
+        ValueError: If the query fails, or the row or memory limit is crossed
+    """
+    engine, query = _sql_source(file_path)
+    columns = None
+    if usecols is not None:
+        header = read_sql_header(file_path)
+        columns = [header[position] for position in sorted(usecols)]
+    statement = _wrapped_query(query, columns)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    def chunks() -> Iterator[pd.DataFrame]:
+        try:
+            with _read_only_connection(engine) as connection:
+                result = connection.execution_options(stream_results=True, max_row_buffer=batch_rows).execute(statement)
+                names = list(result.keys())
+                start = 0
+                for partition in result.partitions(batch_rows):
+                    frame = pd.DataFrame.from_records(partition, columns=names, coerce_float=True)
+                    frame.index = range(start, start + len(frame))
+                    start += len(frame)
+                    yield frame
+        except SQLAlchemyError as e:
+            raise ValueError(f"Error reading SQL source: {getattr(e, 'orig', None) or e}")
+
+    yield from limit_chunks(chunks(), max_rows=max_rows, max_memory_mb=max_memory_mb, stats=stats)
+
+
+def concat_chunks(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Combine streamed chunks into one frame, keeping the original row index."""
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks)
@@ -19,8 +19,11 @@ import numpy as np
 import logging
 import joblib
 
-from .preprocessing import preprocess_transaction_data, get_csv_preview
-from .rfm import compute_rfm, normalize_rfm, get_rfm_statistics, get_rfm_distributions
+from .eda import EDAAccumulator
+from .preprocessing import cached_preprocess_transaction_data, get_csv_preview
+from .quantiles import QuantileSummary, column_quantiles
+from .rfm import RFM_COLUMNS, compute_customer_features, normalize_rfm, get_rfm_statistics, get_rfm_distributions
+from .rfm_state import RFMState, tenant_state_lock
 from .clustering import run_clustering, run_comparison
 from .segmentation import SEGMENT_DEFINITIONS, analyze_clusters, get_cluster_sizes, get_segment_summary
 from ..config import MODELS_DIR, OPTIMAL_K_SUBSAMPLE, SHAP_MAX_SAMPLES, CHART_DPI
@@ -55,9 +58,15 @@ class SegmentationPipeline:
         column_mapping: Optional[Dict[str, str]] = None,
         clustering_method: str = 'kmeans',
         include_comparison: bool = False,
-        progress_callback: Optional[Callable[[int, str, str], None]] = None
+        progress_callback: Optional[Callable[[int, str, str], None]] = None,
+        content_digest: Optional[str] = None,
+        rfm_state_path: Optional[str] = None,
     ):
         self.file_path      = file_path
+        self.content_digest = content_digest  # SHA-256 taken while the upload streamed in
+        # Incremental jobs fold this upload into the tenant's stored RFM state and
+        # segment every customer on record (see rfm_state.RFMState)
+        self.rfm_state_path = rfm_state_path
         self.output_dir     = Path(output_dir)
         self.job_id         = job_id
         self.column_mapping = column_mapping
@@ -72,6 +81,12 @@ class SegmentationPipeline:
         self.results  = {}
         self.df       = None
         self.rfm      = None
+        # Per-customer features from one pass over self.df (see
+        # compute_customer_features), and each transaction row's position in them
+        self.customer_features = None
+        self.customer_rows     = None
+        # Quantile summary per RFM metric, shared by the statistics and segment steps
+        self.rfm_quantiles     = None
         self.labels   = None
         self.segments = None
         self.model_artifacts = self._load_model_artifacts()
@@ -88,24 +103,44 @@ class SegmentationPipeline:
             # 1. Preprocess
             self._emit_progress(12, 'validating', 'Validating your file structure and preparing mapped columns.')
             logger.info("Step 1: Preprocessing data...")
-            self.df, preprocessing_meta = preprocess_transaction_data(
-                self.file_path, self.column_mapping
+            self.df, preprocessing_meta = cached_preprocess_transaction_data(
+                self.file_path, self.column_mapping, content_digest=self.content_digest
             )
             preprocessing_meta['business_type'] = self._infer_business_type(self.df)
             preprocessing_meta['eda'] = self._build_eda_summary(self.df, preprocessing_meta)
             self.results['preprocessing'] = preprocessing_meta
 
-            # 2. Outlier treatment (IQR Winsorization on the amount column)
-            self._emit_progress(22, 'cleaning', 'Cleaning transaction values and reducing the effect of outliers.')
-            logger.info("Step 2: Outlier treatment...")
-            self.df, outlier_meta = self._winsorise(self.df)
-            self.results['outlier_treatment'] = outlier_meta
+            if self.rfm_state_path:
+                self._check_incremental_upload(preprocessing_meta)
+                # Fold the raw upload into the stored history. Winsorising first would
+                # store spend capped by this upload's own bounds, and would change the
+                # amount-based fingerprints of rows without invoices between uploads.
+                with tenant_state_lock(self.rfm_state_path):
+                    state = RFMState.load(self.rfm_state_path)
+                    ingested = state.update(self.df)
+                    state.save(self.rfm_state_path)
+
+            # 2. Outlier treatment (IQR Winsorization on the amount column). Incremental
+            # jobs cap each customer's stored spend in step 3 instead.
+            if not self.rfm_state_path:
+                self._emit_progress(22, 'cleaning', 'Cleaning transaction values and reducing the effect of outliers.')
+                logger.info("Step 2: Outlier treatment...")
+                self.df, outlier_meta = self._winsorise(self.df)
+                self.results['outlier_treatment'] = outlier_meta
 
             # 3. RFM
             self._emit_progress(34, 'rfm', 'Computing recency, frequency, and monetary features for each customer.')
             logger.info("Step 3: Computing RFM metrics...")
-            self.rfm = compute_rfm(self.df)
-            self.results['rfm_statistics']   = get_rfm_statistics(self.rfm)
+            if self.rfm_state_path:
+                self.results['rfm_state'] = {**ingested, 'customers': len(state), 'transactions': len(state.fingerprints)}
+                self.customer_features, outlier_meta = self._winsorise(state.features(), col='monetary')
+                self.results['outlier_treatment'] = outlier_meta
+                self.customer_rows = state.row_positions(self.df)
+            else:
+                self.customer_features, self.customer_rows = compute_customer_features(self.df)
+            self.rfm = self.customer_features[RFM_COLUMNS]
+            self.rfm_quantiles = column_quantiles(self.rfm)
+            self.results['rfm_statistics']   = get_rfm_statistics(self.rfm, quantiles=self.rfm_quantiles)
             self.results['rfm_distributions'] = get_rfm_distributions(self.rfm)
 
             # 4. Normalise
@@ -144,7 +179,7 @@ class SegmentationPipeline:
             # 8. Segmentation
             self._emit_progress(82, 'segmenting', 'Building segment profiles and generating recommended actions.')
             logger.info("Step 8: Analysing segments...")
-            self.segments = analyze_clusters(self.rfm, self.labels)
+            self.segments = analyze_clusters(self.rfm, self.labels, quantiles=self.rfm_quantiles)
             self._apply_artifact_segment_labels()
             self._disambiguate_segment_names()
             self.results['segments']        = self.segments
@@ -171,6 +206,14 @@ class SegmentationPipeline:
             self.results['charts'] = chart_paths
 
             end_time = datetime.utcnow()
+            # Incremental jobs report customers, transactions and revenue across the
+            # stored history, not just this upload; revenue is capped like in normal jobs
+            if self.rfm_state_path:
+                num_transactions = len(state.fingerprints)
+                total_revenue = self.rfm['monetary'].sum()
+            else:
+                num_transactions = len(self.df)
+                total_revenue = self.df['amount'].astype(np.float64).sum()
             self.results['meta'] = {
                 'job_id':            self.job_id,
                 'status':            'completed',
@@ -178,8 +221,12 @@ class SegmentationPipeline:
                 'end_time':          end_time.isoformat(),
                 'duration_seconds':  (end_time - start_time).total_seconds(),
                 'num_customers':     len(self.rfm),
-                'num_transactions':  len(self.df),
-                'total_revenue':     float(self.df['amount'].sum()),
+                'num_transactions':  num_transactions,
+                # The EDA summary and the per-segment row mix (discounts, promos,
+                # top products) describe the rows of this upload only
+                'upload_transactions': len(self.df),
+                'scope':             'history' if self.rfm_state_path else 'upload',
+                'total_revenue':     float(total_revenue),
                 'num_clusters':      int(clustering_info['n_clusters']),
                 'silhouette_score':  float(clustering_info.get('silhouette_score', 0)),
                 'clustering_method': self.chosen_algorithm,
@@ -270,36 +317,7 @@ class SegmentationPipeline:
         return 'General Retail'
 
     def _build_eda_summary(self, df: pd.DataFrame, preprocessing_meta: Dict[str, Any]) -> Dict[str, Any]:
-        summary = {
-            'rows': int(len(df)),
-            'columns': int(len(df.columns)),
-            'duplicates': int(df.duplicated().sum()),
-            'missing_values': int(df.isna().sum().sum()),
-            'numeric_summary': {},
-            'top_categories': [],
-            'top_products': [],
-            'top_payments': [],
-        }
-
-        for col in ['amount', 'qty', 'price', 'discount']:
-            if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
-                series = pd.to_numeric(df[col], errors='coerce').dropna()
-                if not series.empty:
-                    summary['numeric_summary'][col] = {
-                        'mean': float(series.mean()),
-                        'median': float(series.median()),
-                        'std': float(series.std()) if len(series) > 1 else 0.0,
-                        'min': float(series.min()),
-                        'max': float(series.max()),
-                    }
-
-        for src, key in [('category', 'top_categories'), ('product', 'top_products'), ('payment', 'top_payments')]:
-            if src in df.columns:
-                summary[key] = [
-                    {'label': str(label), 'count': int(count)}
-                    for label, count in df[src].astype(str).value_counts().head(10).items()
-                ]
-
+        summary = EDAAccumulator().add(df).summary()
         summary['warnings'] = preprocessing_meta.get('warnings', [])
         return summary
 
@@ -426,24 +444,51 @@ class SegmentationPipeline:
 
     # ── Step implementations ───────────────────────────────────────────────────
 
-    def _winsorise(self, df: pd.DataFrame) -> tuple:
+    def _check_incremental_upload(self, preprocessing_meta: Dict[str, Any]) -> None:
+        """
+        Refuse to fold an upload with synthesised customer IDs or invoice dates
+        into the stored history. Synthetic IDs are row numbers, so unrelated
+        people from different uploads would merge into one customer; synthetic
+        dates count back from today, so re-sending a file would count it again.
         """
-        IQR Winsorization on the amount column.
+        summary = preprocessing_meta.get('summary', {})
+        missing = [
+            label for key, label in (
+                ('synthesised_customer_id', 'customer ID'),
+                ('synthesised_invoice_date', 'invoice date'),
+            ) if summary.get(key)
+        ]
+        if missing:
+            raise ValueError(
+                f"Incremental analysis needs a mapped {' and '.join(missing)} column: synthesised "
+                f"values cannot be matched across uploads. Map the column or run a one-off analysis."
+            )
+
+    def _winsorise(self, df: pd.DataFrame, col: str = 'amount') -> tuple:
+        """
+        IQR Winsorization on one column: transaction amounts, or the customers'
+        monetary totals for incremental jobs (whose stored spend stays uncapped).
         Caps outliers at [Q1 - 1.5*IQR, Q3 + 1.5*IQR] instead of removing them.
+        The pipeline owns `df` (it came straight from preprocessing or the state),
+        so the capped column replaces the original in place rather than copying
+        the frame.
         """
-        df = df.copy()
-        col = 'amount'
+        # Compact frames may store amounts as float32; cap on float64 values so the
+        # bounds are not rounded.
+        compact = df[col].dtype == np.float32
+        values = df[col].astype(np.float64) if compact else df[col]
 
-        q1  = df[col].quantile(0.25)
-        q3  = df[col].quantile(0.75)
+        q1, q3 = QuantileSummary.of(values).quantile([0.25, 0.75])
         iqr = q3 - q1
         lower = q1 - 1.5 * iqr
         upper = q3 + 1.5 * iqr
 
-        n_below = (df[col] < lower).sum()
-        n_above = (df[col] > upper).sum()
+        n_below = (values < lower).sum()
+        n_above = (values > upper).sum()
 
-        df[col] = df[col].clip(lower=lower, upper=upper)
+        # Uncapped float32 amounts are left compact
+        if n_below or n_above or not compact:
+            df[col] = values.clip(lower=lower, upper=upper)
 
         meta = {
             'column':       col,
@@ -858,13 +903,13 @@ class SegmentationPipeline:
             output['monetary'].astype(float) * np.maximum(output['frequency'].astype(float), 1.0)
         ).round(2)
 
-        customer_dates = self._build_customer_dates()
-        if not customer_dates.empty:
-            output = output.merge(customer_dates, on='customer_id', how='left')
-        else:
-            output['last_purchase_date'] = pd.NaT
-            output['first_purchase_date'] = pd.NaT
-            output['customer_tenure_days'] = None
+        # Rows line up with self.rfm, which was taken from the customer features
+        features = self.customer_features
+        output['first_purchase_date'] = features['first_purchase_date']
+        output['last_purchase_date'] = features['last_purchase_date']
+        output['customer_tenure_days'] = features['tenure_days']
+        output['avg_order_value_ghs'] = features['avg_order_value'].round(2)
+        output['avg_days_between_purchases'] = features['avg_interpurchase_days'].round(1)
 
         output = output.rename(columns={
             'recency': 'recency_days',
@@ -880,27 +925,6 @@ class SegmentationPipeline:
             return 'Medium'
         return 'Low'
 
-    def _build_customer_dates(self) -> pd.DataFrame:
-        if self.df is None or self.df.empty:
-            return pd.DataFrame()
-
-        try:
-            grouped = (
-                self.df.groupby('customer_id')
-                .agg(
-                    first_purchase_date=('invoice_date', 'min'),
-                    last_purchase_date=('invoice_date', 'max')
-                )
-                .reset_index()
-            )
-            grouped['customer_tenure_days'] = (
-                pd.to_datetime(grouped['last_purchase_date']) - pd.to_datetime(grouped['first_purchase_date'])
-            ).dt.days.clip(lower=0)
-            return grouped
-        except Exception as exc:
-            logger.warning("Could not build customer lifecycle dates for job %s: %s", self.job_id, exc)
-            return pd.DataFrame()
-
     def _save_outputs(self, customer_output: pd.DataFrame):
         # Customers CSV
         customer_csv_path = self.output_dir / f"{self.job_id}_customers.csv"
@@ -958,6 +982,8 @@ class SegmentationPipeline:
                 'first_purchase_date': row['first_purchase_date'].isoformat() if pd.notna(row.get('first_purchase_date')) else None,
                 'last_purchase_date': row['last_purchase_date'].isoformat() if pd.notna(row.get('last_purchase_date')) else None,
                 'customer_tenure_days': int(row.get('customer_tenure_days', 0) or 0),
+                'avg_order_value': float(row.get('avg_order_value_ghs', 0) or 0),
+                'avg_days_between_purchases': float(row['avg_days_between_purchases']) if pd.notna(row.get('avg_days_between_purchases')) else None,
                 'status': row.get('status', 'Active'),
             })
         return rows
@@ -1045,7 +1071,9 @@ def run_pipeline(
     column_mapping: Optional[Dict[str, str]] = None,
     clustering_method: str = 'kmeans',
     include_comparison: bool = True,
-    progress_callback: Optional[Callable[[int, str, str], None]] = None
+    progress_callback: Optional[Callable[[int, str, str], None]] = None,
+    content_digest: Optional[str] = None,
+    rfm_state_path: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     Convenience function to run the segmentation pipeline.
@@ -1058,6 +1086,8 @@ def run_pipeline(
         column_mapping=column_mapping,
         clustering_method=clustering_method,
         include_comparison=include_comparison,
-        progress_callback=progress_callback
+        progress_callback=progress_callback,
+        content_digest=content_digest,
+        rfm_state_path=rfm_state_path,
     )
     return pipeline.run()
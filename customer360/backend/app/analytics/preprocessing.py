@@ -8,10 +8,70 @@ RFM and clustering stages can safely use.
 """
 import pandas as pd
 import numpy as np
-from typing import Tuple, List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import hashlib
+import json
 import logging
-
-from ..config import MAX_ROWS
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2 only exposes it privately
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from ..config import (
+    INGEST_CHUNK_ROWS,
+    INGEST_MAX_MEMORY_MB,
+    MAX_ROWS,
+    PREVIEW_SHEET_ROWS,
+    PREPROCESS_TRACE_ALLOCATIONS,
+    PROFILE_EXACT_DISTINCT_ROWS,
+    PROFILE_WORKERS,
+)
+from .cache import FrameCache, cache_key, file_digest
+from .ingestion import (
+    ARROW_ERRORS,
+    compression_of,
+    concat_chunks,
+    count_columnar_rows,
+    detect_encoding,
+    fallback_encodings,
+    is_arrow_decode_error,
+    iter_arrow_csv_chunks,
+    iter_columnar_chunks,
+    iter_csv_chunks,
+    iter_sheet_chunks,
+    iter_sql_chunks,
+    open_csv_source,
+    read_columnar_header,
+    read_csv_arrow,
+    read_csv_header,
+    read_csv_sample,
+    read_sheet_header,
+    read_sheet_sample,
+    read_sql_header,
+    resolve_reader_engine,
+    source_format,
+)
+from .sketches import HyperLogLog, hash_values
 
 logger = logging.getLogger(__name__)
 
@@ -35,36 +95,263 @@ DATE_FORMATS = [
     "%B %d, %Y",
 ]
 
+# Non-null values used to pick a date format before the single full-column parse.
+DATE_SAMPLE_SIZE = 1000
+
+# Read dtypes for mapped source columns. Everything stays text: IDs keep leading
+# zeros, and dates and amounts are parsed later by the locale-aware helpers below.
+FIELD_READ_DTYPES: Dict[str, Any] = {
+    'customer_id': str,
+    'invoice_date': str,
+    'invoice_id': str,
+    'amount': str,
+    'quantity': str,
+    'unit_price': str,
+    'product': str,
+    'category': str,
+}
+
+
+def _read_csv_rows(
+    file_path: str,
+    *,
+    engine: str,
+    encoding: str,
+    chunksize: Optional[int],
+    max_memory_mb: Optional[float],
+    usecols: Optional[List[int]],
+    dtype: Optional[Dict[str, Any]],
+) -> Tuple[pd.DataFrame, int]:
+    """Read the rows of a CSV file with one engine. Returns (frame without blank rows, raw row count)."""
+    if engine == 'pyarrow':
+        if chunksize:
+            stats: Dict[str, Any] = {}
+            df = concat_chunks(iter_arrow_csv_chunks(
+                file_path,
+                encoding=encoding,
+                usecols=usecols,
+                max_memory_mb=max_memory_mb or INGEST_MAX_MEMORY_MB,
+                stats=stats,
+            ))
+            return df, stats['raw_rows']
+        # A full, unprojected read infers numbers like the pandas engine does
+        unprojected = usecols is None and dtype is None
+        df = read_csv_arrow(file_path, encoding=encoding, usecols=usecols, infer_types=unprojected)
+        return df.dropna(how='all'), len(df)
+
+    read_kwargs: Dict[str, Any] = {}
+    if usecols is not None:
+        read_kwargs['usecols'] = usecols
+    if dtype is not None:
+        read_kwargs['dtype'] = dtype
+
+    if chunksize:
+        stats = {}
+        df = concat_chunks(iter_csv_chunks(
+            file_path,
+            encoding=encoding,
+            chunksize=chunksize,
+            max_memory_mb=max_memory_mb or INGEST_MAX_MEMORY_MB,
+            stats=stats,
+            **read_kwargs,
+        ))
+        return df, stats['raw_rows']
+    with open_csv_source(file_path) as source:
+        df = pd.read_csv(source, encoding=encoding, low_memory=False, **read_kwargs)
+    return df.dropna(how='all'), len(df)
+
+
+def _load_columnar(
+    file_path: str,
+    usecols: Optional[List[int]] = None,
+    max_memory_mb: Optional[float] = None,
+) -> pd.DataFrame:
+    """Load a Parquet or Feather upload row group by row group, reading only `usecols`."""
+    try:
+        columns = None
+        if usecols is not None:
+            header = read_columnar_header(file_path)
+            columns = [header[position] for position in usecols]
+        stats: Dict[str, Any] = {}
+        df = concat_chunks(iter_columnar_chunks(
+            file_path,
+            columns=columns,
+            max_memory_mb=max_memory_mb or INGEST_MAX_MEMORY_MB,
+            stats=stats,
+        ))
+    except ARROW_ERRORS as e:
+        raise ValueError(f"Error reading {source_format(file_path).title()} file: {str(e)}")
+
+    if df.empty:
+        raise ValueError("The uploaded file is empty")
+
+    df.attrs['raw_rows'] = stats['raw_rows']
+    df.attrs['removed_blank_rows'] = stats['removed_blank_rows']
+    df.attrs['encoding'] = None
+    df.attrs['parse_attempts'] = 1
+    df.attrs['reader_engine'] = 'pyarrow'
+    df.attrs['source_format'] = source_format(file_path)
+    logger.info(f"Loaded {df.attrs['source_format']} file with {len(df):,} usable rows and {len(df.columns)} columns")
+    return df
+
+
+def _load_spreadsheet(
+    file_path: str,
+    sheet: Optional[str] = None,
+    usecols: Optional[List[int]] = None,
+    max_memory_mb: Optional[float] = None,
+) -> pd.DataFrame:
+    """Load one worksheet of an .xlsx upload in streamed chunks, reading only `usecols`."""
+    stats: Dict[str, Any] = {}
+    df = concat_chunks(iter_sheet_chunks(
+        file_path,
+        sheet=sheet,
+        usecols=usecols,
+        max_memory_mb=max_memory_mb or INGEST_MAX_MEMORY_MB,
+        stats=stats,
+    ))
+
+    if df.empty:
+        raise ValueError("The uploaded file is empty")
+
+    df.attrs['raw_rows'] = stats['raw_rows']
+    df.attrs['removed_blank_rows'] = stats['removed_blank_rows']
+    df.attrs['encoding'] = None
+    df.attrs['parse_attempts'] = 1
+    df.attrs['reader_engine'] = 'openpyxl'
+    df.attrs['source_format'] = 'xlsx'
+    df.attrs['sheet_name'] = sheet
+    logger.info(f"Loaded xlsx sheet with {len(df):,} usable rows and {len(df.columns)} columns")
+    return df
+
+
+def _load_sql(
+    file_path: str,
+    usecols: Optional[List[int]] = None,
+    max_memory_mb: Optional[float] = None,
+) -> pd.DataFrame:
+    """Load a SQL source through a server-side cursor, selecting only `usecols`."""
+    stats: Dict[str, Any] = {}
+    df = concat_chunks(iter_sql_chunks(
+        file_path,
+        usecols=usecols,
+        max_memory_mb=max_memory_mb or INGEST_MAX_MEMORY_MB,
+        stats=stats,
+    ))
+
+    if df.empty:
+        raise ValueError("The SQL query returned no rows")
+
+    df.attrs['raw_rows'] = stats['raw_rows']
+    df.attrs['removed_blank_rows'] = stats['removed_blank_rows']
+    df.attrs['encoding'] = None
+    df.attrs['parse_attempts'] = 1
+    df.attrs['reader_engine'] = 'sqlalchemy'
+    df.attrs['source_format'] = 'sql'
+    logger.info(f"Loaded SQL source with {len(df):,} usable rows and {len(df.columns)} columns")
+    return df
+
 
-def load_csv(file_path: str) -> pd.DataFrame:
+def load_csv(
+    file_path: str,
+    chunksize: Optional[int] = None,
+    max_memory_mb: Optional[float] = None,
+    usecols: Optional[List[int]] = None,
+    dtype: Optional[Dict[str, Any]] = None,
+    encoding: Optional[str] = None,
+    engine: Optional[str] = None,
+    sheet: Optional[str] = None,
+) -> pd.DataFrame:
     """
     Load a CSV file into a pandas DataFrame.
 
+    Parquet and Feather uploads (by file suffix) are read through Arrow instead,
+    honouring `usecols` and the dataset limits; the CSV-only options are ignored.
+    Excel (.xlsx) uploads stream one worksheet row by row, always in chunks, and
+    SQL sources (.sqlquery descriptors) stream their query's rows in cursor batches.
+
     Args:
         file_path: Path to the CSV file
+        chunksize: When set, stream the file in chunks of this many rows and enforce
+            the row and memory limits per chunk instead of after a full read. The
+            Arrow engine streams in ARROW_BLOCK_BYTES batches instead of row counts.
+        max_memory_mb: Memory ceiling for a streamed load (default INGEST_MAX_MEMORY_MB)
+        usecols: Header positions to parse; other columns are skipped by the tokenizer
+        dtype: Per-column read dtypes for the pandas engine, keyed by header name.
+            The Arrow engine reads text as string[pyarrow]; a whole-file read with
+            neither `usecols` nor `dtype` infers numeric columns like pandas.
+        encoding: Known encoding of the file; sniffed from its bytes if omitted
+        engine: 'pyarrow' or 'pandas' (default CSV_READER_ENGINE). Falls back to
+            pandas if pyarrow is missing or rejects the file.
+        sheet: Worksheet of an .xlsx upload (the first worksheet if omitted)
 
     Returns:
         DataFrame containing the CSV data
 
     Raises:
-        ValueError: If file cannot be loaded or is empty
+        ValueError: If file cannot be loaded, is empty, or exceeds the dataset limits
     """
+    if source_format(file_path) == 'xlsx':
+        return _load_spreadsheet(file_path, sheet=sheet, usecols=usecols, max_memory_mb=max_memory_mb)
+    if source_format(file_path) == 'sql':
+        return _load_sql(file_path, usecols=usecols, max_memory_mb=max_memory_mb)
+    if source_format(file_path) != 'csv':
+        return _load_columnar(file_path, usecols=usecols, max_memory_mb=max_memory_mb)
+
+    engine = resolve_reader_engine(engine)
     try:
-        # Try reading with different encodings
-        for encoding in ['utf-8', 'latin-1', 'cp1252']:
+        # Sniff the encoding from a sample of bytes so the file is normally parsed once.
+        # The fallbacks only run if a byte the sampler missed cannot be decoded.
+        parse_attempts = 0
+        for encoding in fallback_encodings(encoding or detect_encoding(file_path)):
+            parse_attempts += 1
             try:
-                df = pd.read_csv(file_path, encoding=encoding, low_memory=False)
+                df, raw_rows = _read_csv_rows(
+                    file_path,
+                    engine=engine,
+                    encoding=encoding,
+                    chunksize=chunksize,
+                    max_memory_mb=max_memory_mb,
+                    usecols=usecols,
+                    dtype=dtype,
+                )
                 break
             except UnicodeDecodeError:
+                logger.warning(f"Could not decode file as {encoding}; retrying with the next encoding")
                 continue
+            except ARROW_ERRORS as e:
+                if is_arrow_decode_error(e):
+                    logger.warning(f"Could not decode file as {encoding}; retrying with the next encoding")
+                    continue
+                # Arrow rejects ragged rows that pandas pads with NaN; let pandas try.
+                logger.warning(f"Arrow CSV reader failed ({e}); falling back to the pandas reader")
+                engine = 'pandas'
+                try:
+                    df, raw_rows = _read_csv_rows(
+                        file_path,
+                        engine=engine,
+                        encoding=encoding,
+                        chunksize=chunksize,
+                        max_memory_mb=max_memory_mb,
+                        usecols=usecols,
+                        dtype=dtype,
+                    )
+                except UnicodeDecodeError:
+                    # Later encodings are tried with the pandas reader
+                    logger.warning(f"Could not decode file as {encoding}; retrying with the next encoding")
+                    continue
+                break
         else:
             raise ValueError("Could not decode file with any standard encoding")
 
-        raw_rows = len(df)
-        df = df.dropna(how='all')
         removed_blank_rows = raw_rows - len(df)
         df.attrs['raw_rows'] = raw_rows
         df.attrs['removed_blank_rows'] = removed_blank_rows
+        df.attrs['encoding'] = encoding
+        df.attrs['parse_attempts'] = parse_attempts
+        df.attrs['reader_engine'] = engine
+        df.attrs['source_format'] = 'csv'
+        df.attrs['compression'] = compression_of(file_path)
 
         if df.empty:
             raise ValueError("The uploaded file is empty")
@@ -78,7 +365,7 @@ def load_csv(file_path: str) -> pd.DataFrame:
         if removed_blank_rows:
             logger.info(f"Removed {removed_blank_rows:,} fully blank rows before validation")
 
-        logger.info(f"Loaded CSV with {len(df):,} usable rows and {len(df.columns)} columns")
+        logger.info(f"Loaded CSV with {len(df):,} usable rows and {len(df.columns)} columns ({engine} reader)")
         return df
 
     except pd.errors.EmptyDataError:
@@ -87,19 +374,111 @@ def load_csv(file_path: str) -> pd.DataFrame:
         raise ValueError(f"Error parsing CSV file: {str(e)}")
 
 
-def suggest_column_mapping(df: pd.DataFrame) -> Dict[str, Optional[str]]:
+def read_columns(file_path: str, encoding: Optional[str] = None, sheet: Optional[str] = None) -> List[str]:
+    """
+    Read only the header of a CSV file or worksheet, the schema of a Parquet/Feather
+    file, or the result columns of a SQL source.
+
+    Args:
+        file_path: Path to the upload
+        encoding: Known encoding of a CSV file; sniffed from its bytes if omitted
+        sheet: Worksheet of an .xlsx upload (the first worksheet if omitted)
+
+    Returns:
+        Column names in file order
+
+    Raises:
+        ValueError: If the file is empty or cannot be decoded
+    """
+    if source_format(file_path) == 'xlsx':
+        return read_sheet_header(file_path, sheet)
+    if source_format(file_path) == 'sql':
+        return read_sql_header(file_path)
+    if source_format(file_path) != 'csv':
+        try:
+            return read_columnar_header(file_path)
+        except ARROW_ERRORS as e:
+            raise ValueError(f"Error reading {source_format(file_path).title()} file: {str(e)}")
+
+    try:
+        for candidate in fallback_encodings(encoding or detect_encoding(file_path)):
+            try:
+                return read_csv_header(file_path, encoding=candidate)
+            except UnicodeDecodeError:
+                continue
+        raise ValueError("Could not decode file with any standard encoding")
+    except pd.errors.EmptyDataError:
+        raise ValueError("The uploaded file is empty or has no valid data")
+    except pd.errors.ParserError as e:
+        raise ValueError(f"Error parsing CSV file: {str(e)}")
+
+
+def _normalise_header(column: Any) -> str:
+    return ' '.join(str(column).split()).lower()
+
+
+def header_signature(columns: List[Any]) -> str:
+    """
+    Fingerprint of a file layout: SHA-256 of its column names in order, compared
+    case-insensitively and ignoring surrounding and repeated whitespace.
+    """
+    normalised = [_normalise_header(column) for column in columns]
+    return hashlib.sha256(json.dumps(normalised).encode('utf-8')).hexdigest()
+
+
+def remap_to_header(mapping: Dict[str, Any], columns: List[Any]) -> Dict[str, Any]:
+    """
+    Point a mapping remembered for a layout at this file's spelling of its columns.
+
+    Layouts match by header_signature, so a re-export may write 'Customer ID' as
+    'customer id '. A name the file has verbatim is kept; any other is replaced by
+    the first column it normalises to. Names without a match are kept.
+    """
+    by_name: Dict[str, Any] = {}
+    for column in columns:
+        by_name.setdefault(_normalise_header(column), column)
+    return {
+        field: name if not name or name in columns else by_name.get(_normalise_header(name), name)
+        for field, name in mapping.items()
+    }
+
+
+def _projected_read_options(
+    columns: List[str],
+    field_mapping: Dict[str, str],
+) -> Tuple[Optional[List[int]], Optional[Dict[str, Any]]]:
+    """
+    Work out which header positions a mapping needs and the dtype to read each with.
+
+    Returns (None, None) when none of the mapped columns exist, so the full file is
+    read and validate_and_map_columns reports the missing columns as before.
+    """
+    positions: Dict[int, Any] = {}
+    for field, source_column in field_mapping.items():
+        if source_column in columns:
+            positions.setdefault(columns.index(source_column), FIELD_READ_DTYPES.get(field, str))
+
+    if not positions:
+        return None, None
+
+    usecols = sorted(positions)
+    dtype = {columns[position]: positions[position] for position in usecols}
+    return usecols, dtype
+
+
+def suggest_column_mapping(df: Union[pd.DataFrame, List[str]]) -> Dict[str, Optional[str]]:
     """
     Attempt to automatically map CSV columns to required fields.
     Uses common column name patterns to suggest mappings.
 
     Args:
-        df: DataFrame to analyze
+        df: DataFrame to analyze, or just its column names
 
     Returns:
         Dictionary with suggested mappings for each required field
     """
-    columns = [col.lower().strip() for col in df.columns]
-    original_columns = list(df.columns)
+    original_columns = list(df.columns) if isinstance(df, pd.DataFrame) else list(df)
+    columns = [str(col).lower().strip() for col in original_columns]
 
     mapping = {
         'customer_id': None,
@@ -144,8 +523,26 @@ def suggest_column_mapping(df: pd.DataFrame) -> Dict[str, Optional[str]]:
     return mapping
 
 
-def _guess_column_type(series: pd.Series) -> Dict[str, Any]:
-    sample = series.dropna().astype(str).head(100)
+# Share of the type-guess sample a date format must parse for the column to count as a date.
+DATE_TYPE_CONFIDENCE = 0.8
+_DATE_SHAPE_RE = r"\d\D+\d"
+
+
+def _swap_day_month(date_format: str) -> str:
+    return date_format.replace('%d', '\0').replace('%m', '%d').replace('\0', '%m')
+
+
+def _guess_column_type(series: pd.Series, unique_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Guess a column's type from its first 100 non-null values.
+
+    Date formats are tried in DATE_FORMATS order and the search stops at the first
+    one reaching DATE_TYPE_CONFIDENCE, after also trying its day/month swap so
+    ambiguous columns still offer both readings. The search is skipped outright
+    for numeric columns and when too few values could be dates at all: every
+    DATE_FORMATS entry needs two separate runs of digits, which codes and names lack.
+    """
+    sample = series.dropna().head(100).astype(str)
     if sample.empty:
         return {"detected_type": "empty", "confidence": 0.0, "date_formats": []}
 
@@ -158,14 +555,23 @@ def _guess_column_type(series: pd.Series) -> Dict[str, Any]:
 
     date_formats = []
     best_date_rate = 0.0
-    for date_format in DATE_FORMATS:
-        parsed = pd.to_datetime(sample, format=date_format, errors="coerce")
-        parse_rate = float(parsed.notna().mean())
-        if parse_rate >= 0.6:
-            date_formats.append({"format": date_format, "confidence": round(parse_rate, 3)})
-        best_date_rate = max(best_date_rate, parse_rate)
-
-    if best_date_rate >= 0.8:
+    if numeric_rate < 0.8 and float(sample.str.contains(_DATE_SHAPE_RE).mean()) >= 0.6:
+        tried = set()
+        pending = list(DATE_FORMATS)
+        while pending:
+            date_format = pending.pop(0)
+            if date_format in tried:
+                continue
+            tried.add(date_format)
+            parse_rate = float(pd.to_datetime(sample, format=date_format, errors="coerce").notna().mean())
+            if parse_rate >= 0.6:
+                date_formats.append({"format": date_format, "confidence": round(parse_rate, 3)})
+            best_date_rate = max(best_date_rate, parse_rate)
+            if parse_rate >= DATE_TYPE_CONFIDENCE:
+                swapped = _swap_day_month(date_format)
+                pending = [swapped] if swapped in DATE_FORMATS else []
+
+    if best_date_rate >= DATE_TYPE_CONFIDENCE:
         return {
             "detected_type": "date",
             "confidence": round(best_date_rate, 3),
@@ -179,7 +585,9 @@ def _guess_column_type(series: pd.Series) -> Dict[str, Any]:
             "date_formats": [],
         }
 
-    unique_ratio = float(series.nunique(dropna=True) / max(len(series.dropna()), 1))
+    if unique_count is None:
+        unique_count = series.nunique(dropna=True)
+    unique_ratio = float(unique_count / max(int(series.notna().sum()), 1))
     return {
         "detected_type": "categorical" if unique_ratio < 0.7 else "text_or_id",
         "confidence": round(max(1 - unique_ratio, unique_ratio), 3),
@@ -187,43 +595,64 @@ def _guess_column_type(series: pd.Series) -> Dict[str, Any]:
     }
 
 
-def profile_dataframe(df: pd.DataFrame) -> List[Dict[str, Any]]:
+def _distinct_count(non_null: pd.Series) -> Tuple[int, bool]:
+    """Distinct non-null values: exact up to PROFILE_EXACT_DISTINCT_ROWS, HyperLogLog above. Returns (count, approximate)."""
+    if len(non_null) <= PROFILE_EXACT_DISTINCT_ROWS:
+        return int(non_null.nunique()), False
+    estimate = HyperLogLog().add_hashes(hash_values(non_null)).count()
+    return min(estimate, len(non_null)), True
+
+
+def _profile_column(column: Any, series: pd.Series, semantic_guess: Optional[str]) -> Dict[str, Any]:
+    non_null = series.dropna()
+    null_count = len(series) - len(non_null)
+    unique_count, approximate = _distinct_count(non_null)
+    type_guess = _guess_column_type(series, unique_count)
+    confidence = 0.95 if semantic_guess else type_guess["confidence"]
+
+    return {
+        "column_name": column,
+        "sample_values": non_null.head(5).astype(str).tolist(),
+        "null_count": null_count,
+        "null_rate": round(null_count / len(series), 4) if len(series) else 0.0,
+        "unique_count": unique_count,
+        "unique_count_approximate": approximate,
+        "unique_ratio": round(float(unique_count / max(len(non_null), 1)), 4),
+        "detected_type": type_guess["detected_type"],
+        "type_confidence": type_guess["confidence"],
+        "semantic_guess": semantic_guess,
+        "semantic_confidence": confidence if semantic_guess else 0.0,
+        "date_format_candidates": type_guess.get("date_formats", []),
+    }
+
+
+def profile_dataframe(df: pd.DataFrame, workers: Optional[int] = None) -> List[Dict[str, Any]]:
     """
     Build per-column profile metadata for the mapping UI.
+
+    Columns are profiled independently on a thread pool of `workers` threads
+    (PROFILE_WORKERS by default); profiles come back in column order.
     """
     suggested = suggest_column_mapping(df)
     semantic_by_column = {column: field for field, column in suggested.items() if column}
-    profiles = []
-
-    for column in df.columns:
-        series = df[column]
-        non_null = series.dropna()
-        type_guess = _guess_column_type(series)
-        semantic_guess = semantic_by_column.get(column)
-        confidence = 0.95 if semantic_guess else type_guess["confidence"]
-
-        profiles.append({
-            "column_name": column,
-            "sample_values": non_null.astype(str).head(5).tolist(),
-            "null_count": int(series.isna().sum()),
-            "null_rate": round(float(series.isna().mean()), 4),
-            "unique_count": int(series.nunique(dropna=True)),
-            "unique_ratio": round(float(series.nunique(dropna=True) / max(len(non_null), 1)), 4),
-            "detected_type": type_guess["detected_type"],
-            "type_confidence": type_guess["confidence"],
-            "semantic_guess": semantic_guess,
-            "semantic_confidence": confidence if semantic_guess else 0.0,
-            "date_format_candidates": type_guess.get("date_formats", []),
-        })
+    columns = [(column, df.iloc[:, position], semantic_by_column.get(column)) for position, column in enumerate(df.columns)]
 
-    return profiles
+    workers = min(PROFILE_WORKERS if workers is None else workers, len(columns))
+    if workers <= 1:
+        return [_profile_column(*column) for column in columns]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='profile') as pool:
+        return list(pool.map(lambda column: _profile_column(*column), columns))
 
 
-def build_mapping_validation_report(file_path: str, column_mapping: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+def build_mapping_validation_report(
+    file_path: str,
+    column_mapping: Optional[Dict[str, Any]] = None,
+    content_digest: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Run preprocessing only and return a validation payload for the mapping UI.
     """
-    df, metadata = preprocess_transaction_data(file_path, column_mapping)
+    df, metadata = cached_preprocess_transaction_data(file_path, column_mapping, content_digest=content_digest)
     cleaning_stats = metadata.get("cleaning_stats", {})
 
     direct_amount = metadata.get("parser_options", {}).get("amount_source_mode", "direct") == "direct"
@@ -290,7 +719,8 @@ def _coerce_field_mapping(column_mapping: Optional[Dict[str, Any]]) -> Tuple[Dic
             "thousands_separator": ".",
             "currency_symbol": "€",
             "allow_synthetic_customer_id": false,
-            "allow_synthetic_invoice_date": false
+            "allow_synthetic_invoice_date": false,
+            "sheet_name": "Sales"
         }
     """
     column_mapping = column_mapping or {}
@@ -304,6 +734,7 @@ def _coerce_field_mapping(column_mapping: Optional[Dict[str, Any]]) -> Tuple[Dic
         'negative_amount_policy': column_mapping.get('negative_amount_policy', 'exclude'),
         'allow_synthetic_customer_id': bool(column_mapping.get('allow_synthetic_customer_id', False)),
         'allow_synthetic_invoice_date': bool(column_mapping.get('allow_synthetic_invoice_date', False)),
+        'sheet_name': column_mapping.get('sheet_name') or None,
     }
 
     field_mapping: Dict[str, str] = {}
@@ -321,6 +752,7 @@ def validate_and_map_columns(
     df: pd.DataFrame,
     mapping: Dict[str, str],
     parser_options: Optional[Dict[str, Any]] = None,
+    copy: bool = True,
 ) -> Tuple[pd.DataFrame, List[str]]:
     """
     Validate that required columns exist and rename them to standard names.
@@ -331,6 +763,7 @@ def validate_and_map_columns(
     Args:
         df: Input DataFrame
         mapping: Dictionary mapping standard names to actual column names
+        copy: When False and no column is dropped, relabel `df` in place
 
     Returns:
         Tuple of (processed DataFrame, list of warning messages)
@@ -380,30 +813,158 @@ def validate_and_map_columns(
         for field in mapping
         if mapping.get(field) and mapping[field] in df.columns
     }
-    df_processed = df.rename(columns=rename_map)
+    renamed = [rename_map.get(column, column) for column in df.columns]
 
     # Keep only the standard columns that now exist in the frame
-    cols_to_keep = [field for field in mapping if field in df_processed.columns]
-    df_processed = df_processed[cols_to_keep]
+    cols_to_keep = [field for field in mapping if field in renamed]
+    positions = [renamed.index(field) for field in cols_to_keep]
 
+    if not copy and positions == list(range(len(df.columns))):
+        df.columns = cols_to_keep
+        return df, warnings
+
+    df_processed = df.iloc[:, positions]
+    df_processed.columns = cols_to_keep
     return df_processed, warnings
 
 
+def _memoised_parse(
+    series: pd.Series,
+    parse_unique: Callable[[pd.Series], pd.Series],
+    stats: Optional[Dict[str, Any]] = None,
+) -> pd.Series:
+    """
+    Parse each distinct value of a column once and map the results back by code.
+
+    Exports repeat the same date and price strings thousands of times, so parsing
+    the factorised uniques is usually far cheaper than parsing every row. Missing
+    values are never passed to `parse_unique` and come back as NaN/NaT.
+
+    Args:
+        series: Raw column
+        parse_unique: Vectorised parser applied to the Series of unique values
+        stats: Optional dict filled with row, unique and hit-ratio counts
+    """
+    codes, uniques = pd.factorize(series)
+    parsed_uniques = parse_unique(pd.Series(uniques))
+    values = pd.api.extensions.take(np.asarray(parsed_uniques), codes, allow_fill=True)
+
+    if stats is not None:
+        rows = int((codes >= 0).sum())
+        stats.update({
+            'rows': rows,
+            'unique_values': len(uniques),
+            'hit_ratio': round(1 - len(uniques) / rows, 4) if rows else 0.0,
+        })
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def _format_is_dayfirst(date_format: str) -> Optional[bool]:
+    """True/False when a format puts the day before/after the month, None if it has no both."""
+    day = date_format.find('%d')
+    month = max(date_format.find('%m'), date_format.find('%b'), date_format.find('%B'))
+    if day < 0 or month < 0:
+        return None
+    return day < month
+
+
+def _stratified_date_sample(series: pd.Series, size: int = DATE_SAMPLE_SIZE) -> pd.Series:
+    """Non-null values taken at evenly spaced positions, so every part of the file is represented."""
+    values = series.dropna()
+    if len(values) <= size:
+        return values
+    positions = np.linspace(0, len(values) - 1, size).astype(int)
+    return values.iloc[positions]
+
+
+def _date_format_candidates(sample: pd.Series, date_format: Optional[str]) -> List[str]:
+    candidates = [date_format] if date_format else []
+    candidates.extend(DATE_FORMATS)
+    # Let pandas suggest formats the fixed list lacks (ISO 'T' separators, times with
+    # fractions or offsets). Year-day-month guesses are never real exports; skip them.
+    for value in sample.astype(str).head(5):
+        for guess_dayfirst in (False, True):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)
+                guessed = guess_datetime_format(value, dayfirst=guess_dayfirst)
+            if guessed and not guessed.startswith('%Y-%d') and guessed not in candidates:
+                candidates.append(guessed)
+    return candidates
+
+
+def infer_date_format(
+    series: pd.Series,
+    date_format: Optional[str] = None,
+    dayfirst: bool = False,
+) -> Tuple[Optional[str], float, int]:
+    """
+    Choose a date format from a stratified sample of a column.
+
+    Every candidate (the user's format, DATE_FORMATS, and pandas' guesses) is tried
+    on the sample only. A user's format that parses the whole sample is kept as is.
+    Otherwise the best parse rate wins. Day/month-ambiguous ties go to the format
+    matching the day/month order of the user's format, or `dayfirst` without one
+    (month-first unless the user asked for day-first), then to the user's format,
+    then to DATE_FORMATS order.
+
+    Returns:
+        (winning format or None if nothing parsed, its sample parse rate, sample size)
+    """
+    sample = _stratified_date_sample(series)
+    if sample.empty:
+        return None, 0.0, 0
+
+    def rank(order: int, candidate: str) -> Tuple[float, bool, int, str]:
+        parse_rate = float(pd.to_datetime(sample, format=candidate, errors='coerce').notna().mean())
+        candidate_dayfirst = _format_is_dayfirst(candidate)
+        dayfirst_mismatch = candidate_dayfirst is not None and candidate_dayfirst != dayfirst
+        return -parse_rate, dayfirst_mismatch, order, candidate
+
+    if date_format:
+        # The user's (or a remembered) format settles the day/month order, and nothing
+        # outranks it once it parses the whole sample, so the other candidates are skipped.
+        format_dayfirst = _format_is_dayfirst(date_format)
+        if format_dayfirst is not None:
+            dayfirst = format_dayfirst
+        user_rank = rank(0, date_format)
+        if user_rank[0] == -1.0:
+            return date_format, 1.0, len(sample)
+
+    ranked = []
+    for order, candidate in enumerate(_date_format_candidates(sample, date_format)):
+        ranked.append(user_rank if order == 0 and date_format else rank(order, candidate))
+
+    best_rate, _, _, best_format = min(ranked)
+    if best_rate == 0:
+        return None, 0.0, len(sample)
+    return best_format, -best_rate, len(sample)
+
+
 def parse_dates(
     df: pd.DataFrame,
     date_column: str = 'invoice_date',
     date_format: Optional[str] = None,
     dayfirst: bool = False,
+    stats: Optional[Dict[str, Any]] = None,
+    copy: bool = True,
 ) -> pd.DataFrame:
     """
     Parse date column with robust format detection.
 
+    The format is chosen on a stratified sample (see infer_date_format) and the full
+    column is parsed once with it. Only values that format misses get a second,
+    mixed-format parse.
+
     If the date column is absent the DataFrame is returned unchanged; the
     calling pipeline will synthesise recency values in that case.
 
     Args:
         df: DataFrame with (optional) date column
         date_column: Name of the date column
+        date_format: Format the user selected; preferred when it parses the sample
+        dayfirst: Read ambiguous day/month dates day-first
+        stats: Optional dict filled with the chosen format and parse counts
+        copy: When False, replace the column on `df` itself (callers that own the frame)
 
     Returns:
         DataFrame with parsed dates (or unchanged if column is absent)
@@ -418,37 +979,59 @@ def parse_dates(
         )
         return df
 
-    df = df.copy()
-
-    if date_format:
-        try:
-            df[date_column] = pd.to_datetime(df[date_column], format=date_format, errors='raise')
-            logger.info(f"Successfully parsed dates using user-selected format: {date_format}")
-            return df
-        except Exception:
-            logger.warning(f"Could not parse all dates with user-selected format {date_format}; falling back to auto detection")
+    if copy:
+        df = df.copy()
+    stats = stats if stats is not None else {}
 
-    # First try pandas automatic parsing
-    try:
-        df[date_column] = pd.to_datetime(df[date_column], dayfirst=dayfirst)
+    # Typed sources (Parquet, Feather) already hold timestamps; compare them in UTC.
+    if pd.api.types.is_datetime64_any_dtype(df[date_column]):
+        if getattr(df[date_column].dt, 'tz', None) is not None:
+            df[date_column] = df[date_column].dt.tz_convert(None)
+        stats.update({'date_format': None, 'dayfirst': None, 'source': 'typed'})
         return df
-    except Exception:
-        pass
 
-    # Try each format explicitly
-    for date_format in DATE_FORMATS:
-        try:
-            df[date_column] = pd.to_datetime(df[date_column], format=date_format)
-            logger.info(f"Successfully parsed dates using format: {date_format}")
-            return df
-        except Exception:
-            continue
-
-    # Last resort: coerce and check success rate
-    df[date_column] = pd.to_datetime(df[date_column], errors='coerce')
-    valid_dates = df[date_column].notna().sum()
+    raw = df[date_column]
+    best_format, sample_rate, sample_size = infer_date_format(raw, date_format, dayfirst)
+    if date_format and best_format != date_format:
+        logger.warning(f"Could not parse all dates with user-selected format {date_format}; falling back to auto detection")
+
+    missed_values: List[Any] = []
+
+    def parse_unique(values: pd.Series) -> pd.Series:
+        if not best_format:
+            return _to_naive(pd.to_datetime(values, format='mixed', dayfirst=dayfirst, errors='coerce'))
+        parsed_values = pd.to_datetime(values, format=best_format, errors='coerce')
+        missed = parsed_values.isna()
+        if missed.any():
+            # Mixed-format columns: re-parse just the values the winning format missed.
+            missed_values.extend(values[missed].tolist())
+            parsed_values[missed] = _to_naive(
+                pd.to_datetime(values[missed], format='mixed', dayfirst=dayfirst, errors='coerce')
+            )
+        return parsed_values
+
+    memo_stats: Dict[str, Any] = {}
+    parsed = _memoised_parse(raw, parse_unique, memo_stats)
+    if best_format:
+        remedial_rows = int(raw.isin(missed_values).sum()) if missed_values else 0
+        logger.info(f"Parsed dates using format {best_format} (sample parse rate {sample_rate:.0%})")
+    else:
+        remedial_rows = memo_stats['rows']
+
+    df[date_column] = parsed
+    valid_dates = int(parsed.notna().sum())
     total_dates = len(df)
     success_rate = valid_dates / total_dates if total_dates > 0 else 0
+    stats.update({
+        'date_format': best_format,
+        'dayfirst': _format_is_dayfirst(best_format) if best_format else dayfirst,
+        'source': 'user' if date_format and best_format == date_format else 'inferred',
+        'sample_size': sample_size,
+        'sample_parse_rate': round(sample_rate, 4),
+        'remedial_rows': remedial_rows,
+        'unparsed_rows': int((parsed.isna() & raw.notna()).sum()),
+        'memoised': memo_stats,
+    })
 
     if success_rate < 0.5:
         raise ValueError(
@@ -457,18 +1040,111 @@ def parse_dates(
             f"Please ensure dates are in a standard format (e.g., YYYY-MM-DD)."
         )
 
-    logger.warning(f"Parsed {valid_dates}/{total_dates} dates successfully")
+    if valid_dates < raw.notna().sum():
+        logger.warning(f"Parsed {valid_dates}/{total_dates} dates successfully")
     return df
 
 
-def _parse_locale_numeric_series(
-    series: pd.Series,
+def _to_naive(parsed: pd.Series) -> pd.Series:
+    if getattr(parsed.dt, 'tz', None) is not None:
+        return parsed.dt.tz_convert(None)
+    return parsed
+
+
+# Python's `\s` (what str.strip and re use) spelled for RE2, so the Arrow kernels
+# remove exactly the characters the pure-pandas path does, NBSP included.
+_WHITESPACE_RE2 = r'[\t\n\v\f\r\x1c-\x1f\x{85}\p{Z}]'
+
+# What pd.to_numeric accepts once everything but digits, '.', '+' and '-' is gone.
+_NUMERIC_TEXT_RE2 = r'^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)$'
+
+# Up to 15 significant digits Arrow's cast and pd.to_numeric round identically;
+# pandas' own parser can differ in the last bit beyond that, so longer text goes to it.
+_EXACT_CAST_CHARS = 15
+
+
+def _text_to_numeric_arrow(text, index: pd.Index) -> pd.Series:
+    """pd.to_numeric(errors='coerce') over cleaned Arrow strings, without Python objects."""
+    if len(text) == 0 or pc.any(pc.greater(pc.utf8_length(text), _EXACT_CAST_CHARS)).as_py():
+        return pd.to_numeric(pd.Series(text.to_numpy(zero_copy_only=False), index=index), errors='coerce')
+
+    valid = pc.match_substring_regex(text, _NUMERIC_TEXT_RE2)
+    numbers = pc.cast(pc.if_else(valid, text, pa.scalar(None, pa.string())), pa.float64())
+    values = numbers.to_numpy(zero_copy_only=False)
+    # pd.to_numeric keeps int64 when every value is a whole number without a '.'.
+    if pc.all(valid).as_py() and not pc.any(pc.match_substring(text, '.')).as_py():
+        values = values.astype(np.int64)
+    return pd.Series(values, index=index)
+
+
+def _clean_numeric_text_arrow(
+    values: pd.Series,
     *,
-    decimal_separator: str = '.',
-    thousands_separator: str = ',',
-    currency_symbol: str = '',
+    decimal_separator: str,
+    thousands_separator: str,
+    currency_symbol: str,
+) -> pd.Series:
+    """
+    Normalise locale-formatted numbers with Arrow string kernels.
+
+    Gives exactly the results of _clean_numeric_text_pandas, but each step runs in
+    C++ over one contiguous UTF-8 buffer and no intermediate object column is built.
+    """
+    if len(values) == 0:
+        return pd.Series([], index=values.index, dtype='float64')
+    if not pd.api.types.is_string_dtype(values):
+        values = values.astype(str)
+    text = pa.array(values, type=pa.string(), from_pandas=True)
+
+    if currency_symbol:
+        if currency_symbol != currency_symbol.strip():
+            # Stripping first only matters when the symbol itself has edge whitespace.
+            text = pc.replace_substring_regex(text, f'^{_WHITESPACE_RE2}+|{_WHITESPACE_RE2}+$', '')
+        text = pc.replace_substring(text, currency_symbol, '')
+
+    # The final [^0-9.+-] pass drops whitespace too, so a separate whitespace pass is
+    # only needed when a separator could span or be whitespace.
+    separators = [sep for sep in (thousands_separator, decimal_separator) if sep]
+    if any(len(sep) > 1 or sep.isspace() for sep in separators):
+        text = pc.replace_substring_regex(text, _WHITESPACE_RE2, '')
+        text = pc.replace_substring_regex(text, r'(?s)^\((.*)\)$', r'-\1')
+    else:
+        # Only rows containing '(' can match, so run the regex over just those.
+        has_paren = pc.match_substring(text, '(')
+        if pc.any(has_paren).as_py():
+            negated = pc.replace_substring_regex(
+                pc.filter(text, has_paren),
+                f'(?s)^{_WHITESPACE_RE2}*\\((.*)\\){_WHITESPACE_RE2}*$',
+                r'-\1',
+            )
+            text = pc.replace_with_mask(text, has_paren, negated)
+
+    # A one-character thousands separator that is not part of a number would be
+    # dropped by the final pass anyway, unless the decimal replacement could see it.
+    if thousands_separator and not (
+        len(thousands_separator) == 1
+        and thousands_separator not in '0123456789.+-'
+        and len(decimal_separator) <= 1
+        and thousands_separator != decimal_separator
+    ):
+        text = pc.replace_substring(text, thousands_separator, '')
+    if decimal_separator and decimal_separator != '.':
+        text = pc.replace_substring(text, decimal_separator, '.')
+    text = pc.replace_substring_regex(text, r'[^0-9.\-+]', '')
+
+    # '', 'nan' and 'None' all reduce to '' above, which converts to NaN.
+    return _text_to_numeric_arrow(text, values.index)
+
+
+def _clean_numeric_text_pandas(
+    values: pd.Series,
+    *,
+    decimal_separator: str,
+    thousands_separator: str,
+    currency_symbol: str,
 ) -> pd.Series:
-    text = series.astype(str).str.strip()
+    """Pure-pandas version of _clean_numeric_text_arrow, used when pyarrow is missing."""
+    text = values.astype(str).str.strip()
     text = text.replace({'': np.nan, 'nan': np.nan, 'None': np.nan})
 
     if currency_symbol:
@@ -487,6 +1163,31 @@ def _parse_locale_numeric_series(
     return pd.to_numeric(text, errors='coerce')
 
 
+def _parse_locale_numeric_series(
+    series: pd.Series,
+    *,
+    decimal_separator: str = '.',
+    thousands_separator: str = ',',
+    currency_symbol: str = '',
+    stats: Optional[Dict[str, Any]] = None,
+) -> pd.Series:
+    # Typed sources (Parquet, Feather) already hold numbers; only text needs parsing.
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return pd.to_numeric(series, errors='coerce')
+
+    clean_numeric_text = _clean_numeric_text_arrow if pc is not None else _clean_numeric_text_pandas
+
+    def parse_unique(values: pd.Series) -> pd.Series:
+        return clean_numeric_text(
+            values,
+            decimal_separator=decimal_separator,
+            thousands_separator=thousands_separator,
+            currency_symbol=currency_symbol,
+        )
+
+    return _memoised_parse(series, parse_unique, stats)
+
+
 def validate_numeric_column(
     df: pd.DataFrame,
     column: str,
@@ -494,6 +1195,8 @@ def validate_numeric_column(
     decimal_separator: str = '.',
     thousands_separator: str = ',',
     currency_symbol: str = '',
+    stats: Optional[Dict[str, Any]] = None,
+    copy: bool = True,
 ) -> pd.DataFrame:
     """
     Ensure a column contains numeric values.
@@ -501,6 +1204,8 @@ def validate_numeric_column(
     Args:
         df: DataFrame
         column: Column name to validate
+        stats: Optional dict filled with memoised-parsing counts for the column
+        copy: When False, replace the column on `df` itself (callers that own the frame)
 
     Returns:
         DataFrame with validated numeric column
@@ -508,7 +1213,8 @@ def validate_numeric_column(
     Raises:
         ValueError: If column cannot be converted to numeric
     """
-    df = df.copy()
+    if copy:
+        df = df.copy()
 
     # Try to convert to numeric
     df[column] = _parse_locale_numeric_series(
@@ -516,6 +1222,7 @@ def validate_numeric_column(
         decimal_separator=decimal_separator,
         thousands_separator=thousands_separator,
         currency_symbol=currency_symbol,
+        stats=stats,
     )
 
     # Check for too many invalid values
@@ -531,10 +1238,22 @@ def validate_numeric_column(
     return df
 
 
+def _is_text_dtype(dtype: Any) -> bool:
+    """True for pandas/Arrow string extension dtypes (not object, which may hold anything)."""
+    if isinstance(dtype, pd.StringDtype):
+        return True
+    if pa is not None and isinstance(dtype, pd.ArrowDtype):
+        return pa.types.is_string(dtype.pyarrow_dtype) or pa.types.is_large_string(dtype.pyarrow_dtype)
+    return False
+
+
 def clean_data(df: pd.DataFrame, parser_options: Optional[Dict[str, Any]] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Clean and prepare transaction data for analysis.
 
+    The input frame is never modified; rows are filtered and date-sorted in a
+    single take, so the result is the only new copy of the data.
+
     `customer_id` and `invoice_date` are handled gracefully when absent:
     - Missing customer_id  → synthetic IDs are generated from the row index
     - Missing invoice_date → recency will be estimated upstream by the RFM module
@@ -562,11 +1281,17 @@ def clean_data(df: pd.DataFrame, parser_options: Optional[Dict[str, Any]] = None
         'final_rows': 0
     }
 
+    # Rows are only marked here and the frame is materialised once at the end, in
+    # date order, so cleaning costs one copy of the data however many rules apply.
+    keep = np.ones(initial_rows, dtype=bool)
+    synthetic_customer_ids = None
+    synthetic_dates = None
+
     # ── customer_id ───────────────────────────────────────────
     if 'customer_id' in df.columns:
-        null_customers = df['customer_id'].isna().sum()
-        df = df.dropna(subset=['customer_id'])
-        stats['removed_null_customer'] = int(null_customers)
+        null_customers = df['customer_id'].isna().to_numpy()
+        keep &= ~null_customers
+        stats['removed_null_customer'] = int(null_customers.sum())
     else:
         if not allow_synthetic_customer_id:
             raise ValueError(
@@ -575,8 +1300,7 @@ def clean_data(df: pd.DataFrame, parser_options: Optional[Dict[str, Any]] = None
             )
         # No customer column — treat every row as its own customer
         # (transaction-level segmentation; RFM module groups by this key)
-        df = df.copy()
-        df['customer_id'] = df.index.astype(str)
+        synthetic_customer_ids = df.index.astype(str)
         stats['synthesised_customer_id'] = True
         logger.info(
             "No customer_id column found — synthesised unique IDs from row index. "
@@ -585,9 +1309,9 @@ def clean_data(df: pd.DataFrame, parser_options: Optional[Dict[str, Any]] = None
 
     # ── invoice_date ──────────────────────────────────────────
     if 'invoice_date' in df.columns:
-        null_dates = df['invoice_date'].isna().sum()
-        df = df.dropna(subset=['invoice_date'])
-        stats['removed_null_date'] = int(null_dates)
+        null_dates = df['invoice_date'].isna().to_numpy() & keep
+        keep &= ~null_dates
+        stats['removed_null_date'] = int(null_dates.sum())
     else:
         if not allow_synthetic_invoice_date:
             raise ValueError(
@@ -596,12 +1320,11 @@ def clean_data(df: pd.DataFrame, parser_options: Optional[Dict[str, Any]] = None
             )
         # Synthesise sequential dates so RFM recency can be computed
         # Spread rows evenly across the last 365 days
-        n = len(df)
+        n = int(keep.sum())
         end_date   = pd.Timestamp.now().normalize()
         start_date = end_date - pd.Timedelta(days=365)
-        synthetic_dates = pd.date_range(start=start_date, end=end_date, periods=n)
-        df = df.copy()
-        df['invoice_date'] = synthetic_dates
+        synthetic_dates = np.full(initial_rows, np.datetime64('NaT'), dtype='datetime64[ns]')
+        synthetic_dates[keep] = pd.date_range(start=start_date, end=end_date, periods=n).values
         stats['synthesised_invoice_date'] = True
         logger.info(
             "No invoice_date column found — synthesised sequential dates spanning "
@@ -609,34 +1332,206 @@ def clean_data(df: pd.DataFrame, parser_options: Optional[Dict[str, Any]] = None
         )
 
     # ── amount ────────────────────────────────────────────────
-    null_amounts = df['amount'].isna().sum()
-    df = df.dropna(subset=['amount'])
-    stats['removed_null_amount'] = int(null_amounts)
+    null_amounts = df['amount'].isna().to_numpy() & keep
+    keep &= ~null_amounts
+    stats['removed_null_amount'] = int(null_amounts.sum())
 
-    negative_amounts = int((df['amount'] < 0).sum())
+    negative = (df['amount'] < 0).to_numpy() & keep
+    negative_amounts = int(negative.sum())
     if negative_amounts and negative_amount_policy == 'exclude':
-        df = df[df['amount'] >= 0]
+        keep &= ~negative
         stats['removed_negative_amount'] = negative_amounts
-    elif negative_amounts and negative_amount_policy == 'absolute':
-        df = df.copy()
-        df['amount'] = df['amount'].abs()
-        stats['removed_negative_amount'] = 0
     else:
         stats['removed_negative_amount'] = 0
 
+    # Sort by date, then take the surviving rows in that order in one pass
+    positions = np.flatnonzero(keep)
+    if synthetic_dates is not None:
+        dates = pd.Series(synthetic_dates[positions])
+    else:
+        dates = df['invoice_date'].iloc[positions].reset_index(drop=True)
+    positions = positions[dates.sort_values().index.to_numpy()]
+    df = df.take(positions)
+
+    if synthetic_customer_ids is not None:
+        df['customer_id'] = synthetic_customer_ids[positions]
+    if synthetic_dates is not None:
+        df['invoice_date'] = synthetic_dates[positions]
+    if negative_amounts and negative_amount_policy == 'absolute':
+        df['amount'] = df['amount'].abs()
+
     stats['final_rows'] = len(df)
     stats['rows_removed'] = initial_rows - len(df)
     stats['retention_rate'] = len(df) / initial_rows if initial_rows > 0 else 0
 
-    # Ensure customer_id is string for consistency
-    df['customer_id'] = df['customer_id'].astype(str)
-
-    # Sort by date
-    df = df.sort_values('invoice_date')
+    # Ensure customer_id is string for consistency (Arrow-backed text already is,
+    # and converting it would box every ID into a Python object)
+    if not _is_text_dtype(df['customer_id'].dtype):
+        df['customer_id'] = df['customer_id'].astype(str)
 
     return df, stats
 
 
+_MB = 1024 * 1024
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, where /proc is available."""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    """High-water RSS of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak if sys.platform == 'darwin' else peak * 1024)
+
+
+def _to_mb(value: Optional[float]) -> Optional[float]:
+    return round(float(value) / _MB, 2) if value is not None else None
+
+
+class _MemoryAccountant:
+    """
+    Record memory use around each preprocessing step.
+
+    Every step logs the process RSS and its high-water mark, and the frame's own
+    footprint once the caller records it. Allocated bytes come
+    from tracemalloc (the step's traced peak) when PREPROCESS_TRACE_ALLOCATIONS is
+    on, and from RSS growth otherwise, which is free but only counts net growth.
+    """
+
+    def __init__(self, trace_allocations: bool = PREPROCESS_TRACE_ALLOCATIONS):
+        self.steps: List[Dict[str, Any]] = []
+        self.raw_column_bytes: Optional[int] = None
+        self._owns_trace = trace_allocations and not tracemalloc.is_tracing()
+        if self._owns_trace:
+            tracemalloc.start()
+        self.traced = tracemalloc.is_tracing()
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        rss_before = _current_rss_bytes()
+        if self.traced:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            rss_after = _current_rss_bytes()
+            if self.traced:
+                allocated = tracemalloc.get_traced_memory()[1] - traced_before
+            elif rss_before is not None and rss_after is not None:
+                allocated = max(rss_after - rss_before, 0)
+            else:
+                allocated = None
+            self.steps.append({
+                'step': name,
+                'seconds': round(time.perf_counter() - started, 4),
+                'allocated_mb': _to_mb(allocated),
+                'rss_mb': _to_mb(rss_after),
+                'peak_rss_mb': _to_mb(_peak_rss_bytes()),
+            })
+
+    def record_frame(self, df: pd.DataFrame) -> int:
+        """Attach the frame's deep footprint to the last step. Returns it in bytes."""
+        frame_bytes = int(df.memory_usage(deep=True).sum())
+        if self.steps:
+            self.steps[-1]['frame_mb'] = _to_mb(frame_bytes)
+        return frame_bytes
+
+    def close(self) -> None:
+        if self._owns_trace:
+            tracemalloc.stop()
+            self._owns_trace = False
+
+    def summary(self) -> Dict[str, Any]:
+        allocations = [step['allocated_mb'] for step in self.steps if step['allocated_mb'] is not None]
+        peak_allocated = max(allocations, default=None)
+        raw_mb = _to_mb(self.raw_column_bytes)
+        return {
+            'allocation_source': 'tracemalloc' if self.traced else 'rss',
+            'raw_column_mb': raw_mb,
+            'peak_step_allocated_mb': peak_allocated,
+            'peak_rss_mb': _to_mb(_peak_rss_bytes()),
+            'steps': self.steps,
+        }
+
+
+# Low-cardinality text fields stored as pandas categoricals in the canonical frame.
+CATEGORICAL_FIELDS = ('product', 'category')
+
+
+def _float32_is_lossless(values: pd.Series) -> bool:
+    """True when every value survives a float32 round trip unchanged (NaN included)."""
+    as_float64 = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(over='ignore'):
+        round_trip = as_float64.astype(np.float32).astype(np.float64)
+    return bool(np.array_equal(round_trip, as_float64, equal_nan=True))
+
+
+def compact_frame(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Shrink the cleaned transaction frame before it reaches RFM and segmentation.
+
+    - `customer_code`: int32 code from pd.factorize over the sorted display IDs, so
+      groupbys hash integers instead of strings.
+    - `customer_id`: categorical with those codes; its categories are the display-ID
+      lookup table (see customer_lookup).
+    - `amount` (and quantity/unit_price): float32 when no value changes by it.
+      Aggregations upcast to float64, so totals are unaffected.
+    - `product` / `category`: categorical.
+
+    Args:
+        df: Output of clean_data; modified in place
+
+    Returns:
+        Tuple of (the same DataFrame, dict of per-column MB before and after)
+    """
+    before = df.memory_usage(deep=True, index=False)
+
+    if 'customer_id' in df.columns:
+        raw_codes, raw_ids = pd.factorize(df['customer_id'])
+        # Distinct raw values can share a display string (1 and '1'); sort the
+        # strings so code order matches a groupby on the display IDs.
+        display_codes, display_ids = pd.factorize(pd.Index(raw_ids).astype(str), sort=True)
+        codes = display_codes[raw_codes].astype(np.int32)
+        df['customer_code'] = codes
+        df['customer_id'] = pd.Categorical.from_codes(codes, categories=display_ids)
+
+    for column in ('amount', 'quantity', 'unit_price'):
+        if column in df.columns and df[column].dtype == np.float64 and _float32_is_lossless(df[column]):
+            df[column] = df[column].astype(np.float32)
+
+    for column in CATEGORICAL_FIELDS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            # Plain object categories, whatever the column was read as, so the frame
+            # comes back from Parquet (see cached_preprocess_transaction_data) unchanged.
+            codes, labels = pd.factorize(df[column], sort=True)
+            df[column] = pd.Categorical.from_codes(codes, categories=labels.astype(object))
+
+    after = df.memory_usage(deep=True, index=False)
+    return df, {
+        column: {
+            'dtype': str(df[column].dtype),
+            'before_mb': _to_mb(before.get(column)),
+            'after_mb': _to_mb(after[column]),
+        }
+        for column in df.columns
+    }
+
+
+def customer_lookup(df: pd.DataFrame) -> pd.Index:
+    """Display customer IDs indexed by `customer_code` (see compact_frame)."""
+    return df['customer_id'].cat.categories
+
+
 def preprocess_transaction_data(
     file_path: str,
     column_mapping: Optional[Dict[str, str]] = None
@@ -663,108 +1558,414 @@ def preprocess_transaction_data(
         'summary': {}
     }
 
-    # Load CSV
-    df = load_csv(file_path)
-    metadata['raw_rows'] = int(df.attrs.get('raw_rows', len(df)))
-    metadata['removed_blank_rows'] = int(df.attrs.get('removed_blank_rows', 0))
-    metadata['original_columns'] = list(df.columns)
+    # The mapping only needs the header, so resolve it before touching the rows
+    encoding = detect_encoding(file_path) if source_format(file_path) == 'csv' else None
+    sheet = (column_mapping or {}).get('sheet_name') or None
+    columns = read_columns(file_path, encoding=encoding, sheet=sheet)
+    metadata['original_columns'] = columns
 
     # Get column mapping
-    suggested_mapping = suggest_column_mapping(df)
+    suggested_mapping = suggest_column_mapping(columns)
     metadata['suggested_mapping'] = suggested_mapping
 
     if column_mapping is None:
         column_mapping = suggested_mapping
 
     field_mapping, parser_options = _coerce_field_mapping(column_mapping)
+    # Mapped names are stripped, and a remembered mapping may spell this file's
+    # columns in another case; resolve them against the header actually read
+    field_mapping = remap_to_header(field_mapping, columns)
 
     metadata['applied_mapping'] = field_mapping
     metadata['parser_options'] = parser_options
 
-    # Validate and map columns
-    df, warnings = validate_and_map_columns(df, field_mapping, parser_options)
-    if warnings:
-        metadata['warnings'] = warnings
-
-    amount_mode = parser_options.get('amount_source_mode', 'direct')
-    if amount_mode == 'formula':
-        df = validate_numeric_column(
-            df,
-            'quantity',
-            decimal_separator=parser_options.get('decimal_separator', '.'),
-            thousands_separator=parser_options.get('thousands_separator', ','),
-            currency_symbol='',
-        )
-        df = validate_numeric_column(
-            df,
-            'unit_price',
-            decimal_separator=parser_options.get('decimal_separator', '.'),
-            thousands_separator=parser_options.get('thousands_separator', ','),
-            currency_symbol=parser_options.get('currency_symbol', ''),
-        )
-        df = df.copy()
-        df['amount'] = df['quantity'] * df['unit_price']
-        metadata['derived_amount_formula'] = 'quantity * unit_price'
-
-    # Parse dates (no-op if column absent)
-    df = parse_dates(
-        df,
-        date_format=parser_options.get('invoice_date_format'),
-        dayfirst=bool(parser_options.get('dayfirst', False)),
-    )
+    # Everything below works on the one frame load_csv returns: each step replaces
+    # columns on it instead of copying it, and clean_data materialises it once more.
+    memory = _MemoryAccountant()
+    try:
+        # Load only the mapped columns, in bounded-memory chunks so oversized files fail
+        # before a full read. Unmapped columns are never tokenised or held in memory.
+        usecols, read_dtypes = _projected_read_options(columns, field_mapping)
+        with memory.step('load'):
+            df = load_csv(
+                file_path,
+                chunksize=INGEST_CHUNK_ROWS or None,
+                usecols=usecols,
+                dtype=read_dtypes,
+                encoding=encoding,
+                sheet=sheet,
+            )
+        memory.raw_column_bytes = memory.record_frame(df)
+        metadata['raw_rows'] = int(df.attrs.get('raw_rows', len(df)))
+        metadata['removed_blank_rows'] = int(df.attrs.get('removed_blank_rows', 0))
+        metadata['projected_columns'] = list(df.columns)
+        metadata['parser_options']['encoding'] = df.attrs.get('encoding')
+        metadata['parser_options']['reader_engine'] = df.attrs.get('reader_engine')
+        metadata['parser_options']['source_format'] = df.attrs.get('source_format', 'csv')
+        metadata['parser_options']['compression'] = df.attrs.get('compression')
+
+        # Validate and map columns
+        with memory.step('map_columns'):
+            df, warnings = validate_and_map_columns(df, field_mapping, parser_options, copy=False)
+        memory.record_frame(df)
+        if warnings:
+            metadata['warnings'] = warnings
+
+        # Per-column unique-value parsing counts, reported in cleaning_stats
+        parse_stats: Dict[str, Dict[str, Any]] = {}
+
+        amount_mode = parser_options.get('amount_source_mode', 'direct')
+        if amount_mode == 'formula':
+            with memory.step('parse_quantity'):
+                df = validate_numeric_column(
+                    df,
+                    'quantity',
+                    decimal_separator=parser_options.get('decimal_separator', '.'),
+                    thousands_separator=parser_options.get('thousands_separator', ','),
+                    currency_symbol='',
+                    stats=parse_stats.setdefault('quantity', {}),
+                    copy=False,
+                )
+            with memory.step('parse_unit_price'):
+                df = validate_numeric_column(
+                    df,
+                    'unit_price',
+                    decimal_separator=parser_options.get('decimal_separator', '.'),
+                    thousands_separator=parser_options.get('thousands_separator', ','),
+                    currency_symbol=parser_options.get('currency_symbol', ''),
+                    stats=parse_stats.setdefault('unit_price', {}),
+                    copy=False,
+                )
+                df['amount'] = df['quantity'] * df['unit_price']
+            memory.record_frame(df)
+            metadata['derived_amount_formula'] = 'quantity * unit_price'
+
+        # Parse dates (no-op if column absent)
+        date_stats: Dict[str, Any] = {}
+        with memory.step('parse_dates'):
+            df = parse_dates(
+                df,
+                date_format=parser_options.get('invoice_date_format'),
+                dayfirst=bool(parser_options.get('dayfirst', False)),
+                stats=date_stats,
+                copy=False,
+            )
+        memory.record_frame(df)
+        if date_stats:
+            metadata['date_parsing'] = date_stats
+            if date_stats.get('memoised'):
+                parse_stats['invoice_date'] = date_stats['memoised']
+
+        # Validate numeric amount column
+        with memory.step('parse_amount'):
+            df = validate_numeric_column(
+                df,
+                'amount',
+                decimal_separator=parser_options.get('decimal_separator', '.'),
+                thousands_separator=parser_options.get('thousands_separator', ','),
+                currency_symbol=parser_options.get('currency_symbol', ''),
+                stats=parse_stats.setdefault('amount', {}),
+                copy=False,
+            )
+        memory.record_frame(df)
 
-    # Validate numeric amount column
-    df = validate_numeric_column(
-        df,
-        'amount',
-        decimal_separator=parser_options.get('decimal_separator', '.'),
-        thousands_separator=parser_options.get('thousands_separator', ','),
-        currency_symbol=parser_options.get('currency_symbol', ''),
-    )
+        # Clean data (synthesises missing customer_id / invoice_date internally)
+        with memory.step('clean'):
+            df, cleaning_stats = clean_data(df, parser_options)
+        memory.record_frame(df)
+
+        # Calculate summary statistics
+        metadata['date_range'] = {
+            'start': df['invoice_date'].min().isoformat(),
+            'end':   df['invoice_date'].max().isoformat()
+        }
 
-    # Clean data (synthesises missing customer_id / invoice_date internally)
-    df, cleaning_stats = clean_data(df, parser_options)
+        metadata['summary'] = {
+            'num_transactions': len(df),
+            'num_customers':    df['customer_id'].nunique(),
+            'num_invoices':     df['invoice_id'].nunique() if 'invoice_id' in df.columns else None,
+            'total_revenue':    float(df['amount'].sum()),
+            'avg_transaction':  float(df['amount'].mean()),
+            'median_transaction': float(df['amount'].median()),
+            'synthesised_customer_id':  cleaning_stats.get('synthesised_customer_id', False),
+            'synthesised_invoice_date': cleaning_stats.get('synthesised_invoice_date', False),
+        }
+
+        # Integer customer codes, float32 amounts and categoricals for later stages
+        with memory.step('compact'):
+            df, column_footprint = compact_frame(df)
+        memory.record_frame(df)
+    finally:
+        memory.close()
+
+    cleaning_stats['memoised_parsing'] = {column: counts for column, counts in parse_stats.items() if counts}
+    cleaning_stats['memory'] = memory.summary()
+    cleaning_stats['memory']['columns'] = column_footprint
     metadata['cleaning_stats'] = cleaning_stats
 
-    # Calculate summary statistics
-    metadata['date_range'] = {
-        'start': df['invoice_date'].min().isoformat(),
-        'end':   df['invoice_date'].max().isoformat()
-    }
+    return df, metadata
+
+
+# Canonical frames shared between mapping validation and the analysis job
+PREPROCESS_CACHE = FrameCache()
 
-    metadata['summary'] = {
-        'num_transactions': len(df),
-        'num_customers':    df['customer_id'].nunique(),
-        'num_invoices':     df['invoice_id'].nunique() if 'invoice_id' in df.columns else None,
-        'total_revenue':    float(df['amount'].sum()),
-        'avg_transaction':  float(df['amount'].mean()),
-        'median_transaction': float(df['amount'].median()),
-        'synthesised_customer_id':  cleaning_stats.get('synthesised_customer_id', False),
-        'synthesised_invoice_date': cleaning_stats.get('synthesised_invoice_date', False),
+
+def preprocess_cache_key(
+    file_path: str,
+    column_mapping: Optional[Dict[str, Any]] = None,
+    content_digest: Optional[str] = None,
+) -> str:
+    """
+    Cache key for preprocessing a file with a mapping.
+
+    Mappings are normalised first, so payloads that differ only in empty fields or
+    defaulted options share an entry. The row limit, the CSV reader engine and the
+    chunking settings the file is read with are part of the key, and so is today's
+    date when invoice dates may be synthesised (they count back from today).
+    `content_digest` is the file's SHA-256 if the caller already has it (uploads are
+    hashed while they stream in); otherwise the file is hashed here.
+    """
+    field_mapping, parser_options = _coerce_field_mapping(column_mapping)
+    parts: Dict[str, Any] = {
+        'kind': 'preprocess',
+        'file': content_digest or file_digest(file_path),
+        'mapping': field_mapping if column_mapping is not None else None,
+        'options': parser_options,
+        'max_rows': MAX_ROWS,
+        'reader_engine': resolve_reader_engine() if source_format(file_path) == 'csv' else source_format(file_path),
+        'chunk_rows': INGEST_CHUNK_ROWS,
+        'max_memory_mb': INGEST_MAX_MEMORY_MB,
     }
+    if parser_options['allow_synthetic_invoice_date']:
+        parts['day'] = pd.Timestamp.now().date().isoformat()
+    return cache_key(**parts)
+
 
+def cached_preprocess_transaction_data(
+    file_path: str,
+    column_mapping: Optional[Dict[str, Any]] = None,
+    cache: Optional[FrameCache] = None,
+    content_digest: Optional[str] = None,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    preprocess_transaction_data, reusing the canonical frame of an identical earlier run.
+
+    The file is identified by content, so validating a mapping and then running the
+    job on a fresh copy of the same upload parses it only once. `metadata['cache']`
+    records whether the result came from the cache. SQL sources are never cached:
+    the same query returns new rows as the database changes.
+    """
+    cache = cache if cache is not None else PREPROCESS_CACHE
+    if not cache.enabled or source_format(file_path) == 'sql':
+        return preprocess_transaction_data(file_path, column_mapping)
+
+    key = preprocess_cache_key(file_path, column_mapping, content_digest)
+    cached = cache.get(key)
+    if cached is not None and cached[1] is not None:
+        metadata, df = cached
+        metadata['cache'] = {'hit': True, 'key': key}
+        return df, metadata
+
+    df, metadata = preprocess_transaction_data(file_path, column_mapping)
+    stored = cache.put(key, metadata, df)
+    metadata['cache'] = {'hit': False, 'key': key, 'stored': stored}
     return df, metadata
 
 
-def get_csv_preview(file_path: str, num_rows: int = 5) -> Dict[str, Any]:
+def get_csv_preview(
+    file_path: str,
+    num_rows: int = 5,
+    exact: bool = False,
+    profile: bool = True,
+    sheet: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Get a preview of a CSV file for column mapping UI.
 
+    Large files are previewed from their head plus a few random byte-range samples:
+    profiles describe the sample and the row counts are estimates (flagged with
+    `row_count_estimated`), and a file estimated over MAX_ROWS is rejected. A head
+    that does not parse on its own (a quoted multi-line field cut off at its end)
+    falls back to the exact read. The analysis job counts rows exactly.
+
     Args:
         file_path: Path to CSV file
         num_rows: Number of sample rows to return
+        exact: Load the whole file for exact counts and profiles
+        profile: Suggest a mapping and profile columns. Callers that already know the
+            mapping (a remembered layout) pass False; both keys then come back empty.
+        sheet: Worksheet of an .xlsx upload to preview (the first worksheet if omitted)
 
     Returns:
-        Dictionary with columns, sample data, and suggested mapping
+        Dictionary with columns, sample data, and suggested mapping. Workbook
+        previews also list the `sheets` and the `sheet_name` shown.
     """
+    if source_format(file_path) == 'xlsx':
+        return _get_spreadsheet_preview(file_path, num_rows, profile, sheet)
+    if source_format(file_path) == 'sql':
+        return _get_sql_preview(file_path, num_rows, profile)
+    if source_format(file_path) != 'csv':
+        return _get_columnar_preview(file_path, num_rows, profile)
+
+    sampled = None
+    if not exact:
+        try:
+            sampled = read_csv_sample(file_path, encoding=detect_encoding(file_path))
+        except pd.errors.ParserError as e:
+            # A quoted multi-line field cut off at the end of the head block; the
+            # exact read below parses the file as a whole.
+            logger.info(f"Sampled preview of {file_path} failed to parse, reading it in full: {e}")
+            sampled = None
+
+    if sampled is not None:
+        head_df, sample_df, estimate = sampled
+        if head_df.empty:
+            raise ValueError("The uploaded file is empty or has no valid data")
+        total_rows = estimate['raw_rows'] - estimate['removed_blank_rows']
+        if total_rows > MAX_ROWS:
+            raise ValueError(
+                f"File has about {total_rows:,} rows which exceeds the maximum of {MAX_ROWS:,}. "
+                f"Please reduce the file size or contact support."
+            )
+        sample = head_df.head(num_rows)
+        return {
+            'columns':          list(head_df.columns),
+            'sample_rows':      sample.where(sample.notna(), None).to_dict(orient='records'),
+            'suggested_mapping': suggest_column_mapping(head_df) if profile else {},
+            'column_profiles':  profile_dataframe(sample_df) if profile else None,
+            'total_rows':       total_rows,
+            'raw_rows':         estimate['raw_rows'],
+            'removed_blank_rows': estimate['removed_blank_rows'],
+            'row_count_estimated': True,
+        }
+
     df = load_csv(file_path)
 
     return {
         'columns':          list(df.columns),
         'sample_rows':      df.head(num_rows).to_dict(orient='records'),
-        'suggested_mapping': suggest_column_mapping(df),
-        'column_profiles':  profile_dataframe(df),
+        'suggested_mapping': suggest_column_mapping(df) if profile else {},
+        'column_profiles':  profile_dataframe(df) if profile else None,
         'total_rows':       len(df),
         'raw_rows':         int(df.attrs.get('raw_rows', len(df))),
         'removed_blank_rows': int(df.attrs.get('removed_blank_rows', 0)),
+        'row_count_estimated': False,
+    }
+
+
+def _get_spreadsheet_preview(
+    file_path: str,
+    num_rows: int,
+    profile: bool = True,
+    sheet: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Preview one worksheet of an .xlsx file from the rows at the top of the sheet.
+
+    Counts are exact when the sheet ends within the sample; otherwise they come
+    from the sheet's stored dimensions and are flagged as estimates.
+    """
+    df, stats = read_sheet_sample(file_path, sheet)
+    if df.empty:
+        raise ValueError("The uploaded file is empty or has no valid data")
+
+    if stats['complete']:
+        raw_rows = stats['raw_rows']
+        removed_blank_rows = stats['removed_blank_rows']
+    else:
+        raw_rows = stats['dimension_rows']
+        removed_blank_rows = 0
+    total_rows = raw_rows - removed_blank_rows if raw_rows is not None else None
+    if total_rows is not None and total_rows > MAX_ROWS:
+        raise ValueError(
+            f"File has {total_rows:,} rows which exceeds the maximum of {MAX_ROWS:,}. "
+            f"Please reduce the file size or contact support."
+        )
+
+    sample = df.head(num_rows)
+    return {
+        'columns':          list(df.columns),
+        'sample_rows':      sample.where(sample.notna(), None).to_dict(orient='records'),
+        'suggested_mapping': suggest_column_mapping(df) if profile else {},
+        'column_profiles':  profile_dataframe(df) if profile else None,
+        'total_rows':       total_rows,
+        'raw_rows':         raw_rows,
+        'removed_blank_rows': removed_blank_rows,
+        'row_count_estimated': not stats['complete'],
+        'sheets':           stats['sheets'],
+        'sheet_name':       stats['sheet_name'],
+    }
+
+
+def _get_sql_preview(file_path: str, num_rows: int, profile: bool = True) -> Dict[str, Any]:
+    """
+    Preview a SQL source from its first PREVIEW_SHEET_ROWS rows, limited in the query.
+
+    The full row count is only known when the query returns fewer rows than that;
+    otherwise it is left empty until the job runs.
+    """
+    stats: Dict[str, Any] = {}
+    df = concat_chunks(iter_sql_chunks(
+        file_path, limit=PREVIEW_SHEET_ROWS + 1, max_rows=float('inf'), max_memory_mb=None, stats=stats,
+    ))
+    if df.empty:
+        raise ValueError("The SQL query returned no rows")
+
+    complete = stats['raw_rows'] <= PREVIEW_SHEET_ROWS
+    df = df.head(PREVIEW_SHEET_ROWS)
+    # Timestamps and numbers are typed already; send the sample as text like a CSV preview.
+    sample = df.head(num_rows)
+    sample_rows = sample.astype(str).where(sample.notna(), None)
+
+    return {
+        'columns':          list(df.columns),
+        'sample_rows':      sample_rows.to_dict(orient='records'),
+        'suggested_mapping': suggest_column_mapping(df) if profile else {},
+        'column_profiles':  profile_dataframe(df) if profile else None,
+        'total_rows':       stats['usable_rows'] if complete else None,
+        'raw_rows':         stats['raw_rows'] if complete else None,
+        'removed_blank_rows': stats['removed_blank_rows'] if complete else None,
+        'row_count_estimated': not complete,
+    }
+
+
+def _get_columnar_preview(file_path: str, num_rows: int, profile: bool = True) -> Dict[str, Any]:
+    """
+    Preview a Parquet or Feather file from its first row group (or record batch).
+
+    Row counts come from file metadata, so the rest of the file is never read.
+    Blank rows outside the first row group are only counted at analysis time.
+    """
+    try:
+        stats: Dict[str, Any] = {}
+        df = concat_chunks(iter_columnar_chunks(
+            file_path, max_rows=float('inf'), max_memory_mb=None, stats=stats, first_chunk_only=True,
+        ))
+        total_rows = count_columnar_rows(file_path)
+    except ARROW_ERRORS as e:
+        raise ValueError(f"Error reading {source_format(file_path).title()} file: {str(e)}")
+
+    if df.empty:
+        raise ValueError("The uploaded file is empty")
+
+    removed_blank_rows = int(stats['removed_blank_rows'])
+    if total_rows - removed_blank_rows > MAX_ROWS:
+        raise ValueError(
+            f"File has {total_rows - removed_blank_rows:,} rows which exceeds the maximum of {MAX_ROWS:,}. "
+            f"Please reduce the file size or contact support."
+        )
+
+    # Timestamps and numbers are typed already; send the sample as text like a CSV preview.
+    sample = df.head(num_rows)
+    sample_rows = sample.astype(str).where(sample.notna(), None)
+
+    return {
+        'columns':          list(df.columns),
+        'sample_rows':      sample_rows.to_dict(orient='records'),
+        'suggested_mapping': suggest_column_mapping(df) if profile else {},
+        'column_profiles':  profile_dataframe(df) if profile else None,
+        'total_rows':       total_rows - removed_blank_rows,
+        'raw_rows':         total_rows,
+        'removed_blank_rows': removed_blank_rows,
+        'row_count_estimated': False,
     }
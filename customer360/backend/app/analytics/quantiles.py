@@ -0,0 +1,163 @@
+"""
+Shared quantile summaries for the RFM metrics and transaction amounts.
+
+Scoring, RFM statistics, segment labelling and winsorisation all need quantiles
+or ranks of the same few columns. Each used to sort the full column again for
+every cut. A QuantileSummary is built once per column and answers every
+quantile and rank query after that: exactly (one sort) while the column is
+small, and from a mergeable KLL sketch with a bounded rank error beyond
+QUANTILE_EXACT_ROWS values.
+
+Usage:
+    quantiles = column_quantiles(rfm)
+    stats = get_rfm_statistics(rfm, quantiles=quantiles)
+    segments = analyze_clusters(rfm, labels, quantiles=quantiles)
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..config import QUANTILE_EXACT_ROWS, QUANTILE_RANK_ERROR
+from .sketches import KLLSketch
+
+# Columns summarised by default: the RFM metrics
+RFM_METRICS = ('recency', 'frequency', 'monetary')
+
+
+def _linear_quantiles(sorted_values: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """numpy's default ('linear') quantiles of an already sorted array, without re-partitioning it."""
+    position = q * (sorted_values.size - 1)
+    below = np.floor(position).astype(np.intp)
+    above = np.minimum(below + 1, sorted_values.size - 1)
+    gamma = position - below
+    low, high = sorted_values[below], sorted_values[above]
+    difference = high - low
+    # Same interpolation as numpy, so exact summaries match Series.quantile
+    return np.where(gamma >= 0.5, high - difference * (1 - gamma), low + difference * gamma)
+
+
+class QuantileSummary:
+    """
+    Quantiles and ranks of one numeric column, mergeable across chunks.
+
+    Values are kept as they are while there are at most `exact_limit` of them,
+    and quantiles then match Series.quantile exactly. Past the limit they are
+    folded into a KLLSketch whose rank error is within `rank_error` of the count.
+    Missing values are skipped.
+    """
+
+    def __init__(self, exact_limit: int = QUANTILE_EXACT_ROWS, rank_error: float = QUANTILE_RANK_ERROR):
+        self.exact_limit = exact_limit
+        self.rank_error = rank_error
+        self.count = 0
+        self.sketch: Optional[KLLSketch] = None
+        self._values: List[np.ndarray] = []
+        self._sorted: Optional[np.ndarray] = None
+        self._distinct: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def of(cls, values, **kwargs) -> "QuantileSummary":
+        """Summary of a Series or array in one go."""
+        return cls(**kwargs).add(values)
+
+    @property
+    def exact(self) -> bool:
+        return self.sketch is None
+
+    def _to_sketch(self) -> None:
+        self.sketch = KLLSketch(KLLSketch.k_for_rank_error(self.rank_error))
+        for values in self._values:
+            self.sketch.add(values)
+        self._values = []
+        self._sorted = None
+        self._distinct = None
+
+    def add(self, values) -> "QuantileSummary":
+        """Fold a chunk of values into the summary."""
+        if isinstance(values, pd.Series):
+            values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += int(values.size)
+        if self.sketch is not None:
+            self.sketch.add(values)
+            return self
+        self._values.append(values)
+        self._sorted = None
+        self._distinct = None
+        if self.count > self.exact_limit:
+            self._to_sketch()
+        return self
+
+    def merge(self, other: "QuantileSummary") -> "QuantileSummary":
+        """Combine with a summary of other values of the same column."""
+        if other.count == 0:
+            return self
+        self.count += other.count
+        if self.sketch is None and other.sketch is None and self.count <= self.exact_limit:
+            self._values.extend(other._values)
+            self._sorted = None
+            self._distinct = None
+            return self
+        if self.sketch is None:
+            self._to_sketch()
+        if other.sketch is not None:
+            self.sketch.merge(other.sketch)
+        else:
+            for values in other._values:
+                self.sketch.add(values)
+        return self
+
+    def sorted_values(self) -> np.ndarray:
+        """All values in order (exact summaries only); sorted once and reused."""
+        if self._sorted is None:
+            values = np.concatenate(self._values) if self._values else np.empty(0)
+            self._sorted = np.sort(values)
+            self._values = [self._sorted]
+        return self._sorted
+
+    def quantile(self, q):
+        """
+        Value(s) at quantile(s) `q` in [0, 1], NaN when there are no values.
+
+        Exact summaries interpolate linearly like Series.quantile; sketched ones
+        return a retained value within the rank error.
+        """
+        if self.sketch is not None:
+            return self.sketch.quantile(q)
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+        return _linear_quantiles(self.sorted_values(), q)[()]
+
+    def count_below(self, values) -> np.ndarray:
+        """How many summarised values are strictly less than each of `values`."""
+        values = np.asarray(values, dtype=np.float64)
+        if self.sketch is not None:
+            return self.sketch.count_below(values)
+        if self._distinct is None:
+            # Search the distinct values rather than every value: far fewer for
+            # day counts and order counts, and the lookups stay in cache
+            ordered = self.sorted_values()
+            starts = np.flatnonzero(np.diff(ordered, prepend=-np.inf))
+            self._distinct = (ordered[starts], np.append(starts, ordered.size))
+        distinct, below = self._distinct
+        return below[np.searchsorted(distinct, values, side='left')]
+
+    def count_above(self, values) -> np.ndarray:
+        """How many summarised values are strictly greater than each of `values`."""
+        values = np.asarray(values, dtype=np.float64)
+        # Strictly below the next float up is at most the value itself
+        return self.count - self.count_below(np.nextafter(values, np.inf))
+
+
+def column_quantiles(
+    df: pd.DataFrame,
+    columns: Iterable[str] = RFM_METRICS,
+    **kwargs,
+) -> Dict[str, QuantileSummary]:
+    """One QuantileSummary per column of `df` (columns it lacks are skipped)."""
+    return {column: QuantileSummary.of(df[column], **kwargs) for column in columns if column in df.columns}
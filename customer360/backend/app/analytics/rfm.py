@@ -12,24 +12,195 @@ from typing import Tuple, Dict, Any, Optional
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 import logging
 
+from .quantiles import QuantileSummary
+
 logger = logging.getLogger(__name__)
 
+# NaT as int64 nanoseconds, and nanoseconds per day
+_NAT_NS = np.iinfo(np.int64).min
+_NS_PER_DAY = 24 * 3600 * 10**9
 
-def compute_rfm(
+
+# Columns of compute_rfm's output
+RFM_COLUMNS = ['customer_id', 'recency', 'frequency', 'monetary']
+
+
+# Columns of aggregate_customers' output: the per-customer state every feature
+# is derived from. Each merges across batches of transactions (min, max, sums).
+AGGREGATE_COLUMNS = ['customer_id', 'first_purchase_date', 'last_purchase_date', 'monetary', 'frequency']
+
+
+def aggregate_customers(
+    df: pd.DataFrame,
+    customer_col: str = 'customer_id',
+    date_col: str = 'invoice_date',
+    amount_col: str = 'amount',
+    invoice_col: Optional[str] = 'invoice_id'
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Reduce transactions to mergeable per-customer aggregates in one pass.
+    
+    Aggregates: first and last purchase date, total spend (monetary) and the
+    number of distinct invoices (frequency). Nothing is clipped here, so the
+    aggregates of separate batches of transactions add up exactly.
+    
+    Args:
+        df: Transaction DataFrame with customer, date, amount columns
+        customer_col: Name of customer ID column
+        date_col: Name of date column
+        amount_col: Name of amount column
+        invoice_col: Name of invoice/transaction ID column; when it is None or
+            missing, frequency counts dated transaction rows
+        
+    Returns:
+        Tuple of (aggregates DataFrame with one row per customer, sorted by ID, and
+        an int64 array giving each transaction's row in it, -1 without a customer)
+    """
+    # Ensure date column is datetime (without copying the caller's frame)
+    dates = df[date_col]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)
+    
+    # Compact frames carry an int32 customer_code (sorted like the display IDs);
+    # otherwise factorize the IDs the same way. Rows without a customer are dropped,
+    # as a groupby would.
+    if customer_col == 'customer_id' and 'customer_code' in df.columns:
+        row_codes = df['customer_code'].to_numpy()
+        customer_ids = df[customer_col].cat.categories
+    else:
+        row_codes, customer_ids = pd.factorize(df[customer_col], sort=True)
+    n_customers = len(customer_ids)
+    codes = row_codes
+    amounts = df[amount_col]
+    invoices = df[invoice_col] if invoice_col is not None and invoice_col in df.columns else None
+    has_customer = codes >= 0
+    if not has_customer.all():
+        codes = codes[has_customer]
+        dates = dates[has_customer]
+        amounts = amounts[has_customer]
+        invoices = invoices[has_customer] if invoices is not None else None
+    
+    # Every aggregate is a scatter-reduction over the same codes, one pass each with
+    # no per-customer Python: purchase dates as int64 nanoseconds (NaT is the int64
+    # minimum, so it never wins a max and is kept out of the min), spend as a
+    # float64 bincount, and frequency as distinct (customer, invoice) pairs or,
+    # without invoices, dated rows.
+    date_index = pd.DatetimeIndex(dates).as_unit('ns')
+    date_ns = date_index.asi8
+    dated = date_ns != _NAT_NS
+    last_ns = np.full(n_customers, _NAT_NS)
+    np.maximum.at(last_ns, codes, date_ns)
+    first_ns = np.full(n_customers, np.iinfo(np.int64).max)
+    np.minimum.at(first_ns, codes[dated], date_ns[dated])
+    
+    amounts = amounts.to_numpy(dtype=np.float64, na_value=np.nan)
+    monetary = np.bincount(codes, weights=np.nan_to_num(amounts, nan=0.0), minlength=n_customers)
+    
+    if invoices is not None:
+        invoice_codes, invoice_ids = pd.factorize(invoices)
+        n_invoices = max(len(invoice_ids), 1)
+        has_invoice = invoice_codes >= 0
+        pairs = pd.unique(codes[has_invoice].astype(np.int64) * n_invoices + invoice_codes[has_invoice])
+        frequency = np.bincount(pairs // n_invoices, minlength=n_customers)
+    else:
+        frequency = np.bincount(codes[dated], minlength=n_customers)
+    
+    # Customers absent from these rows (unused categories) are left out
+    seen = np.bincount(codes, minlength=n_customers) > 0
+    last_ns = last_ns[seen]
+    first_ns = np.where(last_ns == _NAT_NS, _NAT_NS, first_ns[seen])
+    
+    aggregates = pd.DataFrame({
+        'customer_id': customer_ids[seen],
+        'first_purchase_date': _ns_to_dates(first_ns, date_index.tz),
+        'last_purchase_date': _ns_to_dates(last_ns, date_index.tz),
+        'monetary': monetary[seen],
+        'frequency': frequency[seen],
+    })
+    
+    # Transaction rows point at their customer's row: positions follow the codes
+    # once the absent customers are skipped
+    positions = np.cumsum(seen) - 1
+    row_positions = np.where(row_codes >= 0, positions[row_codes], -1).astype(np.int64)
+    return aggregates, row_positions
+
+
+def _ns_to_dates(values: np.ndarray, tz=None) -> pd.DatetimeIndex:
+    """int64 nanoseconds since the epoch (UTC) as dates, in `tz` when given."""
+    dates = pd.DatetimeIndex(values.view('M8[ns]'))
+    if tz is not None:
+        dates = dates.tz_localize('UTC').tz_convert(tz)
+    return dates
+
+
+def features_from_aggregates(aggregates: pd.DataFrame, reference_date: datetime) -> pd.DataFrame:
+    """
+    Derive the customer features from aggregate_customers' output.
+    
+    Features:
+    - recency, frequency, monetary: as in compute_rfm
+    - first_purchase_date / last_purchase_date
+    - tenure_days: Whole days from first to last purchase
+    - avg_order_value: Spend per order (monetary / frequency)
+    - avg_interpurchase_days: Average days between orders (tenure over the gaps
+      between them); NaN for single-order customers
+    
+    Every feature is an array expression over the aggregates, so moving the
+    reference date only redoes one subtraction, never a pass over transactions.
+    
+    Args:
+        aggregates: DataFrame with AGGREGATE_COLUMNS
+        reference_date: Date to calculate recency from
+        
+    Returns:
+        DataFrame with one row per aggregates row
+    """
+    last_ns = pd.DatetimeIndex(aggregates['last_purchase_date']).as_unit('ns').asi8
+    first_ns = pd.DatetimeIndex(aggregates['first_purchase_date']).as_unit('ns').asi8
+    
+    # Recency is one subtraction over the whole array, floored to whole days;
+    # customers with no dated purchase get NaN
+    recency = (pd.Timestamp(reference_date).as_unit('ns').value - last_ns) // _NS_PER_DAY
+    tenure = (last_ns - first_ns) // _NS_PER_DAY
+    undated = last_ns == _NAT_NS
+    if undated.any():
+        recency = np.where(undated, np.nan, recency)
+        tenure = np.where(undated, np.nan, tenure)
+    
+    features = pd.DataFrame({
+        'customer_id': aggregates['customer_id'].array,
+        'recency': recency,
+        'frequency': aggregates['frequency'].array,
+        'monetary': aggregates['monetary'].array,
+        'first_purchase_date': aggregates['first_purchase_date'].array,
+        'last_purchase_date': aggregates['last_purchase_date'].array,
+        'tenure_days': tenure,
+    })
+    
+    # Handle edge cases
+    features['recency'] = features['recency'].clip(lower=0)  # No negative recency
+    features['frequency'] = features['frequency'].clip(lower=1)  # At least 1 transaction
+    features['monetary'] = features['monetary'].clip(lower=0)  # No negative monetary
+    
+    features['avg_order_value'] = features['monetary'] / features['frequency']
+    features['avg_interpurchase_days'] = (
+        features['tenure_days'] / (features['frequency'] - 1)
+    ).where(features['frequency'] > 1)
+    return features
+
+
+def compute_customer_features(
     df: pd.DataFrame,
     reference_date: Optional[datetime] = None,
     customer_col: str = 'customer_id',
     date_col: str = 'invoice_date',
     amount_col: str = 'amount',
-    invoice_col: str = 'invoice_id'
-) -> pd.DataFrame:
+    invoice_col: Optional[str] = 'invoice_id'
+) -> Tuple[pd.DataFrame, np.ndarray]:
     """
-    Compute RFM metrics for each customer.
+    Compute every per-customer feature in one pass over the transactions.
     
-    RFM Definition:
-    - Recency: Days since last purchase (lower is better)
-    - Frequency: Number of transactions/purchases
-    - Monetary: Total amount spent
+    See features_from_aggregates for the features produced.
     
     Args:
         df: Transaction DataFrame with customer, date, amount columns
@@ -37,119 +208,125 @@ def compute_rfm(
         customer_col: Name of customer ID column
         date_col: Name of date column
         amount_col: Name of amount column
-        invoice_col: Name of invoice/transaction ID column
+        invoice_col: Name of invoice/transaction ID column; when it is None or
+            missing, frequency counts dated transaction rows
         
     Returns:
-        DataFrame with customer_id, recency, frequency, monetary columns
+        Tuple of (features DataFrame with one row per customer, sorted by ID, and
+        an int64 array giving each transaction's row in it, -1 without a customer)
     """
     if df.empty:
         raise ValueError("Cannot compute RFM on empty DataFrame")
     
-    # Ensure date column is datetime
-    df = df.copy()
-    if not pd.api.types.is_datetime64_any_dtype(df[date_col]):
-        df[date_col] = pd.to_datetime(df[date_col])
+    aggregates, row_positions = aggregate_customers(
+        df,
+        customer_col=customer_col,
+        date_col=date_col,
+        amount_col=amount_col,
+        invoice_col=invoice_col,
+    )
     
     # Set reference date (default: day after last transaction)
     if reference_date is None:
-        reference_date = df[date_col].max() + pd.Timedelta(days=1)
+        reference_date = aggregates['last_purchase_date'].max() + pd.Timedelta(days=1)
     elif isinstance(reference_date, str):
         reference_date = pd.to_datetime(reference_date)
     
-    # Compute RFM metrics per customer
-    rfm = df.groupby(customer_col).agg({
-        date_col: lambda x: (reference_date - x.max()).days,  # Recency
-        invoice_col: 'nunique' if invoice_col in df.columns else 'count',  # Frequency
-        amount_col: 'sum'  # Monetary
-    }).reset_index()
-    
-    # Rename columns
-    rfm.columns = ['customer_id', 'recency', 'frequency', 'monetary']
-    
-    # Handle edge cases
-    rfm['recency'] = rfm['recency'].clip(lower=0)  # No negative recency
-    rfm['frequency'] = rfm['frequency'].clip(lower=1)  # At least 1 transaction
-    rfm['monetary'] = rfm['monetary'].clip(lower=0)  # No negative monetary
+    features = features_from_aggregates(aggregates, reference_date)
+    logger.info(f"Computed features for {len(features)} customers")
+    return features, row_positions
+
+
+def compute_rfm(
+    df: pd.DataFrame,
+    reference_date: Optional[datetime] = None,
+    customer_col: str = 'customer_id',
+    date_col: str = 'invoice_date',
+    amount_col: str = 'amount',
+    invoice_col: Optional[str] = 'invoice_id'
+) -> pd.DataFrame:
+    """
+    Compute RFM metrics for each customer.
     
-    logger.info(f"Computed RFM for {len(rfm)} customers")
+    RFM Definition:
+    - Recency: Days since last purchase (lower is better)
+    - Frequency: Number of transactions/purchases
+    - Monetary: Total amount spent
     
-    return rfm
+    Args:
+        df: Transaction DataFrame with customer, date, amount columns
+        reference_date: Date to calculate recency from (default: max date + 1)
+        customer_col: Name of customer ID column
+        date_col: Name of date column
+        amount_col: Name of amount column
+        invoice_col: Name of invoice/transaction ID column; when it is None or
+            missing, frequency counts dated transaction rows
+        
+    Returns:
+        DataFrame with customer_id, recency, frequency, monetary columns
+    """
+    features, _ = compute_customer_features(
+        df,
+        reference_date=reference_date,
+        customer_col=customer_col,
+        date_col=date_col,
+        amount_col=amount_col,
+        invoice_col=invoice_col,
+    )
+    return features[RFM_COLUMNS]
 
 
 def compute_rfm_scores(
     rfm: pd.DataFrame,
-    n_bins: int = 5
+    n_bins: int = 5,
+    quantiles: Optional[Dict[str, QuantileSummary]] = None
 ) -> pd.DataFrame:
     """
     Compute RFM scores (1-5) using quintile-based binning.
     
-    Note: For recency, lower values get higher scores (more recent = better).
-    For frequency and monetary, higher values get higher scores.
+    Each metric is binned against its quantile summary: a customer's score is the
+    share of customers with a strictly worse value, cut into n_bins equal bands.
+    Tied values always share a score, and a value held by most customers (e.g.
+    frequency 1, or a long recency) lands in the lowest band instead of failing
+    the quantile cut. On distinct values the bands match pd.qcut quintiles when
+    the customer count is a multiple of n_bins; otherwise band sizes still differ
+    by at most one, but a customer next to a cut can land one band off qcut.
+    
+    Note: For recency, lower values get higher scores (more recent = better), so
+    worse means strictly larger. For frequency and monetary, higher values get
+    higher scores and worse means strictly smaller. Missing values score 1.
     
     Args:
         rfm: DataFrame with recency, frequency, monetary columns
         n_bins: Number of bins for scoring (default 5)
+        quantiles: Summaries from column_quantiles to reuse; built from `rfm`
+            for any metric not given
         
     Returns:
         DataFrame with additional R_score, F_score, M_score columns
     """
     rfm = rfm.copy()
+    quantiles = quantiles or {}
     
-    # Recency: Lower is better, so we reverse the labels
-    try:
-        rfm['R_score'] = pd.qcut(
-            rfm['recency'], 
-            q=n_bins, 
-            labels=list(range(n_bins, 0, -1)),
-            duplicates='drop'
-        ).astype(int)
-    except ValueError:
-        # Handle case with too few unique values
-        rfm['R_score'] = pd.cut(
-            rfm['recency'],
-            bins=n_bins,
-            labels=list(range(n_bins, 0, -1)),
-            duplicates='drop'
-        ).astype(int)
-    
-    # Frequency: Higher is better
-    try:
-        rfm['F_score'] = pd.qcut(
-            rfm['frequency'],
-            q=n_bins,
-            labels=list(range(1, n_bins + 1)),
-            duplicates='drop'
-        ).astype(int)
-    except ValueError:
-        rfm['F_score'] = pd.cut(
-            rfm['frequency'],
-            bins=n_bins,
-            labels=list(range(1, n_bins + 1)),
-            duplicates='drop'
-        ).astype(int)
-    
-    # Monetary: Higher is better
-    try:
-        rfm['M_score'] = pd.qcut(
-            rfm['monetary'],
-            q=n_bins,
-            labels=list(range(1, n_bins + 1)),
-            duplicates='drop'
-        ).astype(int)
-    except ValueError:
-        rfm['M_score'] = pd.cut(
-            rfm['monetary'],
-            bins=n_bins,
-            labels=list(range(1, n_bins + 1)),
-            duplicates='drop'
-        ).astype(int)
-    
-    # Combined RFM score (concatenated string)
-    rfm['RFM_score'] = (
-        rfm['R_score'].astype(str) + 
-        rfm['F_score'].astype(str) + 
-        rfm['M_score'].astype(str)
-    )
+    scores = np.empty((len(rfm), 3))
+    for position, column in enumerate(['recency', 'frequency', 'monetary']):
+        values = rfm[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        summary = quantiles.get(column) or QuantileSummary.of(values)
+        # Recency: lower is better, so count the customers strictly above instead of
+        # reversing the scores, which would lift ties at the worst value off band 1
+        worse = summary.count_above(values) if column == 'recency' else summary.count_below(values)
+        scores[:, position] = np.where(
+            np.isnan(values), np.nan, np.minimum(1 + worse * n_bins // max(summary.count, 1), n_bins)
+        )
+    
+    scores = np.nan_to_num(scores, nan=1).astype(int)
+    rfm['R_score'] = scores[:, 0]
+    rfm['F_score'] = scores[:, 1]
+    rfm['M_score'] = scores[:, 2]
+    
+    # Combined RFM score (concatenated string), built from the n_bins digit labels
+    labels = np.array([str(score) for score in range(n_bins + 1)], dtype=object)
+    rfm['RFM_score'] = labels[scores[:, 0]] + labels[scores[:, 1]] + labels[scores[:, 2]]
     
     # Total RFM score (sum)
     rfm['RFM_total'] = rfm['R_score'] + rfm['F_score'] + rfm['M_score']
@@ -212,29 +389,37 @@ def normalize_rfm(
     return rfm_normalized, scaler
 
 
-def get_rfm_statistics(rfm: pd.DataFrame) -> Dict[str, Any]:
+def get_rfm_statistics(
+    rfm: pd.DataFrame,
+    quantiles: Optional[Dict[str, QuantileSummary]] = None
+) -> Dict[str, Any]:
     """
     Calculate descriptive statistics for RFM features.
     
     Args:
         rfm: DataFrame with RFM columns
+        quantiles: Summaries from column_quantiles to reuse for the median and
+            quartiles; built from `rfm` for any metric not given
         
     Returns:
         Dictionary with statistics for each RFM metric
     """
     stats = {}
+    quantiles = quantiles or {}
     
     for col in ['recency', 'frequency', 'monetary']:
         if col in rfm.columns:
             series = rfm[col]
+            summary = quantiles.get(col) or QuantileSummary.of(series)
+            median, q25, q75 = summary.quantile([0.5, 0.25, 0.75])
             stats[col] = {
                 'mean': float(series.mean()),
-                'median': float(series.median()),
+                'median': float(median),
                 'std': float(series.std()),
                 'min': float(series.min()),
                 'max': float(series.max()),
-                'q25': float(series.quantile(0.25)),
-                'q75': float(series.quantile(0.75)),
+                'q25': float(q25),
+                'q75': float(q75),
                 'skewness': float(series.skew()),
                 'kurtosis': float(series.kurtosis())
             }
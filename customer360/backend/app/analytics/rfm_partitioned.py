@@ -0,0 +1,529 @@
+"""
+Out-of-core, multi-process RFM over transaction files.
+
+compute_rfm needs every transaction in one frame on one core. For exports of
+several million lines the work is split by customer instead:
+
+1. Scatter: each source file is streamed chunk by chunk and every row is
+   appended to one of `partitions` spill files, picked by a hash of its
+   customer ID. Separate source files are scattered by separate processes,
+   and so are the parts of one large file: ranges of Parquet row groups or
+   Feather record batches, and byte ranges of an uncompressed CSV cut at
+   record boundaries. A compressed CSV can only be read from the start, so
+   it is scattered by one process.
+2. Aggregate: a pool of worker processes reduces each partition with
+   aggregate_customers.
+3. Combine: a customer's rows all land in one partition, so the partial
+   aggregates cover disjoint customers and simply concatenate; distinct
+   invoice counts stay exact.
+
+Memory is bounded by one source chunk while scattering and by one partition
+while aggregating, so raise `partitions` for larger inputs. Spill files are
+Arrow IPC files in a temporary directory that is removed afterwards.
+
+This is a library entry point for batch jobs and benchmarks; no API route or
+segmentation job calls it. It does none of preprocess_transaction_data's work:
+no column mapping suggestions, amount or currency text parsing, negative amount
+policy, synthetic IDs or dates, or MAX_ROWS limit. Callers pass the column names
+and files whose amounts are already numeric.
+"""
+import codecs
+import io
+import logging
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from ..config import CACHE_DIR, INGEST_CHUNK_ROWS, RFM_PARTITIONS, RFM_SPLIT_MB, RFM_WORKERS
+from .ingestion import (
+    ARROW_BLOCK_BYTES,
+    _arrow_to_pandas,
+    _columnar_to_pandas,
+    _open_feather,
+    compression_of,
+    detect_encoding,
+    iter_arrow_csv_chunks,
+    iter_columnar_chunks,
+    iter_csv_chunks,
+    pa,
+    pa_csv,
+    pa_parquet,
+    read_columnar_header,
+    read_csv_header,
+    resolve_reader_engine,
+    source_format,
+)
+from .preprocessing import infer_date_format
+from .rfm import aggregate_customers, features_from_aggregates
+from .sketches import hash_values
+
+logger = logging.getLogger(__name__)
+
+# Files picked up when a directory is given as the source
+PARTITION_SOURCE_SUFFIXES = ('.csv', '.csv.gz', '.zip', '.parquet', '.feather')
+
+# Canonical columns of the spill files
+_COLUMNS = ('customer_id', 'invoice_date', 'amount', 'invoice_id')
+
+
+def find_sources(sources: Union[str, Path, Sequence[Union[str, Path]]]) -> List[Path]:
+    """
+    Expand `sources` (a file, a directory of part files, or a list of either)
+    into the transaction files to read, in name order within each directory.
+    """
+    if isinstance(sources, (str, Path)):
+        sources = [sources]
+    files: List[Path] = []
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            files.extend(sorted(
+                path for path in source.iterdir()
+                if path.is_file() and not path.name.startswith('.')
+                and path.name.lower().endswith(PARTITION_SOURCE_SUFFIXES)
+            ))
+        elif source.is_file():
+            files.append(source)
+        else:
+            raise ValueError(f"Transaction source not found: {source}")
+    if not files:
+        raise ValueError("No transaction files found to compute RFM from")
+    return files
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only stream over bytes [start, stop) of a file."""
+
+    def __init__(self, path: Path, start: int, stop: int):
+        self._handle = open(path, 'rb')
+        self._handle.seek(start)
+        self._remaining = stop - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        read = self._handle.readinto(memoryview(buffer)[:size])
+        self._remaining -= read
+        return read
+
+    def close(self) -> None:
+        self._handle.close()
+        super().close()
+
+
+def _even_ranges(count: int, parts: int) -> List[Tuple[int, int]]:
+    bounds = [count * index // parts for index in range(parts + 1)]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def _csv_byte_ranges(path: Path, parts: int, block_size: int = ARROW_BLOCK_BYTES) -> List[Tuple[int, int]]:
+    """
+    Split the rows of a plain CSV file into about `parts` byte ranges.
+
+    Each range starts on a record boundary: the first newline past an even share
+    of the file that is not inside a quoted field, i.e. has an even number of
+    quote characters before it (escaped quotes are doubled, so they pair up).
+    The file is scanned once up to the last boundary.
+    """
+    size = path.stat().st_size
+    targets = [size * index // parts for index in range(1, parts)]
+    with open(path, 'rb') as handle:
+        header = handle.readline()
+        bounds = [len(header)]
+        offset, quotes, pending = len(header), header.count(b'"'), 0
+        while pending < len(targets):
+            block = handle.read(block_size)
+            if not block:
+                break
+            position = max(targets[pending] - offset, 0)
+            block_quotes = block.count(b'"', 0, position)
+            while pending < len(targets):
+                newline = block.find(b'\n', position)
+                if newline < 0:
+                    break
+                block_quotes += block.count(b'"', position, newline)
+                position = newline + 1
+                if (quotes + block_quotes) % 2:
+                    continue
+                bounds.append(offset + position)
+                while pending < len(targets) and targets[pending] <= offset + position:
+                    pending += 1
+                if pending < len(targets) and targets[pending] - offset > position:
+                    block_quotes += block.count(b'"', position, targets[pending] - offset)
+                    position = targets[pending] - offset
+            quotes += block.count(b'"')
+            offset += len(block)
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def _source_parts(path: Path, parts: int) -> List[Optional[Tuple[int, int]]]:
+    """
+    Independent parts of one source file for separate scatter processes: row
+    group or record batch index ranges of a Parquet or Feather file, or byte
+    ranges of a plain CSV. None stands for the whole file.
+    """
+    if parts < 2:
+        return [None]
+    file_format = source_format(str(path))
+    if file_format == 'parquet':
+        ranges = _even_ranges(pa_parquet.ParquetFile(str(path)).num_row_groups, parts)
+    elif file_format == 'feather':
+        ranges = _even_ranges(_open_feather(str(path)).num_record_batches, parts)
+    elif compression_of(str(path)) is None and not codecs.lookup(detect_encoding(str(path))).name.startswith(('utf-16', 'utf-32')):
+        # Byte-level line splitting needs an ASCII-compatible encoding
+        ranges = _csv_byte_ranges(path, parts)
+    else:
+        return [None]
+    return ranges if len(ranges) > 1 else [None]
+
+
+def _plan_parts(files: List[Path], workers: int) -> List[Tuple[Path, Optional[Tuple[int, int]]]]:
+    """
+    Split the sources into scatter tasks. A file is only split when it is larger
+    than an even share of the input per worker, into parts of at least
+    RFM_SPLIT_MB, so many similar part files are still read whole.
+    """
+    sizes = [path.stat().st_size for path in files]
+    total = max(sum(sizes), 1)
+    split_bytes = max(RFM_SPLIT_MB * 1024 * 1024, 1)
+    tasks = []
+    for path, size in zip(files, sizes):
+        parts = min(workers, size * workers // total, size // split_bytes)
+        tasks.extend((path, part) for part in _source_parts(path, parts))
+    return tasks
+
+
+def _iter_csv_range(path: Path, header: List[str], columns: List[str], encoding: str, start: int, stop: int):
+    # Rows of a byte range have no header line; the file's header names them, as
+    # in a whole-file read
+    if resolve_reader_engine() == 'pyarrow':
+        read_options = pa_csv.ReadOptions(
+            encoding=encoding, column_names=header, use_threads=True, block_size=ARROW_BLOCK_BYTES,
+        )
+        convert_options = pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in columns},
+            include_columns=columns,
+            strings_can_be_null=True,
+        )
+        with io.BufferedReader(_ByteRange(path, start, stop)) as source:
+            for batch in pa_csv.open_csv(source, read_options=read_options, convert_options=convert_options):
+                yield _arrow_to_pandas(batch)
+        return
+    with io.BufferedReader(_ByteRange(path, start, stop)) as source:
+        with pd.read_csv(
+            source, header=None, names=header, usecols=columns, dtype=str,
+            encoding=encoding, chunksize=INGEST_CHUNK_ROWS or None,
+        ) as reader:
+            yield from reader
+
+
+def _iter_columnar_range(path: Path, columns: List[str], start: int, stop: int):
+    if source_format(str(path)) == 'parquet':
+        parquet_file = pa_parquet.ParquetFile(str(path))
+        for index in range(start, stop):
+            yield _columnar_to_pandas(parquet_file.read_row_group(index, columns=columns))
+        return
+    reader = _open_feather(str(path))
+    for index in range(start, stop):
+        yield _columnar_to_pandas(reader.get_batch(index).select(columns))
+
+
+def _iter_source_chunks(path: Path, columns: List[str], part: Optional[Tuple[int, int]] = None):
+    """
+    Stream `columns` of a CSV, Parquet or Feather file (or one part of it, see
+    _source_parts) with no row or memory cap.
+    """
+    file_format = source_format(str(path))
+    if file_format in ('parquet', 'feather'):
+        header = read_columnar_header(str(path))
+    elif file_format == 'csv':
+        encoding = detect_encoding(str(path))
+        header = read_csv_header(str(path), encoding=encoding)
+    else:
+        raise ValueError(f"Partitioned RFM reads CSV, Parquet or Feather files, not {path.name}")
+
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ValueError(f"{path.name} is missing column(s): {', '.join(missing)}")
+
+    if part is not None:
+        if file_format == 'csv':
+            return _iter_csv_range(path, header, columns, encoding, *part)
+        return _iter_columnar_range(path, columns, *part)
+
+    # The dataset limits guard the in-memory pipeline; here only one chunk is held
+    unlimited = {'max_rows': sys.maxsize, 'max_memory_mb': None}
+    if file_format != 'csv':
+        return iter_columnar_chunks(str(path), columns=columns, **unlimited)
+    if resolve_reader_engine() == 'pyarrow':
+        usecols = sorted(header.index(column) for column in columns)
+        return iter_arrow_csv_chunks(str(path), encoding=encoding, usecols=usecols, **unlimited)
+    return iter_csv_chunks(str(path), encoding=encoding, usecols=columns, **unlimited)
+
+
+def _infer_sources_date_format(files: List[Path], date_col: str) -> Optional[str]:
+    """
+    Date format of the first chunk of text dates across `files`.
+
+    Chunks are parsed with this one format. Leaving pandas to guess per chunk
+    could read the same day/month-ambiguous dates differently in different chunks.
+    """
+    for path in files:
+        with closing(_iter_source_chunks(path, [date_col])) as chunks:
+            head = next(chunks, None)
+        if head is None or head[date_col].isna().all() or pd.api.types.is_datetime64_any_dtype(head[date_col]):
+            continue
+        date_format, parse_rate, sample_size = infer_date_format(head[date_col])
+        logger.info("Partitioned RFM: dates read as %s (%.0f%% of %d sampled)", date_format, parse_rate * 100, sample_size)
+        return date_format
+    return None
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    # IDs are matched as text, so 1042 in a Parquet file and '1042' in a CSV agree
+    if pd.api.types.is_string_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    return series.astype(str).where(series.notna())
+
+
+def _transaction_table(
+    chunk: pd.DataFrame,
+    customer_col: str,
+    date_col: str,
+    amount_col: str,
+    invoice_col: Optional[str],
+    date_format: Optional[str],
+) -> Tuple[Any, pd.Series]:
+    """
+    Parse one chunk into the canonical spill schema, dropping rows without a customer.
+
+    Returns:
+        Tuple of (Arrow table, its customer IDs as text)
+    """
+    customers = _as_text(chunk[customer_col])
+    keep = customers.notna().to_numpy()
+    if not keep.all():
+        chunk, customers = chunk[keep], customers[keep]
+
+    dates = chunk[date_col]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors='coerce', format=date_format)
+    dates = pd.DatetimeIndex(dates)
+    if dates.tz is not None:
+        # Spill files hold naive UTC so every source shares one schema
+        dates = dates.tz_convert('UTC').tz_localize(None)
+
+    arrays = {
+        'customer_id': pa.array(customers, type=pa.string(), from_pandas=True),
+        'invoice_date': pa.array(dates.as_unit('ns'), type=pa.timestamp('ns')),
+        'amount': pa.array(
+            pd.to_numeric(chunk[amount_col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan),
+            from_pandas=True,
+        ),
+    }
+    if invoice_col is not None:
+        arrays['invoice_id'] = pa.array(_as_text(chunk[invoice_col]), type=pa.string(), from_pandas=True)
+    return pa.table(arrays), customers
+
+
+def _partition_path(work_dir: Path, partition: int, task_index: int) -> Path:
+    return work_dir / f"part-{partition:04d}-{task_index:05d}.arrow"
+
+
+def _scatter_source(
+    path: Path,
+    part: Optional[Tuple[int, int]],
+    task_index: int,
+    work_dir: Path,
+    partitions: int,
+    columns: Dict[str, Optional[str]],
+    date_format: Optional[str],
+) -> Tuple[int, np.ndarray]:
+    """
+    Split one source file, or one part of it, into per-partition spill files.
+
+    Returns:
+        Tuple of (rows read, rows written per partition)
+    """
+    customer_col, date_col, amount_col, invoice_col = (columns[name] for name in _COLUMNS)
+    wanted = [column for column in (customer_col, date_col, amount_col, invoice_col) if column is not None]
+    rows_read = 0
+    counts = np.zeros(partitions, dtype=np.int64)
+    writers: Dict[int, Any] = {}
+    try:
+        for chunk in _iter_source_chunks(path, list(dict.fromkeys(wanted)), part):
+            rows_read += len(chunk)
+            table, customers = _transaction_table(chunk, customer_col, date_col, amount_col, invoice_col, date_format)
+            if table.num_rows == 0:
+                continue
+
+            # Group the chunk's rows by partition with one stable sort, then
+            # append each contiguous slice to that partition's file
+            partition_ids = (hash_values(customers) % np.uint64(partitions)).astype(np.int64)
+            order = np.argsort(partition_ids, kind='stable')
+            chunk_counts = np.bincount(partition_ids, minlength=partitions)
+            table = table.take(order)
+            offset = 0
+            for partition in np.flatnonzero(chunk_counts):
+                writer = writers.get(partition)
+                if writer is None:
+                    writer = pa.ipc.new_file(str(_partition_path(work_dir, partition, task_index)), table.schema)
+                    writers[partition] = writer
+                writer.write_table(table.slice(offset, chunk_counts[partition]))
+                offset += chunk_counts[partition]
+            counts += chunk_counts
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return rows_read, counts
+
+
+def _aggregate_partition(work_dir: Path, partition: int, has_invoices: bool) -> pd.DataFrame:
+    """Read every spill file of one partition and reduce it to per-customer aggregates."""
+    tables = []
+    for path in sorted(work_dir.glob(f"part-{partition:04d}-*.arrow")):
+        with pa.memory_map(str(path), 'r') as source:
+            tables.append(pa.ipc.open_file(source).read_all())
+    frame = _columnar_to_pandas(pa.concat_tables(tables))
+    aggregates, _ = aggregate_customers(
+        frame,
+        customer_col='customer_id',
+        date_col='invoice_date',
+        amount_col='amount',
+        invoice_col='invoice_id' if has_invoices else None,
+    )
+    return aggregates
+
+
+def partitioned_customer_features(
+    sources: Union[str, Path, Sequence[Union[str, Path]]],
+    reference_date: Optional[datetime] = None,
+    customer_col: str = 'customer_id',
+    date_col: str = 'invoice_date',
+    amount_col: str = 'amount',
+    invoice_col: Optional[str] = 'invoice_id',
+    date_format: Optional[str] = None,
+    partitions: int = RFM_PARTITIONS,
+    workers: int = RFM_WORKERS,
+    work_dir: Optional[Path] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """
+    Compute the customer features (see compute_customer_features) from
+    transaction files without loading them into one frame.
+
+    Args:
+        sources: A CSV, Parquet or Feather file, a directory of such part files,
+            or a list of either
+        reference_date: Date to calculate recency from (default: day after the
+            latest purchase)
+        customer_col, date_col, amount_col: Source column names
+        invoice_col: Invoice ID column; None counts dated rows as orders
+        date_format: strftime format of text dates (inferred once from the
+            first chunk of text dates when omitted, and used for every chunk);
+            unparseable dates count as undated rows
+        partitions: Number of customer hash partitions
+        workers: Worker processes; 1 runs everything in this process. Files
+            larger than an even share of the input per worker are split into
+            parts (see _source_parts) so one large export is scattered in parallel
+        work_dir: Parent directory for the spill files (default: the cache directory)
+        stats: Optional dict filled with row, partition and timing figures
+
+    Returns:
+        DataFrame with one row per customer, sorted by customer ID. IDs are text
+        and time-zone-aware dates are reported in UTC.
+
+    Raises:
+        ValueError: If a source is missing, lacks a column, or holds no
+            transactions with a customer ID
+    """
+    if pa is None:
+        raise ValueError("Partitioned RFM needs pyarrow installed on the server")
+    if partitions < 1 or workers < 1:
+        raise ValueError("partitions and workers must be at least 1")
+
+    files = find_sources(sources)
+    columns = dict(zip(_COLUMNS, (customer_col, date_col, amount_col, invoice_col)))
+    stats = stats if stats is not None else {}
+    if date_format is None:
+        date_format = _infer_sources_date_format(files, date_col)
+    tasks = _plan_parts(files, workers)
+    stats.update({
+        'sources': len(files),
+        'scatter_tasks': len(tasks),
+        'partitions': partitions,
+        'workers': workers,
+        'date_format': date_format,
+    })
+
+    # Spawned rather than forked workers: the API process runs threads
+    pool = (
+        ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        if workers > 1 else None
+    )
+    run = pool.map if pool is not None else map
+    with tempfile.TemporaryDirectory(prefix='rfm-partitions-', dir=work_dir or CACHE_DIR) as spill_dir:
+        spill_dir = Path(spill_dir)
+        try:
+            started = time.perf_counter()
+            scattered = list(run(
+                _scatter_source,
+                [path for path, _ in tasks],
+                [part for _, part in tasks],
+                range(len(tasks)),
+                [spill_dir] * len(tasks),
+                [partitions] * len(tasks),
+                [columns] * len(tasks),
+                [date_format] * len(tasks),
+            ))
+            rows_read = sum(rows for rows, _ in scattered)
+            partition_rows = np.sum([counts for _, counts in scattered], axis=0)
+            stats.update({
+                'rows': int(rows_read),
+                'rows_without_customer': int(rows_read - partition_rows.sum()),
+                'largest_partition_rows': int(partition_rows.max()),
+                'scatter_seconds': round(time.perf_counter() - started, 3),
+            })
+            if partition_rows.sum() == 0:
+                raise ValueError("No transactions with a customer ID found in the sources")
+
+            started = time.perf_counter()
+            filled = [int(partition) for partition in np.flatnonzero(partition_rows)]
+            partials = list(run(
+                _aggregate_partition,
+                [spill_dir] * len(filled),
+                filled,
+                [invoice_col is not None] * len(filled),
+            ))
+            stats['aggregate_seconds'] = round(time.perf_counter() - started, 3)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+    aggregates = pd.concat(partials, ignore_index=True)
+    aggregates['customer_id'] = aggregates['customer_id'].astype(object)
+    aggregates = aggregates.sort_values('customer_id', ignore_index=True)
+    if reference_date is None:
+        reference_date = aggregates['last_purchase_date'].max() + pd.Timedelta(days=1)
+
+    features = features_from_aggregates(aggregates, reference_date)
+    stats['customers'] = int(len(features))
+    logger.info(
+        "Partitioned RFM: %d rows, %d customers over %d partitions (%d workers)",
+        stats['rows'], stats['customers'], partitions, workers,
+    )
+    return features
@@ -0,0 +1,312 @@
+"""
+Incremental per-tenant RFM state.
+
+Most tenants upload a rolling export every week, which repeats the weeks they
+already sent. RFMState keeps each customer's mergeable aggregates (first and
+last purchase, spend, invoice count; see aggregate_customers) together with a
+fingerprint of every transaction already counted. A new upload is folded in by
+aggregating only its unseen transactions, and features for any reference date
+are derived from the aggregates without reading past transactions again.
+
+The state is stored as one .npz file per tenant, replaced atomically on save.
+Jobs hold the tenant's lock (tenant_state_lock) from load to save, so two
+overlapping uploads cannot each fold into the same old state and drop the
+other's transactions.
+"""
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..config import RFM_STATE_DIR
+from .rfm import AGGREGATE_COLUMNS, _NAT_NS, _ns_to_dates, aggregate_customers, features_from_aggregates
+from .sketches import hash_values
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: state updates are not locked
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored arrays change shape; older files are refused
+STATE_VERSION = 1
+
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+def tenant_state_path(user_id: int) -> Path:
+    """Where a tenant's RFM state lives."""
+    return RFM_STATE_DIR / f"user_{user_id}.npz"
+
+
+@contextmanager
+def tenant_state_lock(path: Path):
+    """
+    Hold an exclusive lock on the state at `path` for a load -> update -> save.
+
+    The lock is an flock on a sibling .lock file, so it covers jobs in other
+    worker processes as well as other threads. The lock file is left in place:
+    removing it would let a waiting job lock a file nobody else sees.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f"{path.name}.lock"), 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def transaction_fingerprints(
+    df: pd.DataFrame,
+    customer_col: str = 'customer_id',
+    date_col: str = 'invoice_date',
+    amount_col: str = 'amount',
+    invoice_col: Optional[str] = 'invoice_id'
+) -> np.ndarray:
+    """
+    64-bit fingerprint per transaction row, stable across uploads.
+
+    Rows are identified by their invoice ID (as text, so 1042 and '1042' match).
+    Rows without an invoice, or frames without an invoice column, fall back to
+    a hash of customer, date and amount.
+    """
+    def row_hashes(rows: pd.DataFrame) -> np.ndarray:
+        dates = pd.DatetimeIndex(pd.to_datetime(rows[date_col])).as_unit('ns').asi8
+        return pd.util.hash_pandas_object(pd.DataFrame({
+            'customer': rows[customer_col].astype(str).to_numpy(),
+            'date': dates,
+            'amount': rows[amount_col].to_numpy(dtype=np.float64, na_value=np.nan),
+        }), index=False).to_numpy(dtype=np.uint64)
+
+    if invoice_col is None or invoice_col not in df.columns:
+        return row_hashes(df)
+
+    invoices = df[invoice_col]
+    fingerprints = hash_values(invoices.astype(str))
+    missing = invoices.isna().to_numpy()
+    if missing.any():
+        fingerprints[missing] = row_hashes(df[missing])
+    return fingerprints
+
+
+class RFMState:
+    """
+    Mergeable per-customer RFM aggregates plus the fingerprints of the
+    transactions they were built from.
+
+    `update` only counts transactions whose fingerprint is new, so re-sending
+    overlapping exports (or the same file twice) never double-counts spend or
+    invoices. Fingerprints are exact 64-bit hashes kept sorted: 8 bytes per
+    transaction, with membership checked by binary search.
+
+    Usage:
+        with tenant_state_lock(path):
+            state = RFMState.load(path)
+            state.update(delta_df)
+            state.save(path)
+        features = state.features()
+    """
+
+    def __init__(
+        self,
+        aggregates: Optional[pd.DataFrame] = None,
+        fingerprints: Optional[np.ndarray] = None,
+        meta: Optional[Dict[str, Any]] = None,
+    ):
+        if aggregates is None:
+            aggregates = pd.DataFrame({
+                'customer_id': pd.Series(dtype=object),
+                'first_purchase_date': pd.Series(dtype='datetime64[ns]'),
+                'last_purchase_date': pd.Series(dtype='datetime64[ns]'),
+                'monetary': pd.Series(dtype=np.float64),
+                'frequency': pd.Series(dtype=np.int64),
+            })
+        self.aggregates = aggregates[AGGREGATE_COLUMNS].reset_index(drop=True)
+        self.fingerprints = fingerprints if fingerprints is not None else np.empty(0, dtype=np.uint64)
+        self.meta = {'batches': 0, 'rows_counted': 0, 'rows_skipped': 0, 'updated_at': None, **(meta or {})}
+
+    def __len__(self) -> int:
+        return len(self.aggregates)
+
+    @property
+    def customer_index(self) -> pd.Index:
+        return pd.Index(self.aggregates['customer_id'])
+
+    def seen(self, fingerprints: np.ndarray) -> np.ndarray:
+        """Which fingerprints are already counted in the state."""
+        if len(self.fingerprints) == 0:
+            return np.zeros(len(fingerprints), dtype=bool)
+        positions = np.searchsorted(self.fingerprints, fingerprints)
+        positions = np.minimum(positions, len(self.fingerprints) - 1)
+        return self.fingerprints[positions] == fingerprints
+
+    def update(
+        self,
+        df: pd.DataFrame,
+        customer_col: str = 'customer_id',
+        date_col: str = 'invoice_date',
+        amount_col: str = 'amount',
+        invoice_col: Optional[str] = 'invoice_id'
+    ) -> Dict[str, int]:
+        """
+        Fold the transactions in `df` that the state has not counted yet.
+
+        Returns:
+            Dictionary with rows, new_rows, duplicate_rows and new_customers
+        """
+        fingerprints = transaction_fingerprints(df, customer_col, date_col, amount_col, invoice_col)
+        fresh = ~self.seen(fingerprints)
+        new_rows = df[fresh] if not fresh.all() else df
+        customers_before = len(self)
+
+        if len(new_rows):
+            # IDs are matched as text across uploads; compact frames already are
+            customers = new_rows[customer_col]
+            if not isinstance(customers.dtype, pd.CategoricalDtype):
+                new_rows = new_rows.assign(**{customer_col: customers.where(customers.isna(), customers.astype(str))})
+            batch, _ = aggregate_customers(
+                new_rows,
+                customer_col=customer_col,
+                date_col=date_col,
+                amount_col=amount_col,
+                invoice_col=invoice_col,
+            )
+            self.merge(RFMState(batch, np.unique(fingerprints[fresh])))
+
+        stats = {
+            'rows': int(len(df)),
+            'new_rows': int(fresh.sum()),
+            'duplicate_rows': int(len(df) - fresh.sum()),
+            'new_customers': int(len(self) - customers_before),
+        }
+        self.meta['batches'] += 1
+        self.meta['rows_counted'] += stats['new_rows']
+        self.meta['rows_skipped'] += stats['duplicate_rows']
+        self.meta['updated_at'] = datetime.utcnow().isoformat()
+        logger.info(
+            "RFM state: %d new of %d rows, %d new customers",
+            stats['new_rows'], stats['rows'], stats['new_customers'],
+        )
+        return stats
+
+    def merge(self, other: "RFMState") -> "RFMState":
+        """
+        Combine with a state built from other transactions.
+
+        Aggregates add up, so the two states must not count the same
+        transactions; update() guarantees that for the batches it folds in.
+        """
+        left, right = self.aggregates, other.aggregates
+        customers = pd.Index(left['customer_id']).union(pd.Index(right['customer_id']))
+        first_ns = np.full(len(customers), _INT64_MAX)
+        last_ns = np.full(len(customers), _NAT_NS)
+        monetary = np.zeros(len(customers))
+        frequency = np.zeros(len(customers), dtype=np.int64)
+
+        tz = None
+        for side in (left, right):
+            positions = customers.get_indexer(side['customer_id'])
+            side_first = pd.DatetimeIndex(side['first_purchase_date']).as_unit('ns')
+            side_last = pd.DatetimeIndex(side['last_purchase_date']).as_unit('ns')
+            tz = tz or side_last.tz
+            # Each customer appears once per side, so plain fancy indexing is safe
+            first_ns[positions] = np.minimum(first_ns[positions], np.where(side_first.isna(), _INT64_MAX, side_first.asi8))
+            last_ns[positions] = np.maximum(last_ns[positions], side_last.asi8)
+            monetary[positions] += side['monetary'].to_numpy(dtype=np.float64)
+            frequency[positions] += side['frequency'].to_numpy(dtype=np.int64)
+        first_ns[first_ns == _INT64_MAX] = _NAT_NS
+
+        self.aggregates = pd.DataFrame({
+            'customer_id': customers,
+            'first_purchase_date': _ns_to_dates(first_ns, tz),
+            'last_purchase_date': _ns_to_dates(last_ns, tz),
+            'monetary': monetary,
+            'frequency': frequency,
+        })
+        self.fingerprints = np.union1d(self.fingerprints, other.fingerprints)
+        return self
+
+    def reference_date(self) -> pd.Timestamp:
+        """Default reference date: the day after the latest purchase on record."""
+        return self.aggregates['last_purchase_date'].max() + pd.Timedelta(days=1)
+
+    def features(self, reference_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Customer features (see features_from_aggregates) as of `reference_date`."""
+        if reference_date is None:
+            reference_date = self.reference_date()
+        return features_from_aggregates(self.aggregates, reference_date)
+
+    def row_positions(self, df: pd.DataFrame, customer_col: str = 'customer_id') -> np.ndarray:
+        """Each transaction's row in features(), -1 for rows without a known customer."""
+        codes, customers = pd.factorize(df[customer_col])
+        positions = self.customer_index.get_indexer(pd.Index(customers).astype(str))
+        return np.where(codes >= 0, positions[codes], -1).astype(np.int64)
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts and the purchase-date range covered by the state."""
+        return {
+            'customers': len(self),
+            'transactions': int(len(self.fingerprints)),
+            'first_purchase_date': self.aggregates['first_purchase_date'].min() if len(self) else None,
+            'last_purchase_date': self.aggregates['last_purchase_date'].max() if len(self) else None,
+            'total_revenue': float(self.aggregates['monetary'].sum()),
+            **self.meta,
+        }
+
+    def save(self, path: Path) -> None:
+        """Write the state to `path`, replacing any previous file atomically."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        last = pd.DatetimeIndex(self.aggregates['last_purchase_date']).as_unit('ns')
+        first = pd.DatetimeIndex(self.aggregates['first_purchase_date']).as_unit('ns')
+        meta = {**self.meta, 'version': STATE_VERSION, 'tz': str(last.tz) if last.tz is not None else None}
+        temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, 'wb') as handle:
+                np.savez(
+                    handle,
+                    customer_id=self.aggregates['customer_id'].to_numpy(dtype=str),
+                    first_ns=first.asi8,
+                    last_ns=last.asi8,
+                    monetary=self.aggregates['monetary'].to_numpy(dtype=np.float64),
+                    frequency=self.aggregates['frequency'].to_numpy(dtype=np.int64),
+                    fingerprints=self.fingerprints,
+                    meta=np.array(json.dumps(meta)),
+                )
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path: Path) -> "RFMState":
+        """Read a saved state; a missing file gives an empty state."""
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                arrays = {name: stored[name] for name in stored.files}
+        except FileNotFoundError:
+            return cls()
+
+        meta = json.loads(str(arrays['meta']))
+        if meta.pop('version', None) != STATE_VERSION:
+            raise ValueError("Stored RFM state was written by an incompatible version; reset it and re-upload")
+        tz = meta.pop('tz', None)
+        aggregates = pd.DataFrame({
+            'customer_id': arrays['customer_id'].astype(object),
+            'first_purchase_date': _ns_to_dates(arrays['first_ns'], tz),
+            'last_purchase_date': _ns_to_dates(arrays['last_ns'], tz),
+            'monetary': arrays['monetary'],
+            'frequency': arrays['frequency'],
+        })
+        return cls(aggregates, arrays['fingerprints'], meta)
@@ -7,9 +7,11 @@ recommended actions that Ghanaian SME owners can understand.
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 
+from .quantiles import QuantileSummary
+
 logger = logging.getLogger(__name__)
 
 
@@ -226,7 +228,8 @@ def label_segment(
 
 def analyze_clusters(
     rfm: pd.DataFrame,
-    labels: np.ndarray
+    labels: np.ndarray,
+    quantiles: Optional[Dict[str, QuantileSummary]] = None
 ) -> List[Dict[str, Any]]:
     """
     Analyze clusters and assign segment labels with recommendations.
@@ -234,29 +237,25 @@ def analyze_clusters(
     Args:
         rfm: DataFrame with RFM values and customer IDs
         labels: Cluster labels for each customer
+        quantiles: Summaries from column_quantiles to reuse for the population
+            percentiles; built from `rfm` for any metric not given
         
     Returns:
         List of cluster analysis dictionaries
     """
     rfm = rfm.copy()
     rfm['cluster'] = labels
+    quantiles = quantiles or {}
     
-    # Calculate population percentiles for reference
-    recency_percentiles = {
-        'p25': rfm['recency'].quantile(0.25),
-        'p50': rfm['recency'].quantile(0.50),
-        'p75': rfm['recency'].quantile(0.75)
-    }
-    frequency_percentiles = {
-        'p25': rfm['frequency'].quantile(0.25),
-        'p50': rfm['frequency'].quantile(0.50),
-        'p75': rfm['frequency'].quantile(0.75)
-    }
-    monetary_percentiles = {
-        'p25': rfm['monetary'].quantile(0.25),
-        'p50': rfm['monetary'].quantile(0.50),
-        'p75': rfm['monetary'].quantile(0.75)
-    }
+    # Population percentiles for reference, from each metric's quantile summary
+    percentiles = {}
+    for column in ['recency', 'frequency', 'monetary']:
+        summary = quantiles.get(column) or QuantileSummary.of(rfm[column])
+        p25, p50, p75 = summary.quantile([0.25, 0.50, 0.75])
+        percentiles[column] = {'p25': p25, 'p50': p50, 'p75': p75}
+    recency_percentiles = percentiles['recency']
+    frequency_percentiles = percentiles['frequency']
+    monetary_percentiles = percentiles['monetary']
     
     total_customers = len(rfm)
     clusters = []
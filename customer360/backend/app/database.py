@@ -117,6 +117,9 @@ def ensure_job_storage_columns():
             "storage_bucket": "TEXT",
             "storage_object_path": "TEXT",
             "storage_public_url": "TEXT",
+            "upload_sha256": "TEXT",
+            "upload_size_bytes": "INTEGER",
+            "preprocess_cache_key": "TEXT",
             "progress_percent": "INTEGER",
             "progress_stage": "TEXT",
             "progress_message": "TEXT",
@@ -132,6 +135,9 @@ def ensure_job_storage_columns():
             "storage_bucket": "VARCHAR(255)",
             "storage_object_path": "VARCHAR(500)",
             "storage_public_url": "VARCHAR(1000)",
+            "upload_sha256": "VARCHAR(64)",
+            "upload_size_bytes": "BIGINT",
+            "preprocess_cache_key": "VARCHAR(64)",
             "progress_percent": "INT",
             "progress_stage": "VARCHAR(100)",
             "progress_message": "TEXT",
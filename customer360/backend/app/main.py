@@ -18,6 +18,7 @@ import joblib
 from .database import init_db
 from .routes import api_router
 from .config import ALLOWED_ORIGINS, ALLOW_CREDENTIALS, DEBUG, ENVIRONMENT, MODELS_DIR
+from .middleware import UploadSizeLimitMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -109,6 +110,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized form uploads before Starlette spools their bodies to disk
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # Include API routes
 app.include_router(api_router, prefix="/api")
 
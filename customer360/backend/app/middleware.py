@@ -0,0 +1,59 @@
+"""
+ASGI middleware applied to the whole API.
+
+Form uploads are parsed by Starlette before any route code or dependency runs,
+and the parser spools the whole multipart body to a temporary file first. The
+size limit in stream_upload therefore only fired after an oversized body had
+been received in full. UploadSizeLimitMiddleware rejects such bodies up front
+from their Content-Length, and counts the bytes of bodies sent without one.
+"""
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from .config import MAX_FILE_SIZE_MB
+
+# Room for the multipart boundaries and the small form fields sent beside the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+def _too_large_detail() -> str:
+    return f"File is larger than the {MAX_FILE_SIZE_MB} MB upload limit"
+
+
+class UploadSizeLimitMiddleware:
+    """Answer 413 to multipart requests whose body exceeds MAX_FILE_SIZE_MB plus form overhead."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in {"POST", "PUT"}:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = MAX_FILE_SIZE_MB * 1024 * 1024 + FORM_OVERHEAD_BYTES
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            response = JSONResponse({"detail": _too_large_detail()}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            # Bodies without a usable Content-Length (chunked) are cut off once they
+            # pass the limit; the route turns the exception into a 413 response.
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=_too_large_detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
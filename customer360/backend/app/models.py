@@ -1,13 +1,13 @@
 """
 SQLAlchemy models for Customer360.
-Defines User and Job tables.
+Defines User, Job and MappingMemory tables.
 MySQL-compatible schema.
 
 The Job table is the bridge between the PHP pages and Python worker: it stores the
 upload, progress, generated files, analytics summary, and cached Groq narrative.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text, Float, TIMESTAMP
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text, Float, TIMESTAMP, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -30,6 +30,7 @@ class User(Base):
 
     # Relationship to jobs
     jobs = relationship("Job", back_populates="owner", cascade="all, delete-orphan")
+    mapping_memories = relationship("MappingMemory", back_populates="owner", cascade="all, delete-orphan")
 
 
 class Job(Base):
@@ -59,6 +60,9 @@ class Job(Base):
     storage_bucket = Column(String(255), nullable=True)
     storage_object_path = Column(String(500), nullable=True)
     storage_public_url = Column(String(1000), nullable=True)
+    upload_sha256 = Column(String(64), nullable=True, index=True)  # Content hash, for cache keys and dedup
+    upload_size_bytes = Column(Integer, nullable=True)
+    preprocess_cache_key = Column(String(64), nullable=True)  # Cached canonical frame, evicted with the job
     output_path = Column(String(500), nullable=True)
     
     # Job configuration
@@ -91,3 +95,30 @@ class Job(Base):
     
     # Relationship to user
     owner = relationship("User", back_populates="jobs")
+
+
+class MappingMemory(Base):
+    """
+    Column mapping and parser options a user confirmed for one file layout.
+
+    Keyed by a normalised header signature, so the next upload of the same POS
+    export layout can reuse the mapping instead of being matched and profiled again.
+    """
+    __tablename__ = "mapping_memories"
+    __table_args__ = (
+        UniqueConstraint("user_id", "header_signature", name="uq_mapping_memory_user_signature"),
+        {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    header_signature = Column(String(64), nullable=False, index=True)  # SHA-256 hex
+
+    # Mapping plus parser options (JSON stored as text), in the with-mapping form's shape
+    column_mapping = Column(Text, nullable=False)
+    use_count = Column(Integer, default=0)
+
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    last_used_at = Column(TIMESTAMP, nullable=True)
+
+    owner = relationship("User", back_populates="mapping_memories")
@@ -7,6 +7,7 @@ from fastapi import APIRouter
 from .auth import router as auth_router
 from .analysis import router as analysis_router
 from .jobs import router as jobs_router
+from .uploads import router as uploads_router
 
 # Create main API router
 api_router = APIRouter()
@@ -14,4 +15,5 @@ api_router = APIRouter()
 # Include sub-routers
 api_router.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 api_router.include_router(jobs_router, prefix="/jobs", tags=["Jobs"])
+api_router.include_router(uploads_router, prefix="/jobs/uploads", tags=["Jobs"])
 api_router.include_router(analysis_router, prefix="/analysis", tags=["Analysis"])
@@ -174,23 +174,17 @@ def build_chart_payload(job_id: str, results: Dict[str, Any]) -> Dict[str, Optio
 
 
 def build_segment_payload(pipeline: SegmentationPipeline, results: Dict[str, Any]) -> list[Dict[str, Any]]:
-    df = pipeline.df.copy()
-    customer_segments = (
-        pd.DataFrame({
-            "customer_id": pipeline.rfm["customer_id"].astype(str),
-            "cluster_id": pipeline.labels,
-        })
-    )
-
-    if "customer_id" in df.columns:
-        df["customer_id"] = df["customer_id"].astype(str)
-        df = df.merge(customer_segments, on="customer_id", how="left")
+    df = pipeline.df
+    # Each row already knows its customer's position in the RFM table, which the
+    # labels follow, so clusters reach the rows without a lookup or merge.
+    labels = np.append(np.asarray(pipeline.labels, dtype=float), np.nan)
+    row_clusters = labels[pipeline.customer_rows]
 
     total_revenue = float(results.get("meta", {}).get("total_revenue", 0) or 0)
     payload = []
     for segment in results.get("segments", []):
         cluster_id = segment["cluster_id"]
-        cluster_df = df[df["cluster_id"] == cluster_id] if "cluster_id" in df.columns else pd.DataFrame()
+        cluster_df = df[row_clusters == cluster_id]
         cluster_revenue = float(segment.get("total_revenue", 0) or 0)
         payload.append({
             "name": segment["segment_label"],
@@ -229,6 +223,11 @@ def build_analysis_response(job: Job, pipeline: SegmentationPipeline, results: D
         "job_id": job.job_id,
         "meta": {
             "n_transactions": meta.get("num_transactions"),
+            # "history" for incremental jobs: counts and revenue cover the stored
+            # history, while the EDA summary and each segment's discount, promo and
+            # top-item figures cover this upload's n_upload_transactions rows
+            "scope": meta.get("scope", "upload"),
+            "n_upload_transactions": meta.get("upload_transactions", meta.get("num_transactions")),
             "n_customers": meta.get("num_customers"),
             "n_segments": meta.get("num_clusters"),
             "best_algorithm": meta.get("clustering_method", "kmeans").replace("_", " ").title(),
@@ -4,7 +4,9 @@ Handles file upload, job status, results, and report generation.
 """
 import os
 import csv
+import hashlib
 import json
+import logging
 import math
 import uuid
 import shutil
@@ -14,21 +16,35 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks
 from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..models import User, Job
+from ..models import User, Job, MappingMemory
 from ..schemas import (
     JobCreate, JobStatus, JobSummary, JobResults, CSVPreview,
-    ColumnMapping, ClusterSummary, RFMDistribution
+    ColumnMapping, ClusterSummary, RFMDistribution, RFMStateSummary, SQLJobCreate, SQLSourceQuery
 )
 from ..auth import get_current_user
-from ..config import UPLOAD_DIR, OUTPUT_DIR, MAX_FILE_SIZE_MB, ALLOWED_EXTENSIONS
+from ..config import (
+    UPLOAD_DIR, OUTPUT_DIR, MAX_FILE_SIZE_MB, MAX_UNCOMPRESSED_MB, ALLOWED_EXTENSIONS, UPLOAD_CHUNK_KB,
+)
+from ..analytics.ingestion import compression_of, source_format, source_size, sql_sources_for, write_sql_source
 from ..analytics.groq_analysis import GroqRateLimiter, generate_llm_analysis
-from ..analytics.preprocessing import build_mapping_validation_report, get_csv_preview
+from ..analytics.preprocessing import (
+    PREPROCESS_CACHE,
+    build_mapping_validation_report,
+    get_csv_preview,
+    header_signature,
+    preprocess_cache_key,
+    read_columns,
+    remap_to_header,
+)
 from ..analytics.pipeline import run_pipeline
+from ..analytics.rfm_state import RFMState, tenant_state_lock, tenant_state_path
 from ..report import generate_report
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 def update_job_progress(db: Session, job: Job, percent: int, stage: str, message: str) -> None:
@@ -180,15 +196,76 @@ def sanitize_customer_export_csv(csv_path: Path) -> None:
 
 def validate_file(file: UploadFile) -> None:
     """Validate uploaded file."""
-    # Check extension
-    ext = Path(file.filename).suffix.lower()
-    if ext not in ALLOWED_EXTENSIONS:
+    validate_filename(file.filename)
+
+
+def validate_filename(filename: Optional[str]) -> None:
+    """Reject file names without an allowed extension."""
+    # ".csv.gz" spans two suffixes, so match the name's ending
+    name = Path(filename or "").name.lower()
+    if not name.endswith(tuple(ALLOWED_EXTENSIONS)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
+            detail=f"Invalid file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
         )
 
 
+def _upload_too_large(limit_mb: Optional[int] = None, what: str = "upload") -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File is larger than the {MAX_FILE_SIZE_MB if limit_mb is None else limit_mb} MB {what} limit"
+    )
+
+
+def check_compressed_upload(path: Path) -> None:
+    """Reject a stored .csv.gz/.zip upload that is not a valid archive or inflates past MAX_UNCOMPRESSED_MB."""
+    if not compression_of(path):
+        return
+    try:
+        inflated_bytes = source_size(str(path))
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    if inflated_bytes > MAX_UNCOMPRESSED_MB * 1024 * 1024:
+        raise _upload_too_large(MAX_UNCOMPRESSED_MB, "decompressed size")
+
+
+def stream_upload(file: UploadFile, destination: Path) -> dict:
+    """
+    Copy an upload to disk in fixed-size chunks, hashing and counting as it goes.
+
+    Raises 413 as soon as the copy passes MAX_FILE_SIZE_MB (or straight away when the
+    declared size already does), removing the partial file. Form uploads are also
+    cut off before parsing by UploadSizeLimitMiddleware; this is the exact check. Compressed uploads must
+    also declare an inflated size within MAX_UNCOMPRESSED_MB; readers enforce that
+    limit again while decompressing. Returns the SHA-256 of the content, its size, and
+    the number of line breaks in the stored bytes (an upper bound on plain CSV rows).
+    """
+    limit = MAX_FILE_SIZE_MB * 1024 * 1024
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > limit:
+        raise _upload_too_large()
+
+    digest = hashlib.sha256()
+    size_bytes = 0
+    line_count = 0
+    try:
+        with open(destination, "wb") as buffer:
+            for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK_KB * 1024), b""):
+                size_bytes += len(chunk)
+                if size_bytes > limit:
+                    raise _upload_too_large()
+                digest.update(chunk)
+                line_count += chunk.count(b"\n")
+                buffer.write(chunk)
+
+        check_compressed_upload(destination)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+
+    return {"sha256": digest.hexdigest(), "size_bytes": size_bytes, "line_count": line_count}
+
+
 def store_upload_locally(file: UploadFile, upload_dir: Path) -> dict:
     """
     Save the uploaded file locally for processing.
@@ -196,11 +273,16 @@ def store_upload_locally(file: UploadFile, upload_dir: Path) -> dict:
     upload_dir.mkdir(parents=True, exist_ok=True)
 
     local_path = upload_dir / Path(file.filename).name
-    with open(local_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    return local_upload_record(local_path, stream_upload(file, local_path))
 
+
+def local_upload_record(local_path: Path, streamed: dict) -> dict:
+    """Describe an upload stored on local disk, from its path and stream_upload-style counts."""
     return {
         "local_path": str(local_path),
+        "sha256": streamed["sha256"],
+        "size_bytes": streamed["size_bytes"],
+        "line_count": streamed["line_count"],
         "storage_warning": None,
         "storage_provider": None,
         "storage_bucket": None,
@@ -209,6 +291,206 @@ def store_upload_locally(file: UploadFile, upload_dir: Path) -> dict:
     }
 
 
+def store_sql_source(payload: SQLSourceQuery, destination: Path, user: User) -> dict:
+    """
+    Write the query descriptor a SQL-sourced job or preview reads from: 404 unless the
+    source lists the user among its owners, 400 if the query is invalid.
+    """
+    if payload.connection not in sql_sources_for(user.email):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown SQL source '{payload.connection}'")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        write_sql_source(str(destination), payload.connection, payload.query)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    content = destination.read_bytes()
+    return {"sha256": hashlib.sha256(content).hexdigest(), "size_bytes": len(content), "line_count": 0}
+
+
+def queue_uploaded_job(
+    db: Session,
+    background_tasks: BackgroundTasks,
+    user: User,
+    job_id: str,
+    original_filename: str,
+    stored_upload: dict,
+    column_mapping: Optional[dict],
+    clustering_method: str,
+    include_comparison: bool,
+    progress_message: str,
+    incremental: bool = False,
+) -> JobStatus:
+    """
+    Create the job row for a stored upload, queue its segmentation run, and return
+    the initial status. Incremental jobs fold the upload into the user's stored
+    RFM state instead of analysing it on its own.
+    """
+    job_output_dir = OUTPUT_DIR / job_id
+    job_output_dir.mkdir(parents=True, exist_ok=True)
+
+    # SQL sources are never cached (see cached_preprocess_transaction_data)
+    cache_key = None
+    if PREPROCESS_CACHE.enabled and source_format(stored_upload["local_path"]) != "sql":
+        cache_key = preprocess_cache_key(stored_upload["local_path"], column_mapping, stored_upload["sha256"])
+
+    job = Job(
+        job_id=job_id,
+        user_id=user.id,
+        original_filename=original_filename,
+        upload_path=stored_upload["storage_object_path"] or stored_upload["local_path"],
+        local_upload_path=stored_upload["local_path"],
+        storage_provider=stored_upload["storage_provider"],
+        storage_bucket=stored_upload["storage_bucket"],
+        storage_object_path=stored_upload["storage_object_path"],
+        storage_public_url=stored_upload["storage_public_url"],
+        upload_sha256=stored_upload["sha256"],
+        upload_size_bytes=stored_upload["size_bytes"],
+        preprocess_cache_key=cache_key,
+        output_path=str(job_output_dir),
+        clustering_method=clustering_method,
+        include_comparison=include_comparison,
+        column_mapping=json.dumps(column_mapping) if column_mapping else None,
+        status="pending",
+        progress_percent=5,
+        progress_stage="queued",
+        progress_message=progress_message
+    )
+
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    # Start background processing
+    from ..config import DATABASE_URL
+    background_tasks.add_task(
+        run_segmentation_job,
+        job_id=job_id,
+        file_path=stored_upload["local_path"],
+        output_dir=str(job_output_dir),
+        column_mapping=column_mapping,
+        clustering_method=clustering_method,
+        include_comparison=include_comparison,
+        db_url=DATABASE_URL,
+        content_digest=stored_upload["sha256"],
+        rfm_state_path=str(tenant_state_path(user.id)) if incremental else None,
+    )
+
+    return JobStatus(
+        job_id=job.job_id,
+        status=job.status,
+        progress_percent=job.progress_percent,
+        progress_stage=job.progress_stage,
+        progress_message=job.progress_message,
+        created_at=job.created_at,
+        storage_provider=job.storage_provider,
+        storage_bucket=job.storage_bucket,
+        storage_object_path=job.storage_object_path,
+        storage_public_url=job.storage_public_url,
+        storage_warning=stored_upload.get("storage_warning"),
+    )
+
+
+def find_mapping_memory(
+    db: Session, user_id: int, file_path: str, sheet: Optional[str] = None
+) -> Optional[MappingMemory]:
+    """Return the mapping this user confirmed for the file's header layout, if any."""
+    signature = header_signature(read_columns(file_path, sheet=sheet))
+    return db.query(MappingMemory).filter(
+        MappingMemory.user_id == user_id,
+        MappingMemory.header_signature == signature,
+    ).first()
+
+
+def remember_mapping(
+    db: Session,
+    user_id: int,
+    file_path: str,
+    column_mapping: dict,
+    date_parsing: Optional[dict] = None,
+) -> MappingMemory:
+    """
+    Store the mapping and parser options a finished job ran with, keyed by its header.
+
+    The date format preprocessing actually used replaces an empty ("auto") one, so the
+    next upload of the layout parses its dates with that format directly.
+    """
+    remembered = dict(column_mapping)
+    if date_parsing and date_parsing.get('date_format'):
+        remembered['invoice_date_format'] = date_parsing['date_format']
+        if date_parsing.get('dayfirst') is not None:
+            remembered['dayfirst'] = bool(date_parsing['dayfirst'])
+
+    signature = header_signature(read_columns(file_path, sheet=column_mapping.get('sheet_name') or None))
+    memory = db.query(MappingMemory).filter(
+        MappingMemory.user_id == user_id,
+        MappingMemory.header_signature == signature,
+    ).first()
+    if memory is None:
+        memory = MappingMemory(user_id=user_id, header_signature=signature, use_count=0)
+        db.add(memory)
+    memory.column_mapping = json.dumps(remembered)
+    memory.last_used_at = datetime.utcnow()
+    db.commit()
+    return memory
+
+
+def build_preview(db: Session, user_id: int, file_path: str, sheet: Optional[str] = None) -> CSVPreview:
+    """
+    Preview a stored upload or SQL source for the mapping UI, preferring the mapping
+    the user confirmed for the same header over a fresh suggestion.
+    """
+    try:
+        memory = find_mapping_memory(db, user_id, file_path, sheet=sheet)
+
+        # Get preview
+        preview = get_csv_preview(file_path, profile=memory is None, sheet=sheet)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+    # Build suggested mapping
+    suggested = preview.get('suggested_mapping', {})
+    suggested_mapping = None
+    remembered_options = None
+
+    has_direct_amount = bool(suggested.get('amount'))
+    has_derived_amount = bool(suggested.get('quantity') and suggested.get('unit_price'))
+
+    if memory is not None:
+        remembered = json.loads(memory.column_mapping)
+        fields = {field: remembered.get(field) for field in ColumnMapping.model_fields}
+        suggested_mapping = ColumnMapping(**remap_to_header(fields, preview['columns']))
+        remembered_options = {key: value for key, value in remembered.items() if key not in ColumnMapping.model_fields}
+        memory.use_count = (memory.use_count or 0) + 1
+        memory.last_used_at = datetime.utcnow()
+        db.commit()
+    elif suggested.get('customer_id') and suggested.get('invoice_date') and suggested.get('invoice_id') and (has_direct_amount or has_derived_amount):
+        suggested_mapping = ColumnMapping(
+            customer_id=suggested['customer_id'],
+            invoice_date=suggested['invoice_date'],
+            invoice_id=suggested['invoice_id'],
+            amount=suggested.get('amount'),
+            quantity=suggested.get('quantity'),
+            unit_price=suggested.get('unit_price'),
+            product=suggested.get('product'),
+            category=suggested.get('category')
+        )
+
+    return CSVPreview(
+        columns=preview['columns'],
+        sample_rows=preview['sample_rows'],
+        suggested_mapping=suggested_mapping,
+        column_profiles=preview.get('column_profiles'),
+        total_rows=preview.get('total_rows'),
+        raw_rows=preview.get('raw_rows'),
+        removed_blank_rows=preview.get('removed_blank_rows'),
+        row_count_estimated=preview.get('row_count_estimated', False),
+        mapping_source="memory" if memory is not None else "suggested",
+        remembered_options=remembered_options,
+        sheets=preview.get('sheets'),
+        sheet_name=preview.get('sheet_name'),
+    )
+
+
 def run_segmentation_job(
     job_id: str,
     file_path: str,
@@ -216,7 +498,9 @@ def run_segmentation_job(
     column_mapping: Optional[dict],
     clustering_method: str,
     include_comparison: bool,
-    db_url: str
+    db_url: str,
+    content_digest: Optional[str] = None,
+    rfm_state_path: Optional[str] = None,
 ):
     """
     Background task to run the segmentation pipeline.
@@ -267,6 +551,8 @@ def run_segmentation_job(
             clustering_method=clustering_method,
             include_comparison=include_comparison,
             progress_callback=progress_callback,
+            content_digest=content_digest,
+            rfm_state_path=rfm_state_path,
         )
 
         # Respect cancellation if it happened while the job was running.
@@ -311,6 +597,8 @@ def run_segmentation_job(
         job.num_clusters = meta.get('num_clusters', 0)
         job.silhouette_score = meta.get('silhouette_score', 0)
         job.output_path = output_dir
+        # The key the pipeline actually used (the date part can roll over while queued)
+        job.preprocess_cache_key = results.get('preprocessing', {}).get('cache', {}).get('key', job.preprocess_cache_key)
         job.result_json = json.dumps(sanitize_json_payload(results), ensure_ascii=False, default=str)
         job.progress_percent = 100
         job.progress_stage = "completed"
@@ -324,6 +612,17 @@ def run_segmentation_job(
         )
         
         db.commit()
+
+        if column_mapping:
+            # Remembering the layout is a convenience; it must never fail a finished job.
+            try:
+                remember_mapping(
+                    db, job.user_id, file_path, column_mapping,
+                    results.get('preprocessing', {}).get('date_parsing'),
+                )
+            except Exception as exc:
+                db.rollback()
+                logger.warning("Could not remember column mapping for job %s: %s", job_id, exc)
         
     except Exception as e:
         # Update job with error
@@ -345,15 +644,18 @@ async def upload_file(
     file: UploadFile = File(...),
     clustering_method: str = Form(default="kmeans"),
     include_comparison: bool = Form(default=True),
+    incremental: bool = Form(default=False),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Upload a CSV file and start segmentation analysis.
+    Upload a transaction file and start segmentation analysis.
     
-    - **file**: CSV file with transaction data
+    - **file**: CSV, Parquet, Feather or Excel (.xlsx) file with transaction data
     - **clustering_method**: Algorithm to use (kmeans, gmm, hierarchical)
     - **include_comparison**: Run all methods for comparison
+    - **incremental**: Add the file's new transactions to your stored customer
+      history and segment every customer on record
     """
     # Validate file
     validate_file(file)
@@ -361,77 +663,43 @@ async def upload_file(
     # Generate job ID
     job_id = str(uuid.uuid4())
     
-    # Create upload and output directories for this job
-    job_upload_dir = UPLOAD_DIR / job_id
-    job_output_dir = OUTPUT_DIR / job_id
-    job_upload_dir.mkdir(parents=True, exist_ok=True)
-    job_output_dir.mkdir(parents=True, exist_ok=True)
-    
     stored_upload = store_upload_locally(
         file=file,
-        upload_dir=job_upload_dir,
+        upload_dir=UPLOAD_DIR / job_id,
     )
     
-    # Create job record
-    job = Job(
+    return queue_uploaded_job(
+        db=db,
+        background_tasks=background_tasks,
+        user=current_user,
         job_id=job_id,
-        user_id=current_user.id,
         original_filename=file.filename,
-        upload_path=stored_upload["storage_object_path"] or stored_upload["local_path"],
-        local_upload_path=stored_upload["local_path"],
-        storage_provider=stored_upload["storage_provider"],
-        storage_bucket=stored_upload["storage_bucket"],
-        storage_object_path=stored_upload["storage_object_path"],
-        storage_public_url=stored_upload["storage_public_url"],
-        output_path=str(job_output_dir),
-        clustering_method=clustering_method,
-        include_comparison=include_comparison,
-        status="pending",
-        progress_percent=5,
-        progress_stage="queued",
-        progress_message="Upload received. Your analysis job is queued and waiting to start."
-    )
-
-    db.add(job)
-    db.commit()
-    db.refresh(job)
-
-    # Start background processing
-    from ..config import DATABASE_URL
-    background_tasks.add_task(
-        run_segmentation_job,
-        job_id=job_id,
-        file_path=stored_upload["local_path"],
-        output_dir=str(job_output_dir),
+        stored_upload=stored_upload,
         column_mapping=None,
         clustering_method=clustering_method,
         include_comparison=include_comparison,
-        db_url=DATABASE_URL
-    )
-    
-    return JobStatus(
-        job_id=job.job_id,
-        status=job.status,
-        progress_percent=job.progress_percent,
-        progress_stage=job.progress_stage,
-        progress_message=job.progress_message,
-        created_at=job.created_at,
-        storage_provider=job.storage_provider,
-        storage_bucket=job.storage_bucket,
-        storage_object_path=job.storage_object_path,
-        storage_public_url=job.storage_public_url,
-        storage_warning=stored_upload.get("storage_warning"),
+        progress_message="Upload received. Your analysis job is queued and waiting to start.",
+        incremental=incremental,
     )
 
 
 @router.post("/upload/preview", response_model=CSVPreview)
 async def preview_upload(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    sheet_name: Optional[str] = Form(default=None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
-    Upload a CSV file and get a preview for column mapping.
+    Upload a CSV, Parquet, Feather or Excel file and get a preview for column mapping.
     Returns column names, sample data, and suggested mapping.
+
+    - **sheet_name**: Worksheet to preview in an .xlsx workbook (the first by default);
+      the response lists the workbook's sheets
+
+    When the user has already run a file with the same header, the mapping and
+    parser options they confirmed then are returned instead of a fresh suggestion,
+    and column profiling is skipped.
     """
     validate_file(file)
     
@@ -440,40 +708,9 @@ async def preview_upload(
     temp_path.parent.mkdir(parents=True, exist_ok=True)
     
     try:
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Get preview
-        preview = get_csv_preview(str(temp_path))
-        
-        # Build suggested mapping
-        suggested = preview.get('suggested_mapping', {})
-        suggested_mapping = None
+        stream_upload(file, temp_path)
         
-        has_direct_amount = bool(suggested.get('amount'))
-        has_derived_amount = bool(suggested.get('quantity') and suggested.get('unit_price'))
-
-        if suggested.get('customer_id') and suggested.get('invoice_date') and suggested.get('invoice_id') and (has_direct_amount or has_derived_amount):
-            suggested_mapping = ColumnMapping(
-                customer_id=suggested['customer_id'],
-                invoice_date=suggested['invoice_date'],
-                invoice_id=suggested['invoice_id'],
-                amount=suggested.get('amount'),
-                quantity=suggested.get('quantity'),
-                unit_price=suggested.get('unit_price'),
-                product=suggested.get('product'),
-                category=suggested.get('category')
-            )
-        
-        return CSVPreview(
-            columns=preview['columns'],
-            sample_rows=preview['sample_rows'],
-            suggested_mapping=suggested_mapping,
-            column_profiles=preview.get('column_profiles'),
-            total_rows=preview.get('total_rows'),
-            raw_rows=preview.get('raw_rows'),
-            removed_blank_rows=preview.get('removed_blank_rows'),
-        )
+        return build_preview(db, current_user.id, str(temp_path), sheet=sheet_name or None)
         
     finally:
         # Clean up temp file
@@ -504,11 +741,16 @@ async def upload_with_mapping(
     negative_amount_policy: str = Form(default="exclude"),
     allow_synthetic_customer_id: bool = Form(default=False),
     allow_synthetic_invoice_date: bool = Form(default=False),
+    sheet_name: Optional[str] = Form(default=None),
+    incremental: bool = Form(default=False),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Upload a CSV file with explicit column mapping.
+    Upload a CSV, Parquet, Feather or Excel file with explicit column mapping.
+    For .xlsx workbooks, **sheet_name** picks the worksheet (the first by default).
+    With **incremental**, only transactions not already in your stored customer
+    history are added to it, and every customer on record is segmented.
     """
     validate_file(file)
     
@@ -530,6 +772,8 @@ async def upload_with_mapping(
         'allow_synthetic_customer_id': allow_synthetic_customer_id,
         'allow_synthetic_invoice_date': allow_synthetic_invoice_date,
     }
+    if sheet_name:
+        column_mapping['sheet_name'] = sheet_name
     if product_col:
         column_mapping['product'] = product_col
     if category_col:
@@ -538,66 +782,23 @@ async def upload_with_mapping(
     # Generate job ID
     job_id = str(uuid.uuid4())
     
-    # Create directories
-    job_upload_dir = UPLOAD_DIR / job_id
-    job_output_dir = OUTPUT_DIR / job_id
-    job_upload_dir.mkdir(parents=True, exist_ok=True)
-    job_output_dir.mkdir(parents=True, exist_ok=True)
-    
     stored_upload = store_upload_locally(
         file=file,
-        upload_dir=job_upload_dir,
+        upload_dir=UPLOAD_DIR / job_id,
     )
     
-    # Create job
-    job = Job(
+    return queue_uploaded_job(
+        db=db,
+        background_tasks=background_tasks,
+        user=current_user,
         job_id=job_id,
-        user_id=current_user.id,
         original_filename=file.filename,
-        upload_path=stored_upload["storage_object_path"] or stored_upload["local_path"],
-        local_upload_path=stored_upload["local_path"],
-        storage_provider=stored_upload["storage_provider"],
-        storage_bucket=stored_upload["storage_bucket"],
-        storage_object_path=stored_upload["storage_object_path"],
-        storage_public_url=stored_upload["storage_public_url"],
-        output_path=str(job_output_dir),
-        clustering_method=clustering_method,
-        include_comparison=include_comparison,
-        column_mapping=json.dumps(column_mapping),
-        status="pending",
-        progress_percent=5,
-        progress_stage="queued",
-        progress_message="Mapped upload received. Your analysis job is queued and waiting to start."
-    )
-    
-    db.add(job)
-    db.commit()
-    db.refresh(job)
-    
-    # Start background processing
-    from ..config import DATABASE_URL
-    background_tasks.add_task(
-        run_segmentation_job,
-        job_id=job_id,
-        file_path=stored_upload["local_path"],
-        output_dir=str(job_output_dir),
+        stored_upload=stored_upload,
         column_mapping=column_mapping,
         clustering_method=clustering_method,
         include_comparison=include_comparison,
-        db_url=DATABASE_URL
-    )
-    
-    return JobStatus(
-        job_id=job.job_id,
-        status=job.status,
-        progress_percent=job.progress_percent,
-        progress_stage=job.progress_stage,
-        progress_message=job.progress_message,
-        created_at=job.created_at,
-        storage_provider=job.storage_provider,
-        storage_bucket=job.storage_bucket,
-        storage_object_path=job.storage_object_path,
-        storage_public_url=job.storage_public_url,
+        progress_message="Mapped upload received. Your analysis job is queued and waiting to start.",
+        incremental=incremental,
     )
 
 
@@ -621,6 +822,7 @@ async def validate_upload_mapping(
     negative_amount_policy: str = Form(default="exclude"),
     allow_synthetic_customer_id: bool = Form(default=False),
     allow_synthetic_invoice_date: bool = Form(default=False),
+    sheet_name: Optional[str] = Form(default=None),
     current_user: User = Depends(get_current_user),
 ):
     """
@@ -650,12 +852,14 @@ async def validate_upload_mapping(
         "negative_amount_policy": negative_amount_policy,
         "allow_synthetic_customer_id": allow_synthetic_customer_id,
         "allow_synthetic_invoice_date": allow_synthetic_invoice_date,
+        "sheet_name": sheet_name or None,
     }
 
     try:
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return build_mapping_validation_report(str(temp_path), column_mapping)
+        streamed = stream_upload(file, temp_path)
+        return build_mapping_validation_report(str(temp_path), column_mapping, content_digest=streamed["sha256"])
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
     finally:
@@ -663,6 +867,91 @@ async def validate_upload_mapping(
             os.remove(temp_path)
 
 
+@router.get("/sql/sources")
+async def list_sql_sources(
+    current_user: User = Depends(get_current_user),
+):
+    """Names of the databases this user's analysis jobs can query directly."""
+    return {"sources": sql_sources_for(current_user.email)}
+
+
+@router.post("/sql/preview", response_model=CSVPreview)
+async def preview_sql_source(
+    payload: SQLSourceQuery,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Preview the rows a SQL query returns, for column mapping. Only the first rows
+    are fetched; the total row count is unknown unless the result is small.
+    """
+    temp_path = UPLOAD_DIR / f"temp_{uuid.uuid4()}.sqlquery"
+    try:
+        store_sql_source(payload, temp_path, current_user)
+        return build_preview(db, current_user.id, str(temp_path))
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+@router.post("/sql", response_model=JobStatus)
+async def create_sql_job(
+    payload: SQLJobCreate,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start segmentation on the rows of a SQL query instead of an uploaded file.
+
+    The query runs when the job does, streamed with a server-side cursor, so the
+    results reflect the database at that time.
+    """
+    job_id = str(uuid.uuid4())
+    local_path = UPLOAD_DIR / job_id / "source.sqlquery"
+    streamed = store_sql_source(payload, local_path, current_user)
+
+    return queue_uploaded_job(
+        db=db,
+        background_tasks=background_tasks,
+        user=current_user,
+        job_id=job_id,
+        original_filename=f"{payload.connection} query",
+        stored_upload=local_upload_record(local_path, streamed),
+        column_mapping=payload.column_mapping,
+        clustering_method=payload.clustering_method,
+        include_comparison=payload.include_comparison,
+        progress_message="Query received. Your analysis job is queued and waiting to start.",
+        incremental=payload.incremental,
+    )
+
+
+@router.get("/rfm-state", response_model=RFMStateSummary)
+async def get_rfm_state(
+    current_user: User = Depends(get_current_user),
+):
+    """Summarise the customer history that incremental jobs add to."""
+    try:
+        state = RFMState.load(tenant_state_path(current_user.id))
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+    return RFMStateSummary(**state.summary())
+
+
+def _clear_rfm_state(path: Path) -> None:
+    with tenant_state_lock(path):
+        path.unlink(missing_ok=True)
+
+
+@router.delete("/rfm-state")
+async def reset_rfm_state(
+    current_user: User = Depends(get_current_user),
+):
+    """Forget the stored customer history; the next incremental job starts afresh."""
+    # The lock blocks while a job is saving the state, so wait in the threadpool
+    await run_in_threadpool(_clear_rfm_state, tenant_state_path(current_user.id))
+    return {"message": "Customer history cleared"}
+
+
 @router.get("/", response_model=List[JobSummary])
 async def list_jobs(
     current_user: User = Depends(get_current_user),
@@ -1002,6 +1291,15 @@ async def delete_job(
     if output_dir.exists():
         shutil.rmtree(output_dir)
 
+    # Drop the cached canonical frame unless another job still uses the same entry
+    if job.preprocess_cache_key:
+        shared = db.query(Job).filter(
+            Job.preprocess_cache_key == job.preprocess_cache_key,
+            Job.id != job.id,
+        ).first()
+        if not shared:
+            PREPROCESS_CACHE.discard(job.preprocess_cache_key)
+
     # Delete job record
     db.delete(job)
     db.commit()
@@ -0,0 +1,259 @@
+"""
+Resumable upload routes.
+
+Large files can be sent in numbered chunks instead of one multipart request:
+initiate a session, PUT each chunk, ask for the status to learn which chunks
+are still missing after a dropped connection, then complete. The file is
+assembled, hashed and checked like a direct upload, and the analysis job is
+only created on completion.
+
+Sessions live on disk under UPLOAD_DIR/resumable/<upload_id>, one file per
+chunk, so a retry only resends the chunks the server does not hold and any
+worker on the host can accept the next one.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+
+from ..auth import get_current_user
+from ..config import UPLOAD_DIR, MAX_FILE_SIZE_MB, RESUMABLE_CHUNK_KB, RESUMABLE_UPLOAD_TTL_HOURS, UPLOAD_CHUNK_KB
+from ..database import get_db
+from ..models import User
+from ..schemas import JobStatus, ResumableUploadComplete, ResumableUploadCreate, ResumableUploadStatus
+from .jobs import _upload_too_large, check_compressed_upload, local_upload_record, queue_uploaded_job, validate_filename
+
+router = APIRouter()
+
+
+def _sessions_dir() -> Path:
+    return UPLOAD_DIR / "resumable"
+
+
+def _chunk_path(session_dir: Path, index: int) -> Path:
+    return session_dir / f"chunk_{index:06d}"
+
+
+def _expected_chunk_size(session: dict, index: int) -> int:
+    """Every chunk is chunk_size bytes except the last, which holds the remainder."""
+    return min(session["chunk_size"], session["size_bytes"] - index * session["chunk_size"])
+
+
+def sweep_expired_uploads() -> None:
+    """Remove resumable sessions untouched for longer than RESUMABLE_UPLOAD_TTL_HOURS."""
+    sessions_dir = _sessions_dir()
+    if not sessions_dir.exists():
+        return
+    cutoff = time.time() - RESUMABLE_UPLOAD_TTL_HOURS * 3600
+    for session_dir in sessions_dir.iterdir():
+        try:
+            if session_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(session_dir, ignore_errors=True)
+        except FileNotFoundError:
+            continue
+
+
+def load_upload_session(upload_id: str, user: User) -> tuple:
+    """Return (session directory, session dict) for the user's upload, or 404."""
+    not_found = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except ValueError:
+        raise not_found
+    session_dir = _sessions_dir() / upload_id
+    try:
+        with open(session_dir / "session.json", encoding="utf-8") as handle:
+            session = json.load(handle)
+    except FileNotFoundError:
+        raise not_found
+    if session["user_id"] != user.id:
+        raise not_found
+    return session_dir, session
+
+
+def upload_status(session_dir: Path, session: dict) -> ResumableUploadStatus:
+    total_chunks = math.ceil(session["size_bytes"] / session["chunk_size"])
+    missing = [index for index in range(total_chunks) if not _chunk_path(session_dir, index).exists()]
+    next_chunk = missing[0] if missing else None
+    offset = session["size_bytes"] if next_chunk is None else next_chunk * session["chunk_size"]
+    return ResumableUploadStatus(
+        upload_id=session_dir.name,
+        filename=session["filename"],
+        size_bytes=session["size_bytes"],
+        chunk_size=session["chunk_size"],
+        total_chunks=total_chunks,
+        received_chunks=total_chunks - len(missing),
+        offset=offset,
+        next_chunk=next_chunk,
+        missing_chunks=missing,
+        complete=not missing,
+    )
+
+
+@router.post("", response_model=ResumableUploadStatus, status_code=status.HTTP_201_CREATED)
+async def create_resumable_upload(
+    payload: ResumableUploadCreate,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Start a resumable upload. Send the file as chunks of the returned chunk_size,
+    numbered from 0, then call complete.
+    """
+    validate_filename(payload.filename)
+    if payload.size_bytes > MAX_FILE_SIZE_MB * 1024 * 1024:
+        raise _upload_too_large()
+
+    sweep_expired_uploads()
+    session = {
+        "user_id": current_user.id,
+        "filename": Path(payload.filename).name,
+        "size_bytes": payload.size_bytes,
+        "chunk_size": RESUMABLE_CHUNK_KB * 1024,
+        "sha256": payload.sha256.lower() if payload.sha256 else None,
+    }
+    session_dir = _sessions_dir() / uuid.uuid4().hex
+    session_dir.mkdir(parents=True)
+    with open(session_dir / "session.json", "w", encoding="utf-8") as handle:
+        json.dump(session, handle)
+    return upload_status(session_dir, session)
+
+
+@router.put("/{upload_id}/chunks/{index}", response_model=ResumableUploadStatus)
+async def upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Store one chunk from the raw request body. A chunk is only recorded once all
+    of its bytes have arrived, so a dropped request leaves it missing; resending a
+    chunk replaces it.
+    """
+    session_dir, session = load_upload_session(upload_id, current_user)
+    total_chunks = math.ceil(session["size_bytes"] / session["chunk_size"])
+    if not 0 <= index < total_chunks:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Chunk index must be between 0 and {total_chunks - 1}"
+        )
+
+    expected = _expected_chunk_size(session, index)
+    chunk_path = _chunk_path(session_dir, index)
+    temp_path = chunk_path.with_name(f"{chunk_path.name}.{uuid.uuid4().hex}.tmp")
+    received = 0
+    try:
+        with open(temp_path, "wb") as buffer:
+            async for block in request.stream():
+                received += len(block)
+                if received > expected:
+                    break
+                buffer.write(block)
+        if received != expected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Chunk {index} must be {expected} bytes; received {received}"
+            )
+        os.replace(temp_path, chunk_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+    return upload_status(session_dir, session)
+
+
+@router.get("/{upload_id}", response_model=ResumableUploadStatus)
+async def get_resumable_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    """Report which chunks have arrived and which to send next."""
+    session_dir, session = load_upload_session(upload_id, current_user)
+    return upload_status(session_dir, session)
+
+
+@router.post("/{upload_id}/complete", response_model=JobStatus)
+async def complete_resumable_upload(
+    upload_id: str,
+    payload: ResumableUploadComplete,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Assemble the chunks into the job's upload file and queue the analysis.
+
+    Returns 409 while chunks are missing (the session is kept so they can be sent)
+    and 400 if the assembled file does not match the SHA-256 given at initiation.
+    """
+    session_dir, session = load_upload_session(upload_id, current_user)
+    progress = upload_status(session_dir, session)
+    if not progress.complete:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload is missing chunks: {progress.missing_chunks}"
+        )
+
+    job_id = str(uuid.uuid4())
+    upload_dir = UPLOAD_DIR / job_id
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    local_path = upload_dir / session["filename"]
+
+    digest = hashlib.sha256()
+    size_bytes = 0
+    line_count = 0
+    try:
+        with open(local_path, "wb") as buffer:
+            for index in range(progress.total_chunks):
+                with open(_chunk_path(session_dir, index), "rb") as chunk_file:
+                    for block in iter(lambda: chunk_file.read(UPLOAD_CHUNK_KB * 1024), b""):
+                        size_bytes += len(block)
+                        digest.update(block)
+                        line_count += block.count(b"\n")
+                        buffer.write(block)
+
+        if session["sha256"] and digest.hexdigest() != session["sha256"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Assembled upload does not match the SHA-256 given when the upload started"
+            )
+        check_compressed_upload(local_path)
+    except BaseException:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise
+
+    shutil.rmtree(session_dir, ignore_errors=True)
+    stored_upload = local_upload_record(
+        local_path,
+        {"sha256": digest.hexdigest(), "size_bytes": size_bytes, "line_count": line_count},
+    )
+    return queue_uploaded_job(
+        db=db,
+        background_tasks=background_tasks,
+        user=current_user,
+        job_id=job_id,
+        original_filename=session["filename"],
+        stored_upload=stored_upload,
+        column_mapping=payload.column_mapping,
+        clustering_method=payload.clustering_method,
+        include_comparison=payload.include_comparison,
+        progress_message="Upload received. Your analysis job is queued and waiting to start.",
+        incremental=payload.incremental,
+    )
+
+
+@router.delete("/{upload_id}")
+async def cancel_resumable_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+):
+    """Discard an unfinished upload and the chunks received so far."""
+    session_dir, _ = load_upload_session(upload_id, current_user)
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return {"message": "Upload cancelled"}
@@ -171,6 +171,76 @@ class CSVPreview(BaseModel):
     total_rows: Optional[int] = None
     raw_rows: Optional[int] = None
     removed_blank_rows: Optional[int] = None
+    row_count_estimated: bool = False
+    # "memory" when the mapping and parser options come from a previous upload with
+    # the same header; profiling is skipped then and column_profiles is empty.
+    mapping_source: str = "suggested"
+    remembered_options: Optional[Dict[str, Any]] = None
+    # Excel workbooks only: the worksheets available and the one previewed
+    sheets: Optional[List[str]] = None
+    sheet_name: Optional[str] = None
+
+
+# ============== SQL Source Schemas ==============
+
+class SQLSourceQuery(BaseModel):
+    """A SELECT query against one of the server's configured SQL sources."""
+    connection: str
+    query: str
+
+
+class SQLJobCreate(SQLSourceQuery):
+    """Start an analysis job that reads its transactions from a SQL source."""
+    clustering_method: str = "kmeans"
+    include_comparison: bool = True
+    column_mapping: Optional[Dict[str, Any]] = None
+    incremental: bool = False  # Fold into the stored customer history (see RFMState)
+
+
+# ============== Resumable Upload Schemas ==============
+
+class ResumableUploadCreate(BaseModel):
+    """Start a resumable upload of a file sent in numbered chunks."""
+    filename: str
+    size_bytes: int = Field(..., gt=0)
+    sha256: Optional[str] = None  # Checked against the assembled file on completion when given
+
+
+class ResumableUploadStatus(BaseModel):
+    """Progress of a resumable upload: which chunks the server holds."""
+    upload_id: str
+    filename: str
+    size_bytes: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: int
+    offset: int  # Bytes held contiguously from the start of the file
+    next_chunk: Optional[int] = None  # First chunk still missing; None once all have arrived
+    missing_chunks: List[int]
+    complete: bool
+
+
+class ResumableUploadComplete(BaseModel):
+    """Options for the analysis job created when a resumable upload completes."""
+    clustering_method: str = "kmeans"
+    include_comparison: bool = True
+    column_mapping: Optional[Dict[str, Any]] = None
+    incremental: bool = False  # Fold into the stored customer history (see RFMState)
+
+
+# ============== Incremental RFM Schemas ==============
+
+class RFMStateSummary(BaseModel):
+    """Customer history kept for incremental jobs."""
+    customers: int
+    transactions: int
+    first_purchase_date: Optional[datetime] = None
+    last_purchase_date: Optional[datetime] = None
+    total_revenue: float
+    batches: int
+    rows_counted: int
+    rows_skipped: int
+    updated_at: Optional[datetime] = None
 
 
 # ============== Report Schemas ==============
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-customer groupbys on display-ID strings vs int32 customer codes.
+
+Builds a cleaned transaction frame (string customer IDs, float64 amounts, text
+product/category), compacts it with compact_frame, and times the aggregations RFM
+and the customer tables run on both. Also prints the frame footprint before and
+after compaction.
+
+Usage:
+    python benchmarks/bench_customer_codes.py --rows 1000000 --customers 200000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.preprocessing import compact_frame  # noqa: E402
+from app.analytics.rfm import compute_rfm  # noqa: E402
+
+
+def make_frame(rows: int, customers: int) -> pd.DataFrame:
+    rng = np.random.default_rng(17)
+    return pd.DataFrame({
+        'customer_id': pd.Series(rng.integers(0, customers, rows)).map('CUST{:07d}'.format),
+        'invoice_date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'invoice_id': pd.Series(np.arange(rows)).map('INV{:08d}'.format),
+        'amount': rng.integers(100, 90_000, rows) / 4,
+        'product': pd.Series(rng.integers(0, 400, rows)).map('Product {}'.format),
+        'category': pd.Series(rng.integers(0, 12, rows)).map('Category {}'.format),
+    })
+
+
+def timed(label: str, run, baseline: float = None) -> float:
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    speedup = f"{baseline / elapsed:6.1f}x" if baseline else "      -"
+    print(f"  {label:<22} {elapsed:8.2f}s {speedup}")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--customers", type=int, default=200_000)
+    args = parser.parse_args()
+
+    strings = make_frame(args.rows, args.customers)
+    before_mb = strings.memory_usage(deep=True).sum() / 1024 / 1024
+    compact, _ = compact_frame(strings.copy())
+    after_mb = compact.memory_usage(deep=True).sum() / 1024 / 1024
+    print(f"{args.rows:,} rows, {args.customers:,} customers: frame {before_mb:.0f} MB -> {after_mb:.0f} MB")
+
+    aggregations = {
+        'last purchase (max)': lambda df, key: df['invoice_date'].groupby(df[key]).max(),
+        'monetary (sum)': lambda df, key: df['amount'].astype(np.float64).groupby(df[key]).sum(),
+        'frequency (nunique)': lambda df, key: df['invoice_id'].groupby(df[key]).nunique(),
+    }
+    for label, aggregate in aggregations.items():
+        print(label)
+        baseline = timed("customer_id strings", lambda: aggregate(strings, 'customer_id'))
+        timed("customer_code int32", lambda: aggregate(compact, 'customer_code'), baseline)
+
+    print("compute_rfm")
+    baseline = timed("customer_id strings", lambda: compute_rfm(strings))
+    timed("customer_code int32", lambda: compute_rfm(compact), baseline)
+    pd.testing.assert_frame_equal(
+        compute_rfm(strings), compute_rfm(compact).astype({'customer_id': object}),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: EDA summary of a cleaned transaction frame.
+
+Times the previous multi-pass summary (duplicated(), isna(), per-column aggregates
+and a string-cast value_counts per label column) against EDAAccumulator on the
+whole frame and fed in --chunk-rows chunks.
+
+Usage:
+    python benchmarks/bench_eda.py --rows 1000000 --chunk-rows 50000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.eda import EDAAccumulator  # noqa: E402
+
+
+def multi_pass_summary(df: pd.DataFrame) -> dict:
+    summary = {
+        'duplicates': int(df.duplicated().sum()),
+        'missing_values': int(df.isna().sum().sum()),
+        'numeric_summary': {},
+    }
+    for col in ['amount', 'qty', 'price', 'discount']:
+        if col in df.columns:
+            series = pd.to_numeric(df[col], errors='coerce').astype(float).dropna()
+            summary['numeric_summary'][col] = [series.mean(), series.median(), series.std(), series.min(), series.max()]
+    for col in ['category', 'product', 'payment']:
+        if col in df.columns:
+            summary[col] = df[col].astype(str).value_counts().head(10)
+    return summary
+
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'customer_id': pd.Categorical(rng.integers(0, max(rows // 10, 1), rows).astype(str)),
+        'invoice_date': pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+        'invoice_id': rng.integers(0, rows, rows).astype(str),
+        'amount': rng.gamma(2.0, 50.0, rows).astype('float32'),
+        'qty': rng.integers(1, 5, rows),
+        'price': np.where(rng.random(rows) < 0.01, np.nan, rng.gamma(2.0, 20.0, rows)),
+        'category': pd.Categorical(rng.choice(['Food', 'Drinks', 'Household', None], rows)),
+        'product': rng.choice([f"P{i}" for i in range(3000)], rows),
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows)
+    print(f"{args.rows:,} rows")
+
+    start = time.perf_counter()
+    multi_pass_summary(df)
+    print(f"  multi-pass:            {time.perf_counter() - start:6.2f}s")
+
+    start = time.perf_counter()
+    EDAAccumulator().add(df).summary()
+    print(f"  accumulator (whole):   {time.perf_counter() - start:6.2f}s")
+
+    start = time.perf_counter()
+    accumulator = EDAAccumulator()
+    for offset in range(0, len(df), args.chunk_rows):
+        accumulator.add(df.iloc[offset:offset + args.chunk_rows])
+    accumulator.summary()
+    print(f"  accumulator (chunked): {time.perf_counter() - start:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark: byte-sniffing encoding detection vs the old whole-file retry loop.
+
+Generates cp1252 exports shaped like Ghanaian POS downloads (Windows "smart" quotes,
+accented names, the euro sign) and loads them both ways. The old loop parsed the
+whole file as UTF-8, hit a UnicodeDecodeError near the end, and parsed it again as
+latin-1, which also mis-decodes the cp1252-only characters.
+
+Usage:
+    python benchmarks/bench_encoding_detection.py --rows 200000 500000
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.preprocessing import load_csv  # noqa: E402
+
+SHOPS = ["Kwabena’s Provisions", "Ama’s Café", "Nana Yéboah Stores", "Kofi – Wholesale"]
+
+
+def write_pos_export(path: Path, rows: int, accented_share: float) -> None:
+    """Write a cp1252 CSV whose non-ASCII rows sit in the final `accented_share` of the file."""
+    rng = random.Random(42)
+    first_accented = int(rows * (1 - accented_share))
+    lines = ["Customer ID,Txn Date,Receipt No,Total Line Amount,Item,Shop"]
+    for index in range(rows):
+        shop = rng.choice(SHOPS) if index >= first_accented else "Makola Branch"
+        lines.append(
+            f"CUST{rng.randint(1, 20000):05d},{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025,"
+            f"RCPT{index:07d},{rng.uniform(5, 900):.2f},Item {rng.randint(1, 400)},{shop}"
+        )
+    path.write_bytes(("\n".join(lines) + "\n").encode("cp1252"))
+
+
+def legacy_load(path: Path):
+    """The pre-detection loader: retry a full parse per encoding."""
+    parses = 0
+    for encoding in ["utf-8", "latin-1", "cp1252"]:
+        parses += 1
+        try:
+            return pd.read_csv(path, encoding=encoding, low_memory=False), parses, encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("Could not decode file")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 500_000])
+    parser.add_argument("--accented-share", type=float, default=0.01,
+                        help="Fraction of rows (at the end of the file) containing cp1252 characters")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'loader':<10} {'parses':>6} {'encoding':<10} {'seconds':>8} {'shop names ok':>14}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for rows in args.rows:
+            path = Path(temp_dir) / f"pos_{rows}.csv"
+            write_pos_export(path, rows, args.accented_share)
+
+            start = time.perf_counter()
+            df, parses, encoding = legacy_load(path)
+            elapsed = time.perf_counter() - start
+            ok = df["Shop"].isin(SHOPS + ["Makola Branch"]).all()
+            print(f"{rows:>10,} {'legacy':<10} {parses:>6} {encoding:<10} {elapsed:>8.2f} {str(ok):>14}")
+
+            start = time.perf_counter()
+            df = load_csv(str(path))
+            elapsed = time.perf_counter() - start
+            ok = df["Shop"].isin(SHOPS + ["Makola Branch"]).all()
+            print(f"{rows:>10,} {'sniffed':<10} {df.attrs['parse_attempts']:>6} {df.attrs['encoding']:<10} {elapsed:>8.2f} {str(ok):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Arrow-kernel locale numeric parser vs the chained pandas regex passes.
+
+Generates GH₵-formatted amounts ("GH₵ 1,234.50", "(45.00)", NBSP thousands) and
+times the legacy chain of str.replace passes against the Arrow parser. Values are
+all distinct so the unique-value memoisation in _parse_locale_numeric_series does
+not hide the parser cost; the memoised rows compare the full column path.
+
+Usage:
+    python benchmarks/bench_numeric_parsing.py --rows 1000000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.preprocessing import (  # noqa: E402
+    _clean_numeric_text_arrow,
+    _clean_numeric_text_pandas,
+    _memoised_parse,
+    _parse_locale_numeric_series,
+)
+
+OPTIONS = {'decimal_separator': '.', 'thousands_separator': ',', 'currency_symbol': 'GH₵'}
+
+
+def make_amounts(rows: int) -> pd.Series:
+    rng = np.random.default_rng(5)
+    cents = rng.integers(1, 10_000_000, rows)
+    text = pd.Series([f"{value / 100:,.2f}" for value in cents])
+    text[::7] = "GH₵ " + text[::7]
+    text[3::11] = "(" + text[3::11] + ")"
+    text[5::13] = text[5::13].str.replace(",", " ", regex=False)
+    return text
+
+
+def timed(label: str, parse, values: pd.Series, baseline: float = None, repeat: int = 3) -> float:
+    """Best of `repeat` runs, so one noisy run does not decide the ratio."""
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(values)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    speedup = f"{baseline / elapsed:6.1f}x" if baseline else "      -"
+    print(f"{label:<28} {elapsed:8.2f}s {speedup}")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    values = make_amounts(args.rows)
+    pd.testing.assert_series_equal(
+        _clean_numeric_text_arrow(values, **OPTIONS), _clean_numeric_text_pandas(values, **OPTIONS),
+    )
+
+    print(f"{args.rows:,} distinct formatted amounts")
+    baseline = timed("pandas regex chain", lambda v: _clean_numeric_text_pandas(v, **OPTIONS), values)
+    timed("arrow kernels", lambda v: _clean_numeric_text_arrow(v, **OPTIONS), values, baseline)
+    memoised = timed(
+        "pandas chain, memoised",
+        lambda v: _memoised_parse(v, lambda uniques: _clean_numeric_text_pandas(uniques, **OPTIONS)),
+        values,
+    )
+    timed("arrow kernels, memoised", lambda v: _parse_locale_numeric_series(v, **OPTIONS), values, memoised)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory used by each preprocessing step relative to the raw columns.
+
+Writes a POS-style export, runs preprocess_transaction_data with tracemalloc
+allocation tracking on, and prints the per-step accounting it records in
+metadata['cleaning_stats']['memory']. Every step after the load should allocate
+well under twice the loaded (raw) column footprint, since steps replace columns
+on one frame instead of copying it.
+
+Usage:
+    python benchmarks/bench_preprocess_memory.py --rows 500000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("PREPROCESS_TRACE_ALLOCATIONS", "true")
+os.environ.setdefault("MAX_ROWS", "10000000")
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.preprocessing import preprocess_transaction_data  # noqa: E402
+
+MAPPING = {
+    'customer_id': 'Customer ID',
+    'invoice_date': 'Txn Date',
+    'invoice_id': 'Receipt No',
+    'amount': 'Total Line Amount',
+}
+
+
+def write_export(path: Path, rows: int) -> None:
+    rng = random.Random(11)
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write("Customer ID,Txn Date,Receipt No,Total Line Amount\n")
+        for index in range(rows):
+            handle.write(
+                f"CUST{rng.randint(1, 20000):05d},2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+                f"RCPT{index:07d},\"{rng.uniform(-20, 9000):,.2f}\"\n"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "export.csv"
+        write_export(path, args.rows)
+        _, metadata = preprocess_transaction_data(str(path), MAPPING)
+
+    memory = metadata['cleaning_stats']['memory']
+    raw_mb = memory['raw_column_mb']
+    print(f"{args.rows:,} rows, raw columns {raw_mb:.1f} MB (allocations from {memory['allocation_source']})")
+    print(f"{'step':<14} {'seconds':>8} {'alloc MB':>9} {'x raw':>6} {'peak RSS MB':>12}")
+    for step in memory['steps']:
+        ratio = step['allocated_mb'] / raw_mb if raw_mb else 0.0
+        print(f"{step['step']:<14} {step['seconds']:>8.2f} {step['allocated_mb']:>9.1f} {ratio:>6.2f} "
+              f"{step['peak_rss_mb'] or 0:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
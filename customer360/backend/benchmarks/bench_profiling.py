@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark: column profiling for the mapping UI on a wide export.
+
+Builds a frame of Arrow-backed text columns (dates, formatted amounts, categories
+and IDs, cycling across --columns) and times profile_dataframe serially and on
+the thread pool.
+
+Usage:
+    python benchmarks/bench_profiling.py --rows 5000 --columns 60 --workers 8
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.preprocessing import profile_dataframe  # noqa: E402
+
+
+def make_frame(rows: int, columns: int) -> pd.DataFrame:
+    rng = np.random.default_rng(3)
+    makers = [
+        lambda: (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 700, rows), unit='D')).strftime('%d/%m/%Y'),
+        lambda: pd.Series(rng.uniform(0, 10_000, rows)).map('{:,.2f}'.format),
+        lambda: pd.Series(rng.integers(0, 30, rows)).map('Category {}'.format),
+        lambda: pd.Series(rng.integers(0, rows, rows)).map('ID{:08d}'.format),
+    ]
+    data = {f"column_{index}": np.asarray(makers[index % len(makers)]()) for index in range(columns)}
+    return pd.DataFrame(data).astype('string[pyarrow]')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000)
+    parser.add_argument("--columns", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.columns)
+    print(f"{args.rows:,} rows x {args.columns} columns")
+    for workers in (1, args.workers):
+        start = time.perf_counter()
+        profile_dataframe(df, workers=workers)
+        print(f"  {workers} worker(s): {time.perf_counter() - start:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
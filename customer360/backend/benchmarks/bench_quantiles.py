@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: RFM quantiles, per-stage full-column sorts vs shared summaries.
+
+The reference repeats what the stages used to do on their own: rank-based scoring
+(a full rank of all three metrics), median/q25/q75 per metric for the statistics,
+and p25/p50/p75 per metric for segment labelling. It is timed against building one
+QuantileSummary per metric and answering every stage from it, exactly and from the
+KLL sketch.
+
+Usage:
+    python benchmarks/bench_quantiles.py --customers 2000000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.quantiles import RFM_METRICS, column_quantiles  # noqa: E402
+from app.analytics.rfm import compute_rfm_scores  # noqa: E402
+
+
+def make_rfm(customers: int) -> pd.DataFrame:
+    rng = np.random.default_rng(25)
+    return pd.DataFrame({
+        'customer_id': np.arange(customers),
+        'recency': rng.integers(1, 730, customers),
+        'frequency': rng.geometric(0.3, customers),
+        'monetary': rng.lognormal(5.0, 1.2, customers),
+    })
+
+
+def rank_scores(rfm: pd.DataFrame, n_bins: int = 5) -> pd.DataFrame:
+    rfm = rfm.copy()
+    ranks = rfm[['recency', 'frequency', 'monetary']].rank(method='min').to_numpy()
+    scores = 1 + (ranks - 1) * n_bins // max(len(rfm), 1)
+    scores[:, 0] = n_bins + 1 - scores[:, 0]
+    scores = np.nan_to_num(scores, nan=1).astype(int)
+    rfm['R_score'], rfm['F_score'], rfm['M_score'] = scores.T
+    labels = np.array([str(score) for score in range(n_bins + 1)], dtype=object)
+    rfm['RFM_score'] = labels[scores[:, 0]] + labels[scores[:, 1]] + labels[scores[:, 2]]
+    rfm['RFM_total'] = rfm['R_score'] + rfm['F_score'] + rfm['M_score']
+    return rfm
+
+
+def per_stage_sorts(rfm: pd.DataFrame) -> None:
+    rank_scores(rfm)
+    for column in RFM_METRICS:
+        rfm[column].median(), rfm[column].quantile(0.25), rfm[column].quantile(0.75)
+    for column in RFM_METRICS:
+        [rfm[column].quantile(q) for q in (0.25, 0.50, 0.75)]
+
+
+def shared_summaries(rfm: pd.DataFrame, **kwargs) -> None:
+    quantiles = column_quantiles(rfm, **kwargs)
+    compute_rfm_scores(rfm, quantiles=quantiles)
+    for summary in quantiles.values():
+        summary.quantile([0.5, 0.25, 0.75])
+        summary.quantile([0.25, 0.50, 0.75])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    rfm = make_rfm(args.customers)
+    print(f"{args.customers:,} customers")
+
+    start = time.perf_counter()
+    per_stage_sorts(rfm)
+    baseline = time.perf_counter() - start
+    print(f"  per-stage sorts:          {baseline:6.2f}s")
+
+    for label, kwargs in (("shared, exact", {'exact_limit': args.customers}), ("shared, KLL sketch", {'exact_limit': 0})):
+        start = time.perf_counter()
+        shared_summaries(rfm, **kwargs)
+        elapsed = time.perf_counter() - start
+        print(f"  {label + ':':<25} {elapsed:6.2f}s {baseline / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
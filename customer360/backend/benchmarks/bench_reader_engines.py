@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pandas C parser vs the multi-threaded Arrow CSV reader in load_csv.
+
+Writes synthetic transaction exports and loads each one with both engines through
+the same streamed, limit-checked path preprocess_transaction_data uses.
+
+Usage:
+    python benchmarks/bench_reader_engines.py --rows 100000 1000000 5000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# The benchmark files are larger than the upload limit; raise it before app config loads.
+os.environ.setdefault("MAX_ROWS", "10000000")
+os.environ.setdefault("INGEST_MAX_MEMORY_MB", "16384")
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.preprocessing import load_csv  # noqa: E402
+from app.config import INGEST_CHUNK_ROWS  # noqa: E402
+
+
+def write_export(path: Path, rows: int) -> None:
+    rng = random.Random(11)
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write("customer_id,invoice_date,invoice_id,amount,product,category\n")
+        for index in range(rows):
+            handle.write(
+                f"CUST{rng.randint(1, 50000):06d},2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+                f"INV{index:08d},{rng.uniform(5, 900):.2f},Item {rng.randint(1, 400)},Cat {rng.randint(1, 12)}\n"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs per engine")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'engine':<8} {'best s':>8} {'rows/s':>12}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for rows in args.rows:
+            path = Path(temp_dir) / f"export_{rows}.csv"
+            write_export(path, rows)
+            for engine in ("pandas", "pyarrow"):
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    df = load_csv(str(path), chunksize=INGEST_CHUNK_ROWS or None, engine=engine)
+                    timings.append(time.perf_counter() - start)
+                best = min(timings)
+                print(f"{rows:>10,} {df.attrs['reader_engine']:<8} {best:>8.2f} {rows / best:>12,.0f}")
+                del df
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: RFM metrics and scores, per-customer lambda vs the vectorised kernel.
+
+The reference is the previous implementation: copy the frame, groupby().agg with
+a recency lambda per customer, then three qcut-with-fallback scoring blocks. It is
+timed against compute_rfm and compute_rfm_scores on the same string-ID frame and
+on the compacted frame, and the outputs are checked to agree.
+
+Usage:
+    python benchmarks/bench_rfm.py --rows 1000000 --customers 200000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.preprocessing import compact_frame  # noqa: E402
+from app.analytics.rfm import compute_rfm, compute_rfm_scores  # noqa: E402
+
+
+def make_frame(rows: int, customers: int) -> pd.DataFrame:
+    rng = np.random.default_rng(21)
+    return pd.DataFrame({
+        'customer_id': pd.Series(rng.integers(0, customers, rows)).map('CUST{:07d}'.format),
+        'invoice_date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'invoice_id': pd.Series(rng.integers(0, rows // 2, rows)).map('INV{:08d}'.format),
+        'amount': rng.integers(100, 90_000, rows) / 4,
+    })
+
+
+def lambda_rfm(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    reference_date = df['invoice_date'].max() + pd.Timedelta(days=1)
+    rfm = df.groupby('customer_id').agg({
+        'invoice_date': lambda x: (reference_date - x.max()).days,
+        'invoice_id': 'nunique',
+        'amount': 'sum',
+    }).reset_index()
+    rfm.columns = ['customer_id', 'recency', 'frequency', 'monetary']
+    return rfm
+
+
+def qcut_scores(rfm: pd.DataFrame, n_bins: int = 5) -> pd.DataFrame:
+    rfm = rfm.copy()
+    for column, labels in (
+        ('recency', list(range(n_bins, 0, -1))),
+        ('frequency', list(range(1, n_bins + 1))),
+        ('monetary', list(range(1, n_bins + 1))),
+    ):
+        try:
+            score = pd.qcut(rfm[column], q=n_bins, labels=labels, duplicates='drop')
+        except ValueError:
+            score = pd.cut(rfm[column], bins=n_bins, labels=labels, duplicates='drop')
+        rfm[f'{column[0].upper()}_score'] = score.astype(int)
+    rfm['RFM_score'] = rfm['R_score'].astype(str) + rfm['F_score'].astype(str) + rfm['M_score'].astype(str)
+    rfm['RFM_total'] = rfm['R_score'] + rfm['F_score'] + rfm['M_score']
+    return rfm
+
+
+def timed(label: str, run, baseline: float = None):
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    speedup = f"{baseline / elapsed:6.1f}x" if baseline else "      -"
+    print(f"  {label:<26} {elapsed:8.2f}s {speedup}")
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--customers", type=int, default=200_000)
+    args = parser.parse_args()
+
+    strings = make_frame(args.rows, args.customers)
+    compact, _ = compact_frame(strings.copy())
+    print(f"{args.rows:,} rows, {strings['customer_id'].nunique():,} customers")
+
+    print("RFM metrics")
+    baseline, expected = timed("lambda groupby.agg", lambda: lambda_rfm(strings))
+    _, rfm = timed("kernel, customer_id strings", lambda: compute_rfm(strings), baseline)
+    _, rfm_compact = timed("kernel, customer_code", lambda: compute_rfm(compact), baseline)
+    pd.testing.assert_frame_equal(rfm, expected, check_dtype=False)
+    pd.testing.assert_frame_equal(rfm_compact.astype({'customer_id': object}), expected, check_dtype=False)
+
+    print("RFM scores")
+    baseline, _ = timed("three qcut blocks", lambda: qcut_scores(expected))
+    timed("rank binning", lambda: compute_rfm_scores(rfm), baseline)
+
+    print("RFM metrics + scores")
+    baseline, _ = timed("lambda + qcut", lambda: qcut_scores(lambda_rfm(strings)))
+    timed("kernel + rank binning", lambda: compute_rfm_scores(compute_rfm(compact)), baseline)
+
+
+if __name__ == "__main__":
+    main()
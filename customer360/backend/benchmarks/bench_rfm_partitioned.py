@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark: RFM over transaction part files, in memory vs partitioned.
+
+Writes --rows synthetic transactions as --files Parquet or CSV part files (chunk
+by chunk, never as one frame), then runs each method in a fresh process and
+reports wall time and peak resident memory:
+
+- in memory: read every part into one frame, then compute_rfm
+- partitioned: partitioned_customer_features with one worker, then --workers
+
+Peak memory of the partitioned runs includes their worker processes. Outputs are
+checked to agree.
+
+Usage:
+    python benchmarks/bench_rfm_partitioned.py --rows 10000000 --workers 4
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.rfm import RFM_COLUMNS, compute_rfm  # noqa: E402
+from app.analytics.rfm_partitioned import find_sources, partitioned_customer_features  # noqa: E402
+
+REFERENCE_DATE = pd.Timestamp('2026-01-01')
+
+
+def write_parts(directory: Path, rows: int, customers: int, files: int, file_format: str) -> None:
+    rng = np.random.default_rng(24)
+    per_file = -(-rows // files)
+    for index in range(files):
+        n = min(per_file, rows - index * per_file)
+        part = pd.DataFrame({
+            'customer_id': pd.Series(rng.integers(0, customers, n)).map('CUST{:07d}'.format),
+            'invoice_date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 730, n), unit='D'),
+            'invoice_id': pd.Series(rng.integers(0, rows // 2, n)).map('INV{:08d}'.format),
+            'amount': rng.integers(100, 90_000, n) / 4,
+        })
+        if file_format == 'parquet':
+            part.to_parquet(directory / f'part-{index:03d}.parquet', row_group_size=250_000)
+        else:
+            part.to_csv(directory / f'part-{index:03d}.csv', index=False, date_format='%Y-%m-%d')
+
+
+def read_in_memory(directory: Path) -> pd.DataFrame:
+    frames = []
+    for path in find_sources(directory):
+        if path.suffix == '.parquet':
+            frames.append(pd.read_parquet(path))
+        else:
+            frames.append(pd.read_csv(path, parse_dates=['invoice_date']))
+    return pd.concat(frames, ignore_index=True)
+
+
+def peak_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux; pool workers count once they are reaped
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def run_in_memory(directory: Path):
+    start = time.perf_counter()
+    rfm = compute_rfm(read_in_memory(directory), reference_date=REFERENCE_DATE)
+    return time.perf_counter() - start, peak_mb(), rfm
+
+
+def run_partitioned(directory: Path, partitions: int, workers: int):
+    start = time.perf_counter()
+    features = partitioned_customer_features(
+        directory, REFERENCE_DATE, partitions=partitions, workers=workers,
+    )
+    return time.perf_counter() - start, peak_mb(), features[RFM_COLUMNS]
+
+
+def in_fresh_process(function, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--format", choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--skip-in-memory", action='store_true', help="Skip the in-memory baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-rfm-') as directory:
+        directory = Path(directory)
+        start = time.perf_counter()
+        write_parts(directory, args.rows, args.customers, args.files, args.format)
+        size_mb = sum(path.stat().st_size for path in directory.iterdir()) / 1024 / 1024
+        print(f"{args.rows:,} rows in {args.files} {args.format} files ({size_mb:,.0f} MB), "
+              f"written in {time.perf_counter() - start:.1f}s")
+        print(f"  {'method':<28} {'time':>9} {'peak RSS':>10}")
+
+        runs = []
+        if not args.skip_in_memory:
+            runs.append(("in memory", run_in_memory, (directory,)))
+        runs.append(("partitioned, 1 worker", run_partitioned, (directory, args.partitions, 1)))
+        if args.workers > 1:
+            runs.append((f"partitioned, {args.workers} workers", run_partitioned,
+                         (directory, args.partitions, args.workers)))
+
+        results = []
+        for label, function, run_args in runs:
+            elapsed, peak, rfm = in_fresh_process(function, *run_args)
+            print(f"  {label:<28} {elapsed:8.2f}s {peak:8,.0f}MB")
+            results.append(rfm)
+
+        for rfm in results[1:]:
+            pd.testing.assert_frame_equal(
+                rfm.astype({'customer_id': object}), results[0].astype({'customer_id': object}), check_dtype=False,
+            )
+
+
+if __name__ == "__main__":
+    main()
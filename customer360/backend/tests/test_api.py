@@ -2,10 +2,15 @@
 Unit tests for API endpoints.
 """
 import pytest
+import pandas as pd
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
+import gzip
+import hashlib
+import io
+import sqlite3
 import tempfile
 import os
 import sys
@@ -15,7 +20,13 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.main import app
 from app.database import Base, get_db
-from app.models import User, Job
+from app.models import User, Job, MappingMemory
+from app import middleware
+from app.analytics import ingestion, rfm_state
+from app.analytics.cache import FrameCache
+from app.routes import jobs as jobs_routes
+from app.routes import uploads as uploads_routes
+from app.routes.jobs import remember_mapping, stream_upload
 
 
 # Create test database
@@ -311,6 +322,324 @@ class TestJobEndpoints:
         finally:
             os.unlink(temp_path)
     
+    def test_upload_preview_parquet(self, client, auth_headers, tmp_path):
+        """Test Parquet files are accepted by the preview endpoint."""
+        pd = pytest.importorskip("pandas")
+        pytest.importorskip("pyarrow")
+        parquet_path = tmp_path / "transactions.parquet"
+        pd.DataFrame({
+            "customer_id": ["C001", "C002"],
+            "invoice_date": pd.to_datetime(["2025-01-01", "2025-01-02"]),
+            "invoice_id": ["INV001", "INV002"],
+            "amount": [100.0, 250.0],
+        }).to_parquet(parquet_path, index=False)
+
+        with open(parquet_path, "rb") as f:
+            response = client.post(
+                "/api/jobs/upload/preview",
+                files={"file": ("transactions.parquet", f, "application/octet-stream")},
+                headers=auth_headers
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["columns"] == ["customer_id", "invoice_date", "invoice_id", "amount"]
+        assert data["total_rows"] == 2
+
+    def test_upload_preview_uses_remembered_mapping(self, client, auth_headers, tmp_path):
+        """Test a repeat layout gets its remembered mapping and skips profiling."""
+        earlier = tmp_path / "week1.csv"
+        earlier.write_text("Customer ID,Txn Date,Receipt No,Total\nC001,05/01/2025,R1,100\n")
+        repeat = tmp_path / "week2.csv"
+        repeat.write_text("customer id , TXN  DATE,Receipt No,Total\nC002,12/01/2025,R9,80\n")
+        column_mapping = {
+            "customer_id": "Customer ID",
+            "invoice_date": "Txn Date",
+            "invoice_id": "Receipt No",
+            "amount": "Total",
+            "invoice_date_format": "",
+            "decimal_separator": ".",
+        }
+        db = TestingSessionLocal()
+        try:
+            user = db.query(User).filter(User.email == "test@example.com").first()
+            remember_mapping(db, user.id, str(earlier), column_mapping, {"date_format": "%d/%m/%Y", "dayfirst": True})
+        finally:
+            db.close()
+
+        with open(repeat, "rb") as f:
+            response = client.post(
+                "/api/jobs/upload/preview",
+                files={"file": ("week2.csv", f, "text/csv")},
+                headers=auth_headers
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["mapping_source"] == "memory"
+        assert data["column_profiles"] is None
+        # Named as this file spells them, so the mapping validates against its header
+        assert data["suggested_mapping"]["customer_id"] == "customer id "
+        assert data["suggested_mapping"]["invoice_date"] == " TXN  DATE"
+        assert data["suggested_mapping"]["amount"] == "Total"
+        assert data["remembered_options"]["invoice_date_format"] == "%d/%m/%Y"
+        assert data["remembered_options"]["dayfirst"] is True
+
+        db = TestingSessionLocal()
+        try:
+            assert db.query(MappingMemory).one().use_count == 1
+        finally:
+            db.close()
+
+    def test_upload_preview_new_layout_is_profiled(self, client, auth_headers, tmp_path):
+        """Test a layout with no remembered mapping gets suggestions and profiles."""
+        upload = tmp_path / "transactions.csv"
+        upload.write_text("customer_id,invoice_date,invoice_id,amount\nC001,2025-01-01,INV001,100\n")
+
+        with open(upload, "rb") as f:
+            response = client.post(
+                "/api/jobs/upload/preview",
+                files={"file": ("transactions.csv", f, "text/csv")},
+                headers=auth_headers
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["mapping_source"] == "suggested"
+        assert data["remembered_options"] is None
+        assert len(data["column_profiles"]) == 4
+
+    def test_upload_stores_content_hash(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test uploads are hashed while streaming and the hash reaches the job row and worker."""
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "OUTPUT_DIR", tmp_path / "outputs")
+        queued = []
+        monkeypatch.setattr(jobs_routes, "run_segmentation_job", lambda **kwargs: queued.append(kwargs))
+        content = b"customer_id,invoice_date,invoice_id,amount\nC001,2025-01-01,INV001,100\n"
+
+        response = client.post(
+            "/api/jobs/upload",
+            files={"file": ("test.csv", io.BytesIO(content), "text/csv")},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        digest = hashlib.sha256(content).hexdigest()
+        assert queued[0]["content_digest"] == digest
+        db = TestingSessionLocal()
+        try:
+            job = db.query(Job).filter(Job.job_id == response.json()["job_id"]).one()
+            assert job.upload_sha256 == digest
+            assert job.upload_size_bytes == len(content)
+            assert job.preprocess_cache_key
+        finally:
+            db.close()
+
+    def test_incremental_upload_and_rfm_state(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test incremental jobs get the user's state path, which can be read and reset."""
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "OUTPUT_DIR", tmp_path / "outputs")
+        monkeypatch.setattr(rfm_state, "RFM_STATE_DIR", tmp_path / "rfm_state")
+        queued = []
+        monkeypatch.setattr(jobs_routes, "run_segmentation_job", lambda **kwargs: queued.append(kwargs))
+        content = b"customer_id,invoice_date,invoice_id,amount\nC001,2025-01-01,INV001,100\nC002,2025-01-03,INV002,40\n"
+
+        for incremental in ("false", "true"):
+            response = client.post(
+                "/api/jobs/upload",
+                files={"file": ("week.csv", io.BytesIO(content), "text/csv")},
+                data={"incremental": incremental},
+                headers=auth_headers
+            )
+            assert response.status_code == 200
+        assert queued[0]["rfm_state_path"] is None
+        state_path = Path(queued[1]["rfm_state_path"])
+        assert state_path.parent == tmp_path / "rfm_state"
+
+        assert client.get("/api/jobs/rfm-state", headers=auth_headers).json()["customers"] == 0
+        state = rfm_state.RFMState()
+        state.update(pd.read_csv(io.BytesIO(content), parse_dates=["invoice_date"]))
+        state.save(state_path)
+        summary = client.get("/api/jobs/rfm-state", headers=auth_headers).json()
+        assert summary["customers"] == 2
+        assert summary["total_revenue"] == 140.0
+
+        assert client.delete("/api/jobs/rfm-state", headers=auth_headers).status_code == 200
+        assert not state_path.exists()
+
+    def test_upload_over_size_limit_rejected(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test oversized uploads get 413 and leave nothing on disk."""
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "MAX_FILE_SIZE_MB", 0)
+
+        response = client.post(
+            "/api/jobs/upload/preview",
+            files={"file": ("test.csv", io.BytesIO(b"customer_id,amount\nC001,100\n"), "text/csv")},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 413
+        assert not any((tmp_path / "uploads").glob("*"))
+
+    def test_upload_preview_gzip(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test .csv.gz uploads are accepted and previewed without inflating to disk."""
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        content = gzip.compress(b"customer_id,invoice_date,invoice_id,amount\nC001,2025-01-01,INV001,100\n")
+
+        response = client.post(
+            "/api/jobs/upload/preview",
+            files={"file": ("export.csv.gz", io.BytesIO(content), "application/gzip")},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        assert response.json()["columns"] == ["customer_id", "invoice_date", "invoice_id", "amount"]
+        assert not any((tmp_path / "uploads").glob("*"))
+
+    def test_upload_preview_xlsx_sheet(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test Excel uploads preview the requested sheet and list the workbook's sheets."""
+        openpyxl = pytest.importorskip("openpyxl")
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        book = openpyxl.Workbook()
+        book.active.title = "Summary"
+        book.active.append(["Total"])
+        book.active.append([100])
+        sales = book.create_sheet("Sales")
+        sales.append(["customer_id", "invoice_date", "invoice_id", "amount"])
+        sales.append(["C001", "2025-01-01", "INV001", 100])
+        content = io.BytesIO()
+        book.save(content)
+
+        def preview(sheet_name):
+            content.seek(0)
+            return client.post(
+                "/api/jobs/upload/preview",
+                files={"file": ("export.xlsx", content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+                data={"sheet_name": sheet_name},
+                headers=auth_headers
+            )
+
+        response = preview("Sales")
+        missing = preview("Missing")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["sheets"] == ["Summary", "Sales"]
+        assert data["sheet_name"] == "Sales"
+        assert data["columns"] == ["customer_id", "invoice_date", "invoice_id", "amount"]
+        assert data["suggested_mapping"]["invoice_id"] == "invoice_id"
+        assert missing.status_code == 400
+        assert "Sheet 'Missing' not found" in missing.json()["detail"]
+
+    def test_sql_source_job(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test a job can read a configured database: preview, then queue with the stored query."""
+        database = tmp_path / "pos.db"
+        with sqlite3.connect(database) as connection:
+            connection.execute("CREATE TABLE sales (customer_id TEXT, invoice_date TEXT, invoice_id TEXT, amount REAL)")
+            connection.execute("INSERT INTO sales VALUES ('C001', '2025-01-01', 'INV001', 100)")
+        monkeypatch.setitem(ingestion.SQL_SOURCES, "pos", {"url": f"sqlite:///{database}", "users": ["test@example.com"]})
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "OUTPUT_DIR", tmp_path / "outputs")
+        queued = []
+        monkeypatch.setattr(jobs_routes, "run_segmentation_job", lambda **kwargs: queued.append(kwargs))
+        query = {"connection": "pos", "query": "SELECT * FROM sales"}
+
+        sources = client.get("/api/jobs/sql/sources", headers=auth_headers)
+        preview = client.post("/api/jobs/sql/preview", json=query, headers=auth_headers)
+        rejected = client.post("/api/jobs/sql", json={**query, "query": "DROP TABLE sales"}, headers=auth_headers)
+        response = client.post("/api/jobs/sql", json=query, headers=auth_headers)
+
+        assert "pos" in sources.json()["sources"]
+        assert preview.status_code == 200
+        assert preview.json()["columns"] == ["customer_id", "invoice_date", "invoice_id", "amount"]
+        assert preview.json()["total_rows"] == 1
+        assert rejected.status_code == 400
+        assert response.status_code == 200
+        assert queued[0]["file_path"].endswith(".sqlquery")
+        assert ingestion.source_format(queued[0]["file_path"]) == "sql"
+        assert not any((tmp_path / "uploads").glob("temp_*"))
+
+    def test_sql_source_private_to_its_users(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test accounts not listed for a source cannot see, preview or query it."""
+        monkeypatch.setitem(ingestion.SQL_SOURCES, "pos", {"url": "sqlite://", "users": ["test@example.com"]})
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "OUTPUT_DIR", tmp_path / "outputs")
+        queued = []
+        monkeypatch.setattr(jobs_routes, "run_segmentation_job", lambda **kwargs: queued.append(kwargs))
+        client.post("/api/auth/register", json={"email": "other@example.com", "password": "password123"})
+        token = client.post(
+            "/api/auth/login/json", json={"email": "other@example.com", "password": "password123"}
+        ).json()["access_token"]
+        other = {"Authorization": f"Bearer {token}"}
+        query = {"connection": "pos", "query": "SELECT 1 AS amount"}
+
+        assert client.get("/api/jobs/sql/sources", headers=auth_headers).json()["sources"] == ["pos"]
+        assert client.get("/api/jobs/sql/sources", headers=other).json()["sources"] == []
+        assert client.post("/api/jobs/sql/preview", json=query, headers=other).status_code == 404
+        assert client.post("/api/jobs/sql", json=query, headers=other).status_code == 404
+        assert queued == []
+
+    def test_upload_over_decompressed_limit_rejected(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test compressed uploads whose inflated size passes the limit get 413."""
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "MAX_UNCOMPRESSED_MB", 1)
+        content = gzip.compress(b"customer_id,amount\n" + b"C001,100\n" * 200_000)
+
+        response = client.post(
+            "/api/jobs/upload/preview",
+            files={"file": ("export.csv.gz", io.BytesIO(content), "application/gzip")},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 413
+        assert "decompressed" in response.json()["detail"]
+        assert not any((tmp_path / "uploads").glob("*"))
+
+    def test_oversized_form_rejected_before_parsing(self, client, tmp_path, monkeypatch):
+        """Test a form body over the limit gets 413 from its size alone, before auth or parsing."""
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(middleware, "MAX_FILE_SIZE_MB", 1)
+        body = b"x" * (2 * 1024 * 1024)
+
+        declared = client.post(
+            "/api/jobs/upload/preview",
+            files={"file": ("big.csv", io.BytesIO(body), "text/csv")},
+        )
+        chunked = client.post(
+            "/api/jobs/upload/preview",
+            content=iter([body[:1024 * 1024], body[1024 * 1024:]]),
+            headers={"Content-Type": "multipart/form-data; boundary=xyz"},
+        )
+
+        # No auth headers: a 401 would mean the body was parsed first
+        assert declared.status_code == 413
+        assert chunked.status_code == 413
+        assert "1 MB upload limit" in declared.json()["detail"]
+        assert not (tmp_path / "uploads").exists()
+
+    def test_stream_upload_stops_at_limit(self, tmp_path, monkeypatch):
+        """Test streaming aborts once the byte count passes the limit, even without a declared size."""
+        from fastapi import HTTPException, UploadFile
+
+        monkeypatch.setattr(jobs_routes, "MAX_FILE_SIZE_MB", 1)
+        monkeypatch.setattr(jobs_routes, "UPLOAD_CHUNK_KB", 64)
+        small = b"a,b\n1,2\n" * 1000
+        destination = tmp_path / "small.csv"
+
+        streamed = stream_upload(UploadFile(io.BytesIO(small), filename="small.csv"), destination)
+
+        assert streamed == {"sha256": hashlib.sha256(small).hexdigest(), "size_bytes": len(small), "line_count": 2000}
+        assert destination.read_bytes() == small
+
+        source = io.BytesIO(b"x" * (3 * 1024 * 1024))
+        with pytest.raises(HTTPException) as excinfo:
+            stream_upload(UploadFile(source, filename="big.csv"), tmp_path / "big.csv")
+
+        assert excinfo.value.status_code == 413
+        assert not (tmp_path / "big.csv").exists()
+        # Stopped one chunk past the 1 MB limit instead of reading all 3 MB
+        assert source.tell() == 1024 * 1024 + 64 * 1024
+
     def test_get_job_status_not_found(self, client, auth_headers):
         """Test getting status of non-existent job."""
         response = client.get(
@@ -320,6 +649,34 @@ class TestJobEndpoints:
         
         assert response.status_code == 404
 
+    def test_delete_job_evicts_cached_frame(self, client, auth_headers, tmp_path, monkeypatch):
+        """Test deleting a job drops its cached canonical frame once no other job uses it."""
+        cache = FrameCache(tmp_path / "cache", max_bytes=10 * 1024 * 1024)
+        monkeypatch.setattr(jobs_routes, "PREPROCESS_CACHE", cache)
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "OUTPUT_DIR", tmp_path / "outputs")
+        cache.put("shared-key", {"rows": 1})
+        db = TestingSessionLocal()
+        try:
+            user = db.query(User).filter(User.email == "test@example.com").first()
+            for job_id in ("job-delete-1", "job-delete-2"):
+                db.add(Job(
+                    job_id=job_id,
+                    user_id=user.id,
+                    original_filename="test.csv",
+                    upload_path=f"users/1/jobs/{job_id}/test.csv",
+                    preprocess_cache_key="shared-key",
+                    status="completed",
+                ))
+            db.commit()
+        finally:
+            db.close()
+
+        assert client.delete("/api/jobs/job-delete-1", headers=auth_headers).status_code == 200
+        assert cache.get("shared-key") is not None
+        assert client.delete("/api/jobs/job-delete-2", headers=auth_headers).status_code == 200
+        assert cache.get("shared-key") is None
+
     def test_cancel_job_success(self, client, auth_headers):
         """Test cancelling a pending job."""
         db = TestingSessionLocal()
@@ -365,6 +722,162 @@ class TestJobEndpoints:
         assert response.status_code == 400
 
 
+class TestResumableUploads:
+    """Test cases for chunked uploads that survive dropped connections."""
+
+    CONTENT = b"customer_id,invoice_date,invoice_id,amount\n" + b"".join(
+        f"C{i:03d},2025-01-{i % 28 + 1:02d},INV{i:04d},{i * 3}\n".encode() for i in range(200)
+    )
+
+    @pytest.fixture(autouse=True)
+    def setup(self, tmp_path, monkeypatch):
+        """Set up the database and point uploads at a temporary directory with 1 KB chunks."""
+        Base.metadata.create_all(bind=engine)
+        monkeypatch.setattr(jobs_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(jobs_routes, "OUTPUT_DIR", tmp_path / "outputs")
+        monkeypatch.setattr(uploads_routes, "UPLOAD_DIR", tmp_path / "uploads")
+        monkeypatch.setattr(uploads_routes, "RESUMABLE_CHUNK_KB", 1)
+        self.queued = []
+        monkeypatch.setattr(jobs_routes, "run_segmentation_job", lambda **kwargs: self.queued.append(kwargs))
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    @pytest.fixture
+    def client(self):
+        """Create test client."""
+        return TestClient(app)
+
+    def login(self, client, email):
+        """Register a user and return their auth headers."""
+        client.post("/api/auth/register", json={"email": email, "password": "password123"})
+        response = client.post("/api/auth/login/json", json={"email": email, "password": "password123"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def start(self, client, headers, content, **extra):
+        response = client.post(
+            "/api/jobs/uploads",
+            json={"filename": "transactions.csv", "size_bytes": len(content), **extra},
+            headers=headers
+        )
+        assert response.status_code == 201
+        return response.json()
+
+    def send(self, client, headers, upload, content, indexes, cut_short=()):
+        """
+        Send the given chunks. Chunks in cut_short lose their second half, as when
+        the connection drops mid-request. Returns the last response.
+        """
+        chunk_size = upload["chunk_size"]
+        response = None
+        for index in indexes:
+            body = content[index * chunk_size:(index + 1) * chunk_size]
+            if index in cut_short:
+                body = body[:len(body) // 2]
+            response = client.put(
+                f"/api/jobs/uploads/{upload['upload_id']}/chunks/{index}",
+                content=body,
+                headers=headers
+            )
+        return response
+
+    def test_interrupted_upload_resumes_and_creates_job(self, client):
+        """Test a transfer that drops mid-chunk resumes from the reported offset and completes."""
+        headers = self.login(client, "resume@example.com")
+        content = self.CONTENT
+        digest = hashlib.sha256(content).hexdigest()
+        upload = self.start(client, headers, content, sha256=digest)
+        assert upload["total_chunks"] > 3
+
+        # The connection drops part-way through chunk 2: it is rejected and not recorded
+        dropped = self.send(client, headers, upload, content, range(3), cut_short={2})
+        assert dropped.status_code == 400
+
+        status_response = client.get(f"/api/jobs/uploads/{upload['upload_id']}", headers=headers)
+        progress = status_response.json()
+        assert progress["next_chunk"] == 2
+        assert progress["offset"] == 2 * upload["chunk_size"]
+        assert progress["complete"] is False
+
+        resumed = self.send(client, headers, upload, content, range(progress["next_chunk"], upload["total_chunks"]))
+        assert resumed.status_code == 200
+        assert resumed.json()["complete"] is True
+        assert resumed.json()["offset"] == len(content)
+
+        response = client.post(f"/api/jobs/uploads/{upload['upload_id']}/complete", json={}, headers=headers)
+
+        assert response.status_code == 200
+        job_id = response.json()["job_id"]
+        assert self.queued[0]["content_digest"] == digest
+        assert Path(self.queued[0]["file_path"]).read_bytes() == content
+        db = TestingSessionLocal()
+        try:
+            job = db.query(Job).filter(Job.job_id == job_id).one()
+            assert job.upload_sha256 == digest
+            assert job.upload_size_bytes == len(content)
+            assert job.preprocess_cache_key
+            assert job.original_filename == "transactions.csv"
+        finally:
+            db.close()
+        # The session is gone once the job exists
+        assert client.get(f"/api/jobs/uploads/{upload['upload_id']}", headers=headers).status_code == 404
+
+    def test_complete_with_missing_chunks_conflicts(self, client):
+        """Test completion is refused, and no job created, while chunks are missing."""
+        headers = self.login(client, "missing@example.com")
+        upload = self.start(client, headers, self.CONTENT)
+        self.send(client, headers, upload, self.CONTENT, [0, 2])
+
+        response = client.post(f"/api/jobs/uploads/{upload['upload_id']}/complete", json={}, headers=headers)
+
+        assert response.status_code == 409
+        assert "[1, 3" in response.json()["detail"]
+        assert self.queued == []
+        assert client.get("/api/jobs/", headers=headers).json() == []
+
+    def test_checksum_mismatch_rejected(self, client):
+        """Test an assembled file that does not match the declared SHA-256 is discarded."""
+        headers = self.login(client, "checksum@example.com")
+        upload = self.start(client, headers, self.CONTENT, sha256=hashlib.sha256(b"other").hexdigest())
+        corrupted = self.CONTENT.replace(b"C001", b"X001")
+        self.send(client, headers, upload, corrupted, range(upload["total_chunks"]))
+
+        response = client.post(f"/api/jobs/uploads/{upload['upload_id']}/complete", json={}, headers=headers)
+
+        assert response.status_code == 400
+        assert self.queued == []
+        assert not any(path.is_file() for path in jobs_routes.UPLOAD_DIR.glob("*/transactions.csv"))
+
+    def test_other_users_cannot_touch_upload(self, client):
+        """Test sessions are private to the user who started them."""
+        owner = self.login(client, "owner@example.com")
+        intruder = self.login(client, "intruder@example.com")
+        upload = self.start(client, owner, self.CONTENT)
+
+        assert client.get(f"/api/jobs/uploads/{upload['upload_id']}", headers=intruder).status_code == 404
+        assert self.send(client, intruder, upload, self.CONTENT, [0]).status_code == 404
+        assert client.delete(f"/api/jobs/uploads/{upload['upload_id']}", headers=intruder).status_code == 404
+        assert client.delete(f"/api/jobs/uploads/{upload['upload_id']}", headers=owner).status_code == 200
+
+    def test_oversized_or_invalid_upload_rejected(self, client, monkeypatch):
+        """Test initiation applies the same file type and size limits as direct uploads."""
+        headers = self.login(client, "limits@example.com")
+        monkeypatch.setattr(uploads_routes, "MAX_FILE_SIZE_MB", 1)
+
+        too_large = client.post(
+            "/api/jobs/uploads",
+            json={"filename": "transactions.csv", "size_bytes": 2 * 1024 * 1024},
+            headers=headers
+        )
+        wrong_type = client.post(
+            "/api/jobs/uploads",
+            json={"filename": "transactions.txt", "size_bytes": 10},
+            headers=headers
+        )
+
+        assert too_large.status_code == 413
+        assert wrong_type.status_code == 400
+
+
 class TestHealthEndpoint:
     """Test cases for health check endpoint."""
     
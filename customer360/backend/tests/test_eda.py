@@ -0,0 +1,107 @@
+"""
+Unit tests for the single-pass EDA summary.
+"""
+import pytest
+import pandas as pd
+import numpy as np
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.eda import EDAAccumulator
+from app.analytics.sketches import HeavyHitters
+
+
+class TestEDAAccumulator:
+    """Test cases for EDAAccumulator."""
+
+    @pytest.fixture
+    def transactions(self):
+        """Cleaned transactions with a repeated row, missing values and label columns."""
+        rng = np.random.default_rng(7)
+        n = 400
+        df = pd.DataFrame({
+            'customer_id': pd.Categorical(rng.integers(0, 40, n).astype(str)),
+            'invoice_date': pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 90, n), unit='D'),
+            'invoice_id': [f"INV{i:04d}" for i in range(n)],
+            'amount': rng.gamma(2.0, 50.0, n).astype('float32'),
+            'qty': rng.integers(1, 6, n),
+            'price': np.where(rng.random(n) < 0.1, np.nan, rng.gamma(2.0, 20.0, n)),
+            'category': pd.Categorical(rng.choice(['Food', 'Drinks', 'Household', None], n)),
+            'product': rng.choice([f"P{i}" for i in range(25)], n),
+        })
+        return pd.concat([df, df.iloc[[3, 3, 10]]], ignore_index=True)
+
+    def test_matches_multi_pass_summary(self, transactions):
+        """Test the one-pass summary agrees with pandas' separate passes."""
+        summary = EDAAccumulator().add(transactions).summary()
+
+        assert summary['rows'] == len(transactions)
+        assert summary['columns'] == 8
+        assert summary['duplicates'] == int(transactions.duplicated().sum()) == 3
+        assert summary['missing_values'] == int(transactions.isna().sum().sum())
+        for column in ['amount', 'qty', 'price']:
+            series = transactions[column].astype(float).dropna()
+            stats = summary['numeric_summary'][column]
+            assert stats['mean'] == pytest.approx(series.mean())
+            assert stats['median'] == pytest.approx(series.median())
+            assert stats['std'] == pytest.approx(series.std())
+            assert stats['min'] == pytest.approx(series.min())
+            assert stats['max'] == pytest.approx(series.max())
+        expected = transactions['category'].astype(str).value_counts()
+        assert {item['label']: item['count'] for item in summary['top_categories']} == expected.to_dict()
+        assert summary['top_payments'] == []
+
+    def test_internal_columns_are_skipped(self, transactions):
+        """Test the customer_code column added by compact_frame is not summarised."""
+        compacted = transactions.assign(customer_code=transactions['customer_id'].cat.codes.astype(np.int32))
+
+        summary = EDAAccumulator().add(compacted).summary()
+
+        assert summary == EDAAccumulator().add(transactions).summary()
+        assert summary['columns'] == 8
+
+    def test_chunks_and_merge_match_whole_frame(self, transactions):
+        """Test chunked adds and merged accumulators give the whole-frame summary."""
+        whole = EDAAccumulator().add(transactions).summary()
+
+        chunked = EDAAccumulator()
+        for start in range(0, len(transactions), 64):
+            chunked.add(transactions.iloc[start:start + 64])
+        left = EDAAccumulator().add(transactions.iloc[:150])
+        right = EDAAccumulator().add(transactions.iloc[150:])
+
+        for summary in (chunked.summary(), left.merge(right).summary()):
+            # Duplicates of row 3 sit in the last chunk, far from the original
+            assert summary['duplicates'] == 3
+            assert summary['top_products'] == whole['top_products']
+            assert summary['missing_values'] == whole['missing_values']
+            for column, stats in whole['numeric_summary'].items():
+                assert summary['numeric_summary'][column] == pytest.approx(stats)
+
+
+class TestHeavyHitters:
+    """Test cases for the HeavyHitters frequent-values summary."""
+
+    def test_exact_within_capacity(self):
+        """Test counts are exact while distinct values fit in the counters."""
+        values = pd.Series(['a'] * 5 + ['b'] * 3 + ['c'] * 3 + ['d'])
+
+        top = HeavyHitters(capacity=4).add(values).top(3)
+
+        assert top == [('a', 5), ('b', 3), ('c', 3)]
+
+    def test_bounded_error_beyond_capacity(self):
+        """Test frequent values survive overflow with counts short by at most the error."""
+        rng = np.random.default_rng(0)
+        values = pd.Series(np.concatenate([np.repeat(['hot'], 300), rng.integers(0, 500, 1700).astype(str)]))
+        sketch = HeavyHitters(capacity=20)
+        for chunk in np.array_split(rng.permutation(values.to_numpy()), 7):
+            sketch.add(pd.Series(chunk))
+
+        label, count = sketch.top(1)[0]
+        assert label == 'hot'
+        assert 300 - sketch.error <= count <= 300
+        assert len(sketch.counts) <= 20
+        assert sketch.total == len(values)
@@ -1,17 +1,41 @@
 """
 Unit tests for data preprocessing module.
 """
+import gzip
+import json
+import os
+import sqlite3
+import zipfile
+
 import pytest
 import pandas as pd
 import numpy as np
+import sqlalchemy as sa
 from datetime import datetime
 
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app import config
+from app.analytics.cache import FrameCache
+from app.analytics import ingestion
+from app.analytics.ingestion import detect_encoding, iter_csv_chunks
+from app.analytics.sketches import HyperLogLog, hash_values
+from app.analytics import preprocessing
 from app.analytics.preprocessing import (
+    _parse_locale_numeric_series,
+    cached_preprocess_transaction_data,
+    compact_frame,
+    customer_lookup,
+    get_csv_preview,
+    header_signature,
     load_csv,
+    preprocess_cache_key,
+    preprocess_transaction_data,
+    profile_dataframe,
+    read_columns,
+    remap_to_header,
     suggest_column_mapping,
     clean_data,
     validate_numeric_column,
@@ -55,6 +79,635 @@ class TestLoadCSV:
         assert len(loaded) == 2
         assert 'Kwame' in loaded['name'].values
 
+    def test_load_csv_chunked_matches_full_read(self, tmp_path):
+        """Test streamed loading keeps every usable row and counts blank rows."""
+        csv_file = tmp_path / "chunked.csv"
+        csv_file.write_text(
+            "customer_id,invoice_date,amount\n"
+            "C001,2026-01-01,100\n"
+            ",,\n"
+            "C002,2026-01-02,200\n"
+            "C003,2026-01-03,300\n"
+            ",,\n"
+            "C004,2026-01-04,400\n"
+        )
+
+        loaded = load_csv(str(csv_file), chunksize=2)
+
+        assert list(loaded['customer_id']) == ['C001', 'C002', 'C003', 'C004']
+        assert loaded.attrs['raw_rows'] == 6
+        assert loaded.attrs['removed_blank_rows'] == 2
+
+    def test_iter_csv_chunks_rejects_rows_early(self, tmp_path):
+        """Test the row limit is enforced while streaming, before the file is fully read."""
+        csv_file = tmp_path / "large.csv"
+        rows = "\n".join(f"C{i:04d},2026-01-01,{i}" for i in range(100))
+        csv_file.write_text("customer_id,invoice_date,amount\n" + rows + "\n")
+
+        stats = {}
+        with pytest.raises(ValueError, match="at least 30 rows which exceeds the maximum of 25"):
+            for _ in iter_csv_chunks(str(csv_file), chunksize=10, max_rows=25, stats=stats):
+                pass
+
+        assert stats['usable_rows'] == 30
+
+    def test_iter_csv_chunks_memory_ceiling(self, tmp_path):
+        """Test the memory ceiling rejects a frame that grows too large."""
+        csv_file = tmp_path / "wide.csv"
+        rows = "\n".join(f"C{i:04d},{'x' * 200}" for i in range(500))
+        csv_file.write_text("customer_id,notes\n" + rows + "\n")
+
+        with pytest.raises(ValueError, match="memory"):
+            list(iter_csv_chunks(str(csv_file), chunksize=100, max_memory_mb=0.05))
+
+
+class TestReaderEngines:
+    """Test cases for the Arrow and pandas CSV reader engines."""
+
+    @pytest.fixture
+    def export_csv(self, tmp_path):
+        csv_file = tmp_path / "export.csv"
+        csv_file.write_text(
+            "customer_id,invoice_date,amount,notes\n"
+            "00101,2026-01-01,\"1,200.50\",walk-in\n"
+            ",,,\n"
+            "00102,2026-01-02,80.00,\n"
+            "00101,2026-01-05,45.25,repeat\n"
+        )
+        return csv_file
+
+    def test_arrow_engine_matches_pandas(self, export_csv):
+        """Test both engines load the same text values and blank-row counts."""
+        pytest.importorskip("pyarrow")
+        arrow_df = load_csv(str(export_csv), chunksize=2, engine='pyarrow')
+        pandas_df = load_csv(str(export_csv), chunksize=2, engine='pandas')
+
+        assert arrow_df.attrs['reader_engine'] == 'pyarrow'
+        assert str(arrow_df['customer_id'].dtype) == 'string[pyarrow]'
+        assert arrow_df.astype(object).where(arrow_df.notna(), None).values.tolist() == \
+            pandas_df.astype(object).where(pandas_df.notna(), None).values.tolist()
+        assert arrow_df.attrs['removed_blank_rows'] == pandas_df.attrs['removed_blank_rows'] == 1
+
+    def test_arrow_engine_falls_back_on_ragged_rows(self, tmp_path):
+        """Test a file Arrow rejects is still loaded by the pandas reader."""
+        pytest.importorskip("pyarrow")
+        csv_file = tmp_path / "ragged.csv"
+        csv_file.write_text("customer_id,invoice_date,amount\nC001,2026-01-01,10\nC002,2026-01-02\n")
+
+        loaded = load_csv(str(csv_file), engine='pyarrow')
+
+        assert loaded.attrs['reader_engine'] == 'pandas'
+        assert len(loaded) == 2
+
+    def test_arrow_fallback_retries_other_encodings(self, tmp_path):
+        """Test an undecodable byte in the pandas fallback moves on to the next encoding."""
+        pytest.importorskip("pyarrow")
+        csv_file = tmp_path / "ragged_latin1.csv"
+        csv_file.write_bytes(b"customer_id,invoice_date,amount\nC001,2026-01-01\nCaf\xe9,2026-01-02,10\n")
+
+        loaded = load_csv(str(csv_file), engine='pyarrow', encoding='utf-8')
+
+        assert loaded.attrs['reader_engine'] == 'pandas'
+        assert loaded.attrs['encoding'] != 'utf-8'
+        assert loaded['customer_id'].tolist() == ['C001', 'Café']
+
+    def test_unprojected_arrow_read_infers_numbers(self, export_csv):
+        """Test a whole-file Arrow read infers numeric dtypes like pandas and keeps dates as text."""
+        pytest.importorskip("pyarrow")
+        arrow_df = load_csv(str(export_csv), engine='pyarrow')
+        pandas_df = load_csv(str(export_csv), engine='pandas')
+
+        assert arrow_df['customer_id'].tolist() == pandas_df['customer_id'].tolist() == [101, 102, 101]
+        assert arrow_df['customer_id'].dtype == pandas_df['customer_id'].dtype
+        assert arrow_df['invoice_date'].tolist() == ['2026-01-01', '2026-01-02', '2026-01-05']
+        assert pd.api.types.is_string_dtype(arrow_df['invoice_date'])
+
+    def test_engine_reported_in_parser_options(self, export_csv):
+        """Test preprocessing reports which reader parsed the file."""
+        _, metadata = preprocess_transaction_data(str(export_csv), {
+            'customer_id': 'customer_id',
+            'invoice_date': 'invoice_date',
+            'amount': 'amount',
+        })
+
+        assert metadata['parser_options']['reader_engine'] in {'pyarrow', 'pandas'}
+
+
+class TestSampledPreview:
+    """Test cases for the head-and-samples upload preview."""
+
+    @pytest.fixture
+    def large_csv(self, tmp_path):
+        csv_file = tmp_path / "large.csv"
+        lines = ["customer_id,invoice_date,invoice_id,amount"]
+        for i in range(60000):
+            lines.append(f"C{i % 5000:05d},2026-01-{i % 28 + 1:02d},INV{i:07d},{(i % 900) + 0.5}")
+            if i % 100 == 0:
+                lines.append(",,,")
+        csv_file.write_text("\n".join(lines) + "\n")
+        return csv_file
+
+    def test_large_file_preview_is_estimated(self, large_csv):
+        """Test a large file is previewed from samples with a close row estimate."""
+        preview = get_csv_preview(str(large_csv))
+
+        assert preview['row_count_estimated'] is True
+        assert preview['columns'] == ['customer_id', 'invoice_date', 'invoice_id', 'amount']
+        assert preview['sample_rows'][0]['invoice_id'] == 'INV0000000'
+        assert abs(preview['total_rows'] - 60000) < 60000 * 0.05
+        assert abs(preview['removed_blank_rows'] - 600) < 300
+
+    def test_exact_preview_counts_every_row(self, large_csv):
+        """Test exact mode still loads the whole file."""
+        preview = get_csv_preview(str(large_csv), exact=True)
+
+        assert preview['row_count_estimated'] is False
+        assert preview['total_rows'] == 60000
+        assert preview['removed_blank_rows'] == 600
+
+    def test_estimated_rows_over_limit_are_rejected(self, large_csv, monkeypatch):
+        """Test the row limit applies to the estimated count of a sampled preview."""
+        monkeypatch.setattr(preprocessing, 'MAX_ROWS', 10000)
+
+        with pytest.raises(ValueError, match="about .* rows which exceeds the maximum of 10,000"):
+            get_csv_preview(str(large_csv))
+
+    def test_multiline_field_across_head_cut_falls_back(self, tmp_path):
+        """Test a quoted multi-line field cut off by the head block falls back to the exact preview."""
+        head_bytes = ingestion.PREVIEW_HEAD_KB * 1024
+        text = "customer_id,invoice_date,invoice_id,amount,note\n"
+        i = 0
+        while len(text) < head_bytes - 100:
+            text += f"C{i % 5000:05d},2026-01-{i % 28 + 1:02d},INV{i:07d},{(i % 900) + 0.5},plain\n"
+            i += 1
+        # The embedded newline is the last one inside the head block
+        text += f"C99999,2026-01-01,INV{i:07d},1.5,\"first line\n{'x' * 60}\"\n"
+        rows = [f"C{j % 5000:05d},2026-01-{j % 28 + 1:02d},INV{j:07d},{(j % 900) + 0.5},plain"
+                for j in range(i + 1, 40000)]
+        csv_file = tmp_path / "multiline.csv"
+        csv_file.write_text(text + "\n".join(rows) + "\n")
+
+        preview = get_csv_preview(str(csv_file))
+
+        assert preview['row_count_estimated'] is False
+        assert preview['total_rows'] == 40000
+
+    def test_small_file_preview_is_exact(self, tmp_path):
+        """Test files smaller than the sample budget are counted exactly."""
+        csv_file = tmp_path / "small.csv"
+        csv_file.write_text("customer_id,invoice_date,invoice_id,amount\nC001,2026-01-01,INV1,10\n")
+
+        preview = get_csv_preview(str(csv_file))
+
+        assert preview['row_count_estimated'] is False
+        assert preview['total_rows'] == 1
+
+
+class TestColumnarUploads:
+    """Test cases for Parquet and Feather uploads."""
+
+    @pytest.fixture
+    def transactions(self):
+        return pd.DataFrame({
+            'Customer ID': ['00101', '00102', '00101', '00103', '00102', '00104'],
+            'Txn Date': pd.to_datetime(['2026-01-01', '2026-01-02', '2026-01-05',
+                                        '2026-01-06', '2026-01-08', '2026-01-09']),
+            'Receipt': ['R1', 'R2', 'R3', 'R4', 'R5', 'R6'],
+            'Total': [120.5, 80.0, 45.25, 10.0, 60.0, 5.0],
+            'Cashier': ['Esi', 'Yaw', 'Esi', 'Ama', 'Yaw', 'Ama'],
+        })
+
+    def test_parquet_preprocessing_reads_mapped_columns(self, tmp_path, transactions):
+        """Test a Parquet upload keeps its types and reads only the mapped columns."""
+        pytest.importorskip("pyarrow")
+        parquet_file = tmp_path / "export.parquet"
+        transactions.to_parquet(parquet_file, index=False, row_group_size=2)
+
+        df, metadata = preprocess_transaction_data(str(parquet_file), {
+            'customer_id': 'Customer ID',
+            'invoice_date': 'Txn Date',
+            'invoice_id': 'Receipt',
+            'amount': 'Total',
+        })
+
+        assert metadata['parser_options']['source_format'] == 'parquet'
+        assert 'Cashier' not in metadata['projected_columns']
+        assert df['amount'].sum() == pytest.approx(320.75)
+        assert df['invoice_date'].min() == pd.Timestamp('2026-01-01')
+
+    def test_parquet_preview_reads_one_row_group(self, tmp_path, transactions):
+        """Test previews profile the first row group and count rows from metadata."""
+        pytest.importorskip("pyarrow")
+        parquet_file = tmp_path / "export.parquet"
+        transactions.to_parquet(parquet_file, index=False, row_group_size=2)
+
+        preview = get_csv_preview(str(parquet_file), num_rows=5)
+
+        assert preview['total_rows'] == 6
+        assert len(preview['sample_rows']) == 2
+        assert preview['sample_rows'][0]['Txn Date'] == '2026-01-01'
+        assert preview['suggested_mapping']['customer_id'] == 'Customer ID'
+
+    def test_feather_load_with_projection(self, tmp_path, transactions):
+        """Test a Feather upload loads only the requested columns."""
+        pytest.importorskip("pyarrow")
+        feather_file = tmp_path / "export.feather"
+        transactions.to_feather(feather_file)
+
+        loaded = load_csv(str(feather_file), usecols=[0, 3])
+
+        assert list(loaded.columns) == ['Customer ID', 'Total']
+        assert loaded.attrs['source_format'] == 'feather'
+        assert len(loaded) == 6
+
+
+class TestCompressedUploads:
+    """Test cases for .csv.gz and .zip uploads."""
+
+    CSV_BYTES = (
+        "Customer ID,Txn Date,Receipt,Total\n"
+        "00101,2026-01-01,R1,\"1,120.50\"\n"
+        ",,,\n"
+        "00102,2026-01-02,R2,80\n"
+        "00101,2026-01-05,R3,45.25\n"
+    ).encode('utf-8')
+
+    @pytest.fixture
+    def plain_csv(self, tmp_path):
+        path = tmp_path / "export.csv"
+        path.write_bytes(self.CSV_BYTES)
+        return path
+
+    @pytest.fixture
+    def gzip_csv(self, tmp_path):
+        path = tmp_path / "export.csv.gz"
+        path.write_bytes(gzip.compress(self.CSV_BYTES))
+        return path
+
+    @pytest.fixture
+    def zip_csv(self, tmp_path):
+        path = tmp_path / "export.zip"
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('exports/', '')
+            archive.writestr('__MACOSX/exports/._export.csv', b'resource fork')
+            archive.writestr('exports/export.csv', self.CSV_BYTES)
+        return path
+
+    @pytest.mark.parametrize('engine', ['pyarrow', 'pandas'])
+    @pytest.mark.parametrize('chunksize', [None, 2])
+    def test_compressed_loads_match_plain(self, plain_csv, gzip_csv, zip_csv, engine, chunksize):
+        """Test gzip and zip uploads load exactly like the uncompressed file."""
+        if engine == 'pyarrow':
+            pytest.importorskip("pyarrow")
+        expected = load_csv(str(plain_csv), engine=engine, chunksize=chunksize)
+
+        for compressed in (gzip_csv, zip_csv):
+            loaded = load_csv(str(compressed), engine=engine, chunksize=chunksize)
+            pd.testing.assert_frame_equal(loaded, expected)
+            assert loaded.attrs['removed_blank_rows'] == 1
+
+    def test_compressed_preview_and_size(self, gzip_csv, zip_csv):
+        """Test previews work on compressed uploads and sizes are the inflated ones."""
+        for compressed in (gzip_csv, zip_csv):
+            preview = get_csv_preview(str(compressed))
+            assert preview['columns'] == ['Customer ID', 'Txn Date', 'Receipt', 'Total']
+            assert preview['total_rows'] == 3
+            assert ingestion.source_size(str(compressed)) == len(self.CSV_BYTES)
+
+        _, metadata = preprocess_transaction_data(str(zip_csv), {
+            'customer_id': 'Customer ID', 'invoice_date': 'Txn Date', 'invoice_id': 'Receipt', 'amount': 'Total',
+        })
+        assert metadata['parser_options']['compression'] == 'zip'
+        assert metadata['summary']['total_revenue'] == pytest.approx(1245.75)
+
+    def test_decompressed_size_limit(self, gzip_csv, monkeypatch):
+        """Test reading stops once the inflated bytes pass MAX_UNCOMPRESSED_MB."""
+        monkeypatch.setattr(ingestion, 'MAX_UNCOMPRESSED_MB', 0)
+
+        with pytest.raises(ValueError, match="once decompressed"):
+            load_csv(str(gzip_csv), engine='pandas')
+
+    def test_zip_must_hold_one_csv(self, tmp_path):
+        """Test zip archives with several files or no CSV are rejected."""
+        two_files = tmp_path / "two.zip"
+        with zipfile.ZipFile(two_files, 'w') as archive:
+            archive.writestr('january.csv', self.CSV_BYTES)
+            archive.writestr('february.csv', self.CSV_BYTES)
+        not_csv = tmp_path / "sheet.zip"
+        with zipfile.ZipFile(not_csv, 'w') as archive:
+            archive.writestr('export.xlsx', b'PK')
+
+        for archive_path in (two_files, not_csv):
+            with pytest.raises(ValueError, match="exactly one CSV"):
+                load_csv(str(archive_path))
+
+
+class TestSpreadsheetUploads:
+    """Test cases for Excel (.xlsx) uploads."""
+
+    @pytest.fixture
+    def workbook(self, tmp_path):
+        openpyxl = pytest.importorskip("openpyxl")
+        path = tmp_path / "export.xlsx"
+        book = openpyxl.Workbook()
+        notes = book.active
+        notes.title = "Notes"
+        notes.append(["Note"])
+        notes.append(["Exported from the till"])
+        sales = book.create_sheet("Sales")
+        sales.append(["Customer ID", "Txn Date", "Receipt", "Total", "Cashier"])
+        sales.append(["00101", datetime(2026, 1, 1), "R1", 120.5, "Esi"])
+        sales.append([None, None, None, None, None])
+        sales.append(["00102", datetime(2026, 1, 2, 14, 30), "R2", 80, "Yaw"])
+        sales.append(["00101", datetime(2026, 1, 5), "R3", "45.25", "Esi"])
+        book.save(path)
+        return path
+
+    def test_xlsx_preprocessing_reads_mapped_columns(self, workbook):
+        """Test a named sheet is streamed with only the mapped columns and parsed like a CSV."""
+        df, metadata = preprocess_transaction_data(str(workbook), {
+            'customer_id': 'Customer ID',
+            'invoice_date': 'Txn Date',
+            'invoice_id': 'Receipt',
+            'amount': 'Total',
+            'sheet_name': 'Sales',
+        })
+
+        assert metadata['parser_options']['source_format'] == 'xlsx'
+        assert metadata['parser_options']['sheet_name'] == 'Sales'
+        assert metadata['removed_blank_rows'] == 1
+        assert 'Cashier' not in metadata['projected_columns']
+        assert df['amount'].sum() == pytest.approx(245.75)
+        assert df['invoice_date'].min() == pd.Timestamp('2026-01-01')
+
+    def test_xlsx_chunks_match_single_read(self, workbook):
+        """Test small chunks give the same rows, index and projection as one chunk."""
+        whole = ingestion.concat_chunks(ingestion.iter_sheet_chunks(str(workbook), sheet='Sales', usecols=[0, 3]))
+        chunked = ingestion.concat_chunks(
+            ingestion.iter_sheet_chunks(str(workbook), sheet='Sales', usecols=[0, 3], chunk_rows=1)
+        )
+
+        pd.testing.assert_frame_equal(chunked, whole)
+        assert list(whole.columns) == ['Customer ID', 'Total']
+        assert list(whole.index) == [0, 2, 3]
+        assert whole['Total'].tolist() == ['120.5', '80', '45.25']
+
+    def test_xlsx_preview_lists_sheets(self, workbook):
+        """Test previews show the chosen sheet, list the others, and reject unknown sheets."""
+        preview = get_csv_preview(str(workbook), sheet='Sales')
+
+        assert preview['sheets'] == ['Notes', 'Sales']
+        assert preview['sheet_name'] == 'Sales'
+        assert preview['total_rows'] == 3
+        assert preview['row_count_estimated'] is False
+        assert preview['sample_rows'][1]['Txn Date'] == '2026-01-02 14:30:00'
+        assert preview['suggested_mapping']['customer_id'] == 'Customer ID'
+        assert get_csv_preview(str(workbook))['sheet_name'] == 'Notes'
+
+        with pytest.raises(ValueError, match="Available sheets: Notes, Sales"):
+            get_csv_preview(str(workbook), sheet='Missing')
+
+
+class TestSQLSource:
+    """Test cases for jobs that read transactions from a configured database."""
+
+    @pytest.fixture
+    def source(self, tmp_path, monkeypatch):
+        database = tmp_path / "pos.db"
+        with sqlite3.connect(database) as connection:
+            connection.execute(
+                "CREATE TABLE sales (customer_id INTEGER, sold_at TEXT, receipt TEXT, total REAL, cashier TEXT)"
+            )
+            connection.executemany("INSERT INTO sales VALUES (?, ?, ?, ?, ?)", [
+                (101, '2026-01-01', 'R1', 120.5, 'Esi'),
+                (102, '2026-01-02', 'R2', 80.0, 'Yaw'),
+                (101, '2026-01-05', 'R3', 45.25, 'Esi'),
+                (103, '2026-01-06', 'R4', 2.0, 'Ama'),
+            ])
+        monkeypatch.setitem(ingestion.SQL_SOURCES, 'pos', {'url': f"sqlite:///{database}", 'users': []})
+        path = tmp_path / "source.sqlquery"
+        ingestion.write_sql_source(str(path), 'pos', "SELECT * FROM sales WHERE total > 5;")
+        return path
+
+    def test_sql_preprocessing_keeps_cursor_types(self, source):
+        """Test a query is streamed with only the mapped columns, keeping numeric types."""
+        df, metadata = preprocess_transaction_data(str(source), {
+            'customer_id': 'customer_id',
+            'invoice_date': 'sold_at',
+            'invoice_id': 'receipt',
+            'amount': 'total',
+        })
+
+        assert metadata['parser_options']['source_format'] == 'sql'
+        assert metadata['projected_columns'] == ['customer_id', 'sold_at', 'receipt', 'total']
+        assert metadata['raw_rows'] == 3
+        assert df['amount'].sum() == pytest.approx(245.75)
+        assert df['invoice_date'].max() == pd.Timestamp('2026-01-05')
+
+    def test_sql_batches_match_single_read(self, source):
+        """Test small cursor batches give the same typed rows and index as one batch."""
+        whole = ingestion.concat_chunks(ingestion.iter_sql_chunks(str(source), usecols=[3, 0]))
+        batched = ingestion.concat_chunks(ingestion.iter_sql_chunks(str(source), usecols=[3, 0], batch_rows=1))
+
+        pd.testing.assert_frame_equal(batched, whole)
+        assert list(whole.columns) == ['customer_id', 'total']
+        assert list(whole.index) == [0, 1, 2]
+        assert whole['customer_id'].dtype == np.int64
+        assert whole['total'].dtype == np.float64
+
+    def test_sql_preview_and_no_caching(self, source, tmp_path):
+        """Test previews read the query's columns and SQL sources bypass the frame cache."""
+        preview = get_csv_preview(str(source))
+        cache = FrameCache(tmp_path / "cache")
+        _, metadata = cached_preprocess_transaction_data(str(source), {
+            'customer_id': 'customer_id', 'invoice_date': 'sold_at', 'invoice_id': 'receipt', 'amount': 'total',
+        }, cache=cache)
+
+        assert read_columns(str(source)) == ['customer_id', 'sold_at', 'receipt', 'total', 'cashier']
+        assert preview['total_rows'] == 3
+        assert preview['row_count_estimated'] is False
+        assert preview['suggested_mapping']['amount'] == 'total'
+        assert 'cache' not in metadata
+        assert not (tmp_path / "cache").exists()
+
+    @pytest.mark.parametrize('query', [
+        "DELETE FROM sales",
+        "SELECT 1; DROP TABLE sales",
+        "  ",
+        "SELECT * INTO OUTFILE '/tmp/sales.csv' FROM sales",
+        "WITH gone AS (DELETE FROM sales RETURNING *) SELECT * FROM gone",
+        "SELECT *, pg_sleep(600) FROM sales",
+        "SELECT load_file('/etc/passwd')",
+        "SELECT 'a\\'' , sleep(600) -- '",
+        "SELECT 1 /*! , sleep(600) */",
+    ])
+    def test_sql_source_takes_one_select(self, tmp_path, monkeypatch, query):
+        """Test descriptors only accept a single read-only SELECT against a configured connection."""
+        monkeypatch.setitem(ingestion.SQL_SOURCES, 'pos', {'url': "sqlite://", 'users': []})
+
+        with pytest.raises(ValueError, match="SELECT|cannot call"):
+            ingestion.write_sql_source(str(tmp_path / "bad.sqlquery"), 'pos', query)
+        with pytest.raises(ValueError, match="Unknown SQL source"):
+            ingestion.write_sql_source(str(tmp_path / "bad.sqlquery"), 'crm', "SELECT 1")
+
+    def test_sql_query_text_is_not_mistaken_for_statements(self):
+        """Test blocked words inside literals, quoted names and comments are allowed."""
+        query = "SELECT replace(note, ';', '') AS \"update note\" FROM sales -- delete later\nWHERE note <> 'into'"
+
+        assert ingestion.validate_sql_query(query + ";") == query
+
+    def test_sql_source_session_is_read_only(self, source, tmp_path):
+        """Test queries run in a session that cannot write, even past the query check."""
+        engine, _ = ingestion._sql_source(str(source))
+
+        with ingestion._read_only_connection(engine) as connection:
+            with pytest.raises(sa.exc.OperationalError, match="readonly"):
+                connection.exec_driver_sql("DELETE FROM sales")
+
+    def test_sql_statement_timeout(self, source, tmp_path, monkeypatch):
+        """Test a query running past the statement timeout is cancelled."""
+        monkeypatch.setattr(ingestion, 'SQL_STATEMENT_TIMEOUT_SECONDS', 0.2)
+        path = tmp_path / "slow.sqlquery"
+        ingestion.write_sql_source(str(path), 'pos', (
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000000) "
+            "SELECT count(*) AS amount FROM n"
+        ))
+
+        with pytest.raises(ValueError, match="interrupted"):
+            ingestion.concat_chunks(ingestion.iter_sql_chunks(str(path)))
+
+
+class TestSQLSourceConfig:
+    """Test cases for parsing the SQL_SOURCES setting."""
+
+    def test_sources_parsed_with_their_users(self):
+        """Test sources keep their URL and lower-cased users; malformed entries are dropped."""
+        sources = config._parse_sql_sources(json.dumps({
+            'pos': {'url': 'sqlite://', 'users': [' Owner@Shop.com ']},
+            'legacy': 'sqlite://',
+            'nobody': {'url': 'sqlite://', 'users': []},
+        }))
+
+        assert sources == {
+            'pos': {'url': 'sqlite://', 'users': ['owner@shop.com']},
+            'nobody': {'url': 'sqlite://', 'users': []},
+        }
+
+    @pytest.mark.parametrize('value', ['{"pos": ', '["sqlite://"]', ''])
+    def test_malformed_setting_is_ignored(self, value, caplog):
+        """Test a value that is not a JSON object disables SQL sources instead of failing import."""
+        assert config._parse_sql_sources(value) == {}
+        if value:
+            assert "Ignoring SQL_SOURCES" in caplog.text
+
+
+class TestEncodingDetection:
+    """Test cases for byte-sniffing encoding detection."""
+
+    def test_detects_cp1252_deep_in_file(self, tmp_path):
+        """Test cp1252 bytes far from the head are found and parsed in one pass."""
+        csv_file = tmp_path / "pos_export.csv"
+        rows = [f"C{i:05d},2026-01-01,{i}.00,Rice" for i in range(20000)]
+        rows.append("C99999,2026-01-02,12.50,Kwabena\u2019s Caf\u00e9 \u20ac")
+        csv_file.write_bytes(("customer_id,invoice_date,amount,product\n" + "\n".join(rows) + "\n").encode("cp1252"))
+
+        assert detect_encoding(str(csv_file)) == "cp1252"
+
+        loaded = load_csv(str(csv_file))
+        assert loaded.attrs["parse_attempts"] == 1
+        assert loaded["product"].iloc[-1] == "Kwabena\u2019s Caf\u00e9 \u20ac"
+
+    def test_detects_utf8_bom(self, tmp_path):
+        """Test a UTF-8 byte-order mark does not leak into the first column name."""
+        csv_file = tmp_path / "bom.csv"
+        csv_file.write_bytes(b"\xef\xbb\xbfcustomer_id,amount\nC001,100\n")
+
+        loaded = load_csv(str(csv_file))
+
+        assert list(loaded.columns) == ["customer_id", "amount"]
+
+    def test_detects_utf16(self, tmp_path):
+        """Test UTF-16 exports with and without a byte-order mark."""
+        text = "customer_id,amount\nC001,100\nC002,200\n"
+        with_bom = tmp_path / "utf16.csv"
+        with_bom.write_bytes(text.encode("utf-16"))
+        without_bom = tmp_path / "utf16le.csv"
+        without_bom.write_bytes(text.encode("utf-16-le"))
+
+        assert detect_encoding(str(with_bom)) == "utf-16"
+        assert detect_encoding(str(without_bom)) == "utf-16-le"
+        assert list(load_csv(str(without_bom))["customer_id"]) == ["C001", "C002"]
+
+
+class TestColumnProjection:
+    """Test cases for reading only the mapped columns."""
+
+    @pytest.fixture
+    def wide_csv(self, tmp_path):
+        csv_file = tmp_path / "wide_export.csv"
+        header = ["Till", "Customer ID", "Notes", "Txn Date", "Cashier", "Total Line Amount", "Branch"]
+        rows = [
+            ["T1", "00101", "walk-in", "2026-01-01", "Esi", "1,200.50", "Osu"],
+            ["T2", "00102", "", "2026-01-02", "Yaw", "80.00", "Madina"],
+            ["T1", "00101", "repeat", "2026-01-05", "Esi", "45.25", "Osu"],
+        ]
+        csv_file.write_text("\n".join(",".join(f'"{v}"' for v in row) for row in [header] + rows) + "\n")
+        return csv_file
+
+    def test_unmapped_columns_are_not_loaded(self, wide_csv):
+        """Test only the mapped columns are parsed, keeping IDs as text."""
+        df, metadata = preprocess_transaction_data(str(wide_csv), {
+            'customer_id': 'Customer ID',
+            'invoice_date': 'Txn Date',
+            'amount': 'Total Line Amount',
+        })
+
+        assert metadata['projected_columns'] == ['Customer ID', 'Txn Date', 'Total Line Amount']
+        assert len(metadata['original_columns']) == 7
+        assert set(df['customer_id']) == {'00101', '00102'}
+        assert df['amount'].sum() == pytest.approx(1325.75)
+
+    def test_missing_mapped_column_still_reported(self, wide_csv):
+        """Test a mapping that names an absent column fails with the usual message."""
+        with pytest.raises(ValueError, match="doesn't exist"):
+            preprocess_transaction_data(str(wide_csv), {
+                'customer_id': 'Customer ID',
+                'invoice_date': 'Txn Date',
+                'amount': 'Grand Total',
+            })
+
+
+class TestHeaderSignature:
+    """Test cases for the file-layout fingerprint used by mapping memory."""
+
+    def test_signature_ignores_case_and_spacing(self):
+        """Test the same layout matches across case and whitespace changes, but not reordering."""
+        columns = ['Customer ID', 'Txn Date', 'Total']
+
+        assert header_signature(columns) == header_signature([' customer  id', 'TXN DATE ', 'total'])
+        assert header_signature(columns) != header_signature(['Txn Date', 'Customer ID', 'Total'])
+        assert header_signature(columns) != header_signature(columns + ['Branch'])
+
+    def test_remap_to_header_uses_new_spelling(self):
+        """Test remembered names are pointed at the columns a re-export spells differently."""
+        mapping = {'customer_id': 'Customer ID', 'invoice_date': 'Txn Date', 'amount': 'Total', 'product': None}
+
+        remapped = remap_to_header(mapping, ['customer id ', ' TXN  DATE', 'Total', 'total'])
+
+        assert remapped == {'customer_id': 'customer id ', 'invoice_date': ' TXN  DATE', 'amount': 'Total', 'product': None}
+
+    def test_preprocess_accepts_mapping_in_other_case(self, tmp_path):
+        """Test a mapping written for one spelling of the header loads a file with another."""
+        csv_file = tmp_path / "week2.csv"
+        csv_file.write_text("customer id , TXN  DATE,Receipt No,Total\nC002,2025-01-12,R9,80\n")
+
+        df, metadata = preprocess_transaction_data(str(csv_file), {
+            'customer_id': 'Customer ID', 'invoice_date': 'Txn Date', 'invoice_id': 'Receipt No', 'amount': 'Total',
+        })
+
+        assert metadata['applied_mapping']['invoice_date'] == ' TXN  DATE'
+        assert df['customer_id'].astype(str).tolist() == ['C002']
+
 
 class TestColumnMapping:
     """Test cases for column detection and mapping."""
@@ -105,6 +758,203 @@ class TestColumnMapping:
         assert len([v for v in mapping.values() if v is not None]) > 0
 
 
+class TestParseDates:
+    """Test cases for sample-based date format inference."""
+
+    def test_day_first_dates_detected(self):
+        """Test unambiguous day-first dates pick %d/%m/%Y and record it."""
+        df = pd.DataFrame({'invoice_date': ['01/02/2026', '25/12/2025', '13/01/2026', None]})
+        stats = {}
+
+        parsed = parse_dates(df, stats=stats)
+
+        assert stats['date_format'] == '%d/%m/%Y'
+        assert stats['dayfirst'] is True
+        assert parsed['invoice_date'].iloc[0] == pd.Timestamp('2026-02-01')
+        assert stats['remedial_rows'] == 0
+
+    def test_ambiguous_dates_follow_dayfirst(self):
+        """Test ambiguous dates are month-first unless dayfirst is set."""
+        df = pd.DataFrame({'invoice_date': ['01/02/2026', '03/04/2026']})
+
+        month_stats, day_stats = {}, {}
+        month_first = parse_dates(df, stats=month_stats)
+        day_first = parse_dates(df, dayfirst=True, stats=day_stats)
+
+        assert month_stats['date_format'] == '%m/%d/%Y'
+        assert month_first['invoice_date'].iloc[0] == pd.Timestamp('2026-01-02')
+        assert day_stats['date_format'] == '%d/%m/%Y'
+        assert day_first['invoice_date'].iloc[0] == pd.Timestamp('2026-02-01')
+
+    def test_user_format_preferred(self):
+        """Test a user-selected format that parses the sample wins."""
+        df = pd.DataFrame({'invoice_date': ['2026.01.05 14:30', '2026.02.11 09:00']})
+        stats = {}
+
+        parsed = parse_dates(df, date_format='%Y.%m.%d %H:%M', stats=stats)
+
+        assert stats['source'] == 'user'
+        assert parsed['invoice_date'].iloc[1] == pd.Timestamp('2026-02-11 09:00')
+
+    def test_complete_user_format_skips_other_candidates(self, monkeypatch):
+        """Test a remembered format that parses every sampled value is used without trying others."""
+        df = pd.DataFrame({'invoice_date': ['05/01/2026', '11/02/2026']})
+        monkeypatch.setattr(preprocessing, '_date_format_candidates', lambda *args: pytest.fail("candidates tried"))
+        stats = {}
+
+        parsed = parse_dates(df, date_format='%d/%m/%Y', dayfirst=True, stats=stats)
+
+        assert stats['source'] == 'user'
+        assert parsed['invoice_date'].iloc[1] == pd.Timestamp('2026-02-11')
+
+    def test_user_day_first_format_kept_for_ambiguous_dates(self):
+        """Test an explicit day-first format is not swapped for month-first when dayfirst is unset."""
+        df = pd.DataFrame({'invoice_date': ['01/02/2026', '03/04/2026', '05/06/2026']})
+        stats = {}
+
+        parsed = parse_dates(df, date_format='%d/%m/%Y', stats=stats)
+
+        assert stats['date_format'] == '%d/%m/%Y'
+        assert stats['source'] == 'user'
+        assert parsed['invoice_date'].iloc[0] == pd.Timestamp('2026-02-01')
+
+    def test_mixed_formats_reparse_only_misses(self):
+        """Test rows the winning format misses get a second mixed-format parse."""
+        df = pd.DataFrame({'invoice_date': ['2026-01-05'] * 8 + ['5 March 2026', 'not a date']})
+        stats = {}
+
+        parsed = parse_dates(df, stats=stats)
+
+        assert stats['date_format'] == '%Y-%m-%d'
+        assert stats['remedial_rows'] == 2
+        assert stats['unparsed_rows'] == 1
+        assert parsed['invoice_date'].iloc[8] == pd.Timestamp('2026-03-05')
+
+    def test_unparseable_dates_rejected(self):
+        """Test a column that is mostly not dates still raises."""
+        df = pd.DataFrame({'invoice_date': ['abc', 'def', 'ghi', '2026-01-01']})
+
+        with pytest.raises(ValueError, match="Could not parse dates"):
+            parse_dates(df)
+
+
+class TestMemoisedParsing:
+    """Test cases for parsing repeated values once."""
+
+    def test_numeric_parse_matches_row_by_row(self):
+        """Test memoised amount parsing gives the same values and counts repeats."""
+        raw = pd.Series(['GH₵ 1,200.50', '(45.00)', '1,200.50', None, 'GH₵ 1,200.50', 'n/a'] * 50)
+        stats = {}
+
+        parsed = validate_numeric_column(
+            pd.DataFrame({'amount': raw}), 'amount', currency_symbol='GH₵', stats=stats,
+        )['amount']
+
+        expected = [1200.5, -45.0, 1200.5, np.nan, 1200.5, np.nan] * 50
+        assert np.allclose(parsed.to_numpy(), expected, equal_nan=True)
+        assert stats['unique_values'] == 4
+        assert stats['hit_ratio'] == pytest.approx(1 - 4 / 250)
+
+    def test_hit_ratio_in_cleaning_stats(self, tmp_path):
+        """Test preprocessing reports per-column hit ratios."""
+        csv_file = tmp_path / "repeats.csv"
+        rows = "\n".join(f"C{i % 7},2026-01-0{i % 3 + 1},INV{i},{(i % 4) * 10 + 5}.00" for i in range(200))
+        csv_file.write_text("customer_id,invoice_date,invoice_id,amount\n" + rows + "\n")
+
+        _, metadata = preprocess_transaction_data(str(csv_file))
+        memoised = metadata['cleaning_stats']['memoised_parsing']
+
+        assert memoised['invoice_date']['unique_values'] == 3
+        assert memoised['amount']['unique_values'] == 4
+        assert memoised['amount']['hit_ratio'] == pytest.approx(0.98)
+
+
+def _legacy_parse_locale_numeric_series(series, *, decimal_separator='.', thousands_separator=',', currency_symbol=''):
+    """The original chained-regex parser, kept as the reference for the fast parser."""
+    text = series.astype(str).str.strip()
+    text = text.replace({'': np.nan, 'nan': np.nan, 'None': np.nan})
+    if currency_symbol:
+        text = text.str.replace(currency_symbol, '', regex=False)
+    text = text.str.replace(r'[\s\u00A0]', '', regex=True)
+    text = text.str.replace(r'^\((.*)\)$', r'-\1', regex=True)
+    if thousands_separator:
+        text = text.str.replace(thousands_separator, '', regex=False)
+    if decimal_separator and decimal_separator != '.':
+        text = text.str.replace(decimal_separator, '.', regex=False)
+    text = text.str.replace(r'[^0-9.\-+]', '', regex=True)
+    return pd.to_numeric(text, errors='coerce')
+
+
+NUMERIC_CORPUS = [
+    '1,200.50', '1.200,50', '  45 ', '(45.00)', '( 1,000 )', '-12.5', '+7', '.5', '5.',
+    'GH₵ 1,200.50', 'GHS 300', '€1.234,56', '$99.99', '₵\u00a02\u00a0500', '1\u202f234,5',
+    '', ' ', 'nan', 'None', 'NaN', 'n/a', '--5', '1-2', '1.2.3', '(3', '3)', '1e5',
+    'GH₵(45)', '(GH₵45)', ' GHS12 ', 'abc', '0', '007', '\t8\n',
+]
+
+LOCALE_OPTIONS = [
+    {},
+    {'currency_symbol': 'GH₵'},
+    {'currency_symbol': 'GHS '},
+    {'decimal_separator': ',', 'thousands_separator': '.', 'currency_symbol': '€'},
+    {'decimal_separator': ',', 'thousands_separator': ' '},
+    {'thousands_separator': ''},
+]
+
+
+class TestLocaleNumericParser:
+    """Test cases for the Arrow-backed locale numeric parser."""
+
+    @pytest.mark.parametrize("options", LOCALE_OPTIONS)
+    @pytest.mark.parametrize("use_arrow", [True, False])
+    def test_matches_legacy_parser(self, options, use_arrow, monkeypatch):
+        """Test every corpus value parses exactly as the chained-regex parser did."""
+        if use_arrow:
+            pytest.importorskip("pyarrow")
+        else:
+            monkeypatch.setattr(preprocessing, "pc", None)
+        series = pd.Series(NUMERIC_CORPUS + [None, np.nan])
+
+        expected = _legacy_parse_locale_numeric_series(series, **options)
+        actual = _parse_locale_numeric_series(series, **options)
+
+        pd.testing.assert_series_equal(actual, expected)
+
+    def test_integer_text_keeps_integer_dtype(self):
+        """Test all-integer text still comes back as int64 like pd.to_numeric."""
+        series = pd.Series(['1,000', '25', '(3)'])
+
+        pd.testing.assert_series_equal(
+            _parse_locale_numeric_series(series),
+            _legacy_parse_locale_numeric_series(series),
+        )
+
+    @pytest.mark.parametrize("values", [
+        ['12345678901234567.5', '0.1234567890123456789', '1,234.50'],
+        ['98765432109876543210', '42'],
+    ])
+    def test_long_digit_strings(self, values):
+        """Test values beyond 15 significant digits round exactly as pd.to_numeric does."""
+        series = pd.Series(values, dtype=object)
+
+        pd.testing.assert_series_equal(
+            _parse_locale_numeric_series(series),
+            _legacy_parse_locale_numeric_series(series),
+        )
+
+    def test_arrow_strings_and_mixed_objects(self):
+        """Test Arrow-backed and mixed-type object columns match the legacy parser."""
+        pa = pytest.importorskip("pyarrow")
+        arrow_series = pd.Series(['1,200.50', None, '(45)'], dtype=pd.ArrowDtype(pa.string()))
+        mixed_series = pd.Series([1200.5, '(45)', 3, None], dtype=object)
+
+        assert _parse_locale_numeric_series(arrow_series).tolist()[::2] == [1200.5, -45.0]
+        pd.testing.assert_series_equal(
+            _parse_locale_numeric_series(mixed_series),
+            _legacy_parse_locale_numeric_series(mixed_series),
+        )
+
+
 class TestCleanData:
     """Test cases for data cleaning."""
     
@@ -161,6 +1011,231 @@ class TestCleanData:
         # Should preserve all as they're valid amounts
         assert len(clean) > 0
 
+    def test_clean_data_filters_and_sorts_without_touching_input(self, dirty_df):
+        """Test rows are dropped and date-sorted in one pass, leaving the input as it was."""
+        dirty_df['invoice_date'] = pd.to_datetime(dirty_df['invoice_date'])
+        dirty_df.loc[0, 'amount'] = -5
+        dirty_df = dirty_df.iloc[::-1]
+        original = dirty_df.copy()
+
+        clean, stats = clean_data(dirty_df)
+
+        pd.testing.assert_frame_equal(dirty_df, original)
+        assert list(clean.index) == [1, 2, 4]
+        assert clean['invoice_date'].is_monotonic_increasing
+        assert stats['removed_null_customer'] == 1
+        assert stats['removed_negative_amount'] == 1
+
+
+class TestMemoryAccounting:
+    """Test cases for the copy-free preprocessing path."""
+
+    def test_owned_frame_is_updated_in_place(self):
+        """Test copy=False replaces the parsed column on the caller's frame."""
+        df = pd.DataFrame({'amount': ['1,200.50', '80'], 'invoice_date': ['2026-01-01', '2026-01-02']})
+
+        assert validate_numeric_column(df, 'amount', copy=False) is df
+        assert parse_dates(df, copy=False) is df
+        assert df['amount'].tolist() == [1200.5, 80.0]
+        assert pd.api.types.is_datetime64_any_dtype(df['invoice_date'])
+
+    def test_steps_recorded_in_cleaning_stats(self, tmp_path):
+        """Test preprocessing reports memory use per step."""
+        csv_file = tmp_path / "export.csv"
+        csv_file.write_text(
+            "customer_id,invoice_date,amount\n"
+            "C001,2026-01-01,100\n"
+            "C002,2026-01-02,200\n"
+        )
+
+        _, metadata = preprocess_transaction_data(str(csv_file), {
+            'customer_id': 'customer_id',
+            'invoice_date': 'invoice_date',
+            'amount': 'amount',
+        })
+        memory = metadata['cleaning_stats']['memory']
+
+        assert [step['step'] for step in memory['steps']] == [
+            'load', 'map_columns', 'parse_dates', 'parse_amount', 'clean', 'compact',
+        ]
+        assert memory['raw_column_mb'] is not None
+        assert all(step['seconds'] >= 0 for step in memory['steps'])
+
+
+
+class TestCompactFrame:
+    """Test cases for the compact canonical frame."""
+
+    def test_customer_codes_follow_sorted_display_ids(self):
+        """Test codes index the sorted display IDs, treating 7 and '7' as one customer."""
+        df = pd.DataFrame({'customer_id': ['C2', 7, 'C1', '7', 'C2'], 'amount': [1.0] * 5})
+
+        compact, _ = compact_frame(df)
+
+        assert list(customer_lookup(compact)) == ['7', 'C1', 'C2']
+        assert compact['customer_code'].dtype == np.int32
+        assert compact['customer_code'].tolist() == [2, 0, 1, 0, 2]
+        assert compact['customer_id'].astype(str).tolist() == ['C2', '7', 'C1', '7', 'C2']
+
+    def test_amount_downcast_only_when_lossless(self):
+        """Test float32 is used only when no amount changes."""
+        exact, _ = compact_frame(pd.DataFrame({'amount': [10.5, 200.0, np.nan]}))
+        cents, _ = compact_frame(pd.DataFrame({'amount': [19.99, 5.0]}))
+
+        assert exact['amount'].dtype == np.float32
+        assert cents['amount'].dtype == np.float64
+
+    def test_text_fields_become_categorical(self):
+        """Test product and category are stored as categoricals with column footprints reported."""
+        df = pd.DataFrame({'product': ['Rice', 'Oil', 'Rice'], 'category': ['Food'] * 3, 'amount': [1.0] * 3})
+
+        compact, footprint = compact_frame(df)
+
+        assert isinstance(compact['product'].dtype, pd.CategoricalDtype)
+        assert isinstance(compact['category'].dtype, pd.CategoricalDtype)
+        assert footprint['product']['dtype'] == 'category'
+
+    def test_preprocessed_frame_is_compact(self, tmp_path):
+        """Test the preprocessing output carries customer codes."""
+        csv_file = tmp_path / "export.csv"
+        csv_file.write_text(
+            "customer_id,invoice_date,amount\n"
+            "C002,2026-01-01,100\n"
+            "C001,2026-01-02,200.5\n"
+            "C002,2026-01-03,50\n"
+        )
+
+        df, metadata = preprocess_transaction_data(str(csv_file), {
+            'customer_id': 'customer_id',
+            'invoice_date': 'invoice_date',
+            'amount': 'amount',
+        })
+
+        assert df['customer_code'].tolist() == [1, 0, 1]
+        assert metadata['summary']['num_customers'] == 2
+        assert 'customer_code' in metadata['cleaning_stats']['memory']['columns']
+
+
+
+class TestColumnProfiling:
+    """Test cases for the mapping UI column profiles."""
+
+    @pytest.fixture
+    def export_frame(self):
+        rows = 400
+        return pd.DataFrame({
+            'Txn Date': [f"{day % 12 + 1:02d}/{day // 40 + 1:02d}/2025" for day in range(rows)],
+            'Total': [f"{index * 7.5:,.2f}" for index in range(rows)],
+            'Branch': [f"Branch {index % 5}" for index in range(rows)],
+            'Receipt': [f"RCPT{index:06d}" if index % 10 else None for index in range(rows)],
+        })
+
+    def test_profiles_match_across_worker_counts(self, export_frame):
+        """Test the thread pool returns the same profiles, in column order, as a serial run."""
+        assert profile_dataframe(export_frame, workers=4) == profile_dataframe(export_frame, workers=1)
+
+    def test_profiles(self, export_frame):
+        """Test detected types, counts and ambiguous date candidates."""
+        profiles = {profile['column_name']: profile for profile in profile_dataframe(export_frame)}
+
+        assert [profiles[name]['detected_type'] for name in export_frame.columns] == \
+            ['date', 'numeric', 'categorical', 'text_or_id']
+        # Both readings of an ambiguous day/month column are still offered
+        formats = [candidate['format'] for candidate in profiles['Txn Date']['date_format_candidates']]
+        assert formats == ['%d/%m/%Y', '%m/%d/%Y']
+        assert profiles['Receipt']['null_count'] == 40
+        assert profiles['Receipt']['unique_count'] == 360
+        assert profiles['Branch']['unique_count'] == 5
+        assert profiles['Branch']['unique_count_approximate'] is False
+
+    def test_large_columns_use_approximate_distinct_counts(self, monkeypatch):
+        """Test distinct counts switch to HyperLogLog above the exact-count threshold."""
+        monkeypatch.setattr(preprocessing, 'PROFILE_EXACT_DISTINCT_ROWS', 1000)
+        df = pd.DataFrame({'customer': [f"C{index % 3000}" for index in range(6000)]})
+
+        profile = profile_dataframe(df)[0]
+
+        assert profile['unique_count_approximate'] is True
+        assert abs(profile['unique_count'] - 3000) < 3000 * 0.05
+
+    def test_hyperloglog_estimates_and_merges(self):
+        """Test HyperLogLog stays within a few percent and merged sketches count the union."""
+        values = pd.Series(np.arange(200_000)).astype(str)
+        left = HyperLogLog().add_hashes(hash_values(values.iloc[:120_000]))
+        right = HyperLogLog().add_hashes(hash_values(values.iloc[80_000:]))
+
+        assert abs(left.count() - 120_000) < 120_000 * 0.03
+        assert abs(left.merge(right).count() - 200_000) < 200_000 * 0.03
+        assert HyperLogLog().add(pd.Series(['a', 'b', 'a', None])).count() == 2
+
+
+class TestPreprocessCache:
+    """Test cases for the content-addressed preprocessing cache."""
+
+    MAPPING = {'customer_id': 'customer_id', 'invoice_date': 'invoice_date', 'amount': 'amount'}
+
+    @pytest.fixture
+    def export_csv(self, tmp_path):
+        csv_file = tmp_path / "export.csv"
+        csv_file.write_text(
+            "customer_id,invoice_date,amount,product\n"
+            "C002,2026-01-01,100,Rice\n"
+            "C001,2026-01-02,200.5,Oil\n"
+            "C002,2026-01-03,50,Rice\n"
+        )
+        return csv_file
+
+    def test_second_run_reuses_frame(self, export_csv, tmp_path):
+        """Test a copy of the same upload is served from the cache unchanged."""
+        pytest.importorskip("pyarrow")
+        cache = FrameCache(tmp_path / "cache", max_bytes=10 * 1024 * 1024)
+        copy_csv = tmp_path / "job_copy.csv"
+        copy_csv.write_bytes(export_csv.read_bytes())
+        mapping = dict(self.MAPPING, product='product')
+
+        first, first_meta = cached_preprocess_transaction_data(str(export_csv), mapping, cache=cache)
+        second, second_meta = cached_preprocess_transaction_data(str(copy_csv), mapping, cache=cache)
+
+        assert first_meta['cache']['hit'] is False
+        assert second_meta['cache']['hit'] is True
+        pd.testing.assert_frame_equal(first, second)
+        assert second_meta['summary'] == first_meta['summary']
+
+    def test_key_normalises_mapping(self, export_csv):
+        """Test empty fields and defaulted options do not change the key, real options do."""
+        padded = dict(self.MAPPING, invoice_id=None, product='', decimal_separator='.')
+
+        assert preprocess_cache_key(str(export_csv), self.MAPPING) == preprocess_cache_key(str(export_csv), padded)
+        assert preprocess_cache_key(str(export_csv), self.MAPPING) != \
+            preprocess_cache_key(str(export_csv), dict(self.MAPPING, dayfirst=True))
+
+    def test_key_covers_reader_settings(self, export_csv, monkeypatch):
+        """Test the CSV reader engine and chunking settings change the key."""
+        monkeypatch.setattr(ingestion, 'CSV_READER_ENGINE', 'pandas')
+        pandas_key = preprocess_cache_key(str(export_csv), self.MAPPING)
+        monkeypatch.setattr(preprocessing, 'INGEST_CHUNK_ROWS', 0)
+        whole_file_key = preprocess_cache_key(str(export_csv), self.MAPPING)
+        monkeypatch.setattr(ingestion, 'CSV_READER_ENGINE', 'pyarrow')
+
+        assert len({pandas_key, whole_file_key, preprocess_cache_key(str(export_csv), self.MAPPING)}) == 3
+
+    def test_least_recently_used_entries_evicted(self, tmp_path):
+        """Test the cache drops the least recently used entries once over its byte budget."""
+        cache = FrameCache(tmp_path / "cache", max_bytes=10 * 1024 * 1024)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, {'payload': 'x' * 1000})
+        entry_bytes = (tmp_path / "cache" / "a.json").stat().st_size
+        # Last used: b, then a, then c
+        for age, key in enumerate(['b', 'a', 'c']):
+            os.utime(tmp_path / "cache" / f"{key}.json", (1_000_000 + age, 1_000_000 + age))
+
+        cache.max_bytes = entry_bytes * 2
+        evicted = cache.evict()
+
+        assert evicted == ['b']
+        assert cache.get('b') is None
+        assert cache.get('a') == ({'payload': 'x' * 1000}, None)
+
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
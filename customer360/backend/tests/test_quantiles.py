@@ -0,0 +1,96 @@
+"""
+Unit tests for the shared quantile summaries and the KLL sketch.
+"""
+import pytest
+import pandas as pd
+import numpy as np
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics.quantiles import QuantileSummary, column_quantiles
+from app.analytics.sketches import KLLSketch
+
+
+class TestQuantileSummary:
+    """Test cases for QuantileSummary."""
+
+    @pytest.fixture
+    def values(self):
+        """Skewed spend-like values with a few missing entries."""
+        rng = np.random.default_rng(25)
+        values = pd.Series(rng.lognormal(4.0, 1.2, 50_000))
+        values.iloc[::997] = np.nan
+        return values
+
+    def test_exact_matches_series_quantile(self, values):
+        """Test small columns give Series.quantile and exact strict ranks."""
+        summary = QuantileSummary.of(values)
+        q = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0]
+
+        assert summary.exact
+        assert summary.count == values.notna().sum()
+        np.testing.assert_array_equal(summary.quantile(q), values.quantile(q).to_numpy())
+        expected_below = values.rank(method='min').dropna() - 1
+        np.testing.assert_array_equal(summary.count_below(values.dropna()), expected_below.to_numpy())
+
+    def test_sketch_within_rank_error(self, values):
+        """Test past the exact limit, chunked and merged summaries stay within the rank error."""
+        chunks = np.array_split(values.to_numpy(), 9)
+        left, right = QuantileSummary(exact_limit=5000), QuantileSummary(exact_limit=5000)
+        for chunk in chunks[:4]:
+            left.add(chunk)
+        for chunk in chunks[4:]:
+            right.add(chunk)
+        summary = left.merge(right)
+
+        ordered = np.sort(values.dropna().to_numpy())
+        q = np.linspace(0.01, 0.99, 99)
+        estimated_ranks = np.searchsorted(ordered, summary.quantile(q)) / ordered.size
+        assert not summary.exact
+        assert summary.count == ordered.size
+        assert np.abs(estimated_ranks - q).max() <= summary.rank_error
+        below = summary.count_below(ordered[::500])
+        assert np.abs(below - np.arange(0, ordered.size, 500)).max() <= summary.rank_error * ordered.size
+
+    def test_merge_exact_summaries(self, values):
+        """Test merging exact summaries stays exact under the limit and sketches past it."""
+        first, second = values.iloc[:30_000], values.iloc[30_000:]
+
+        merged = QuantileSummary.of(first).merge(QuantileSummary.of(second))
+        crossed = QuantileSummary.of(first, exact_limit=40_000).merge(QuantileSummary.of(second, exact_limit=40_000))
+
+        assert merged.exact
+        assert merged.quantile(0.5) == values.median()
+        assert not crossed.exact
+        assert crossed.count == merged.count
+
+    def test_column_quantiles(self):
+        """Test one summary per present metric, and NaN quantiles for an empty column."""
+        rfm = pd.DataFrame({'recency': [3, 9, 27], 'frequency': [1, 2, 3], 'monetary': [np.nan] * 3})
+
+        quantiles = column_quantiles(rfm, columns=['recency', 'frequency', 'monetary', 'tenure_days'])
+
+        assert sorted(quantiles) == ['frequency', 'monetary', 'recency']
+        assert quantiles['recency'].quantile(0.5) == 9.0
+        assert np.isnan(quantiles['monetary'].quantile(0.5))
+
+
+class TestKLLSketch:
+    """Test cases for the KLL quantile sketch."""
+
+    def test_bounded_size_and_extremes(self):
+        """Test retained items stay near 3k and quantiles 0 and 1 are the exact extremes."""
+        rng = np.random.default_rng(3)
+        values = rng.normal(100.0, 15.0, 200_000)
+        sketch = KLLSketch(k=100)
+        for chunk in np.array_split(values, 20):
+            sketch.add(chunk)
+
+        assert sum(level.size for level in sketch.levels) <= 3 * 100 + len(sketch.levels)
+        assert sketch.quantile(0.0) == values.min()
+        assert sketch.quantile(1.0) == values.max()
+        assert sketch.count_below(values.max() + 1) == len(values)
+        assert KLLSketch.k_for_rank_error(0.005) == 340
+        assert np.isnan(KLLSketch().quantile(0.5))
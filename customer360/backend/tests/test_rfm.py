@@ -10,7 +10,10 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.analytics.preprocessing import compact_frame
+from app.analytics.quantiles import column_quantiles
 from app.analytics.rfm import (
+    compute_customer_features,
     compute_rfm,
     compute_rfm_scores,
     normalize_rfm,
@@ -103,6 +106,104 @@ class TestComputeRFM:
         
         assert (rfm['recency'] >= 0).all()
 
+    def test_compute_rfm_compact_frame_matches(self, sample_transactions):
+        """Test grouping on customer codes gives the same RFM as the ID strings."""
+        reference_date = datetime(2026, 1, 2)
+        sample_transactions['amount'] = sample_transactions['amount'].astype(float)
+        compact, _ = compact_frame(sample_transactions.copy())
+
+        expected = compute_rfm(sample_transactions, reference_date=reference_date)
+        actual = compute_rfm(compact, reference_date=reference_date)
+
+        assert compact['amount'].dtype == np.float32
+        pd.testing.assert_frame_equal(actual.astype({'customer_id': object}), expected)
+
+    def test_compute_rfm_without_invoice_column(self, sample_transactions):
+        """Test frequency counts transactions when no invoice column is mapped."""
+        rfm = compute_rfm(sample_transactions.drop(columns='invoice_id'))
+
+        assert rfm.set_index('customer_id')['frequency'].to_dict() == {'C001': 3, 'C002': 2, 'C003': 1}
+
+    def test_compute_rfm_matches_groupby(self):
+        """Test the vectorised kernel agrees with per-customer groupbys on messy data."""
+        rng = np.random.default_rng(3)
+        n = 2000
+        df = pd.DataFrame({
+            'customer_id': rng.choice([f'C{i:03d}' for i in range(150)] + [None], n),
+            'invoice_date': pd.Timestamp('2025-06-01') + pd.to_timedelta(rng.integers(0, 400 * 24, n), unit='h'),
+            # Invoices repeat within and across customers, and some are missing
+            'invoice_id': rng.choice([f'INV{i:04d}' for i in range(700)] + [None], n),
+            'amount': np.where(rng.random(n) < 0.02, np.nan, rng.gamma(2.0, 40.0, n)),
+        })
+        reference_date = datetime(2026, 7, 15, 12)
+
+        rfm = compute_rfm(df, reference_date=reference_date).set_index('customer_id')
+
+        groups = df.groupby('customer_id')
+        assert rfm.index.tolist() == sorted(groups.groups)
+        expected_recency = (pd.Timestamp(reference_date) - groups['invoice_date'].max()).dt.days
+        assert rfm['recency'].tolist() == expected_recency.tolist()
+        assert rfm['frequency'].tolist() == groups['invoice_id'].nunique().clip(lower=1).tolist()
+        np.testing.assert_allclose(rfm['monetary'], groups['amount'].sum())
+
+
+class TestComputeCustomerFeatures:
+    """Test cases for the fused customer feature pass."""
+
+    @pytest.fixture
+    def sample_transactions(self):
+        """Two invoices on one day for C001, single-order C003, and a row without a customer."""
+        return pd.DataFrame({
+            'customer_id': ['C002', 'C001', 'C001', 'C001', 'C003', None, 'C002'],
+            'invoice_date': pd.to_datetime([
+                '2026-01-10', '2026-01-01', '2026-01-21', '2026-01-21', '2026-02-01', '2026-02-02', '2026-01-30',
+            ]),
+            'invoice_id': ['INV1', 'INV2', 'INV3', 'INV4', 'INV5', 'INV6', 'INV7'],
+            'amount': [40.0, 100.0, 50.0, 30.0, 75.0, 10.0, 60.0],
+        })
+
+    def test_lifecycle_features(self, sample_transactions):
+        """Test dates, tenure, order value and purchase interval per customer."""
+        features, _ = compute_customer_features(sample_transactions, reference_date=datetime(2026, 2, 3))
+        features = features.set_index('customer_id')
+
+        assert features.index.tolist() == ['C001', 'C002', 'C003']
+        assert features.loc['C001', 'first_purchase_date'] == pd.Timestamp('2026-01-01')
+        assert features.loc['C001', 'last_purchase_date'] == pd.Timestamp('2026-01-21')
+        assert features['tenure_days'].tolist() == [20, 20, 0]
+        assert features['avg_order_value'].tolist() == [60.0, 50.0, 75.0]
+        assert features.loc['C001', 'avg_interpurchase_days'] == 10.0
+        assert features.loc['C002', 'avg_interpurchase_days'] == 20.0
+        assert np.isnan(features.loc['C003', 'avg_interpurchase_days'])
+
+    def test_rfm_columns_match_compute_rfm(self, sample_transactions):
+        """Test the features carry exactly compute_rfm's metrics."""
+        features, _ = compute_customer_features(sample_transactions)
+
+        rfm = compute_rfm(sample_transactions)
+        pd.testing.assert_frame_equal(features[rfm.columns.tolist()], rfm)
+
+    def test_row_positions(self, sample_transactions):
+        """Test each transaction points at its customer's feature row."""
+        features, row_positions = compute_customer_features(sample_transactions)
+
+        assert row_positions.tolist() == [1, 0, 0, 0, 2, -1, 1]
+        matched = row_positions >= 0
+        assert (
+            features['customer_id'].to_numpy()[row_positions[matched]]
+            == sample_transactions['customer_id'].to_numpy()[matched]
+        ).all()
+
+    def test_row_positions_skip_unused_codes(self, sample_transactions):
+        """Test positions on a compact frame whose categories include absent customers."""
+        compact, _ = compact_frame(sample_transactions.dropna(subset=['customer_id']).copy())
+        subset = compact[compact['customer_id'] != 'C002']
+
+        features, row_positions = compute_customer_features(subset)
+
+        assert features['customer_id'].tolist() == ['C001', 'C003']
+        assert row_positions.tolist() == [0, 0, 0, 1]
+
 
 class TestComputeRFMScores:
     """Test cases for RFM scoring function."""
@@ -146,6 +247,83 @@ class TestComputeRFMScores:
         expected_total = scored['R_score'] + scored['F_score'] + scored['M_score']
         assert (scored['RFM_total'] == expected_total).all()
 
+    def test_compute_rfm_scores_match_quintiles(self, sample_rfm):
+        """Test rank binning gives the quintile scores on distinct values when n is a multiple of 5."""
+        scored = compute_rfm_scores(sample_rfm, n_bins=5)
+
+        expected = pd.qcut(sample_rfm['monetary'], q=5, labels=[1, 2, 3, 4, 5]).astype(int)
+        assert (scored['M_score'] == expected).all()
+        assert scored['M_score'].value_counts().tolist() == [20] * 5
+
+    @pytest.mark.parametrize('customers', [7, 12, 13])
+    def test_compute_rfm_scores_uneven_count(self, customers):
+        """Test bands stay within one customer of equal size when n is not a multiple of 5."""
+        rng = np.random.default_rng(customers)
+        rfm = pd.DataFrame({
+            'customer_id': np.arange(customers),
+            'recency': rng.permutation(customers) + 1,
+            'frequency': rng.permutation(customers) + 1,
+            'monetary': rng.permutation(customers) * 10.0,
+        })
+
+        scored = compute_rfm_scores(rfm, n_bins=5)
+
+        order = np.argsort(rfm['monetary'].to_numpy())
+        assert scored['M_score'].to_numpy()[order].tolist() == [1 + rank * 5 // customers for rank in range(customers)]
+        sizes = scored['M_score'].value_counts().reindex(range(1, 6), fill_value=0)
+        assert sizes.max() - sizes.min() <= 1
+        # Recency is frequency's mirror image: the most recent customer scores like the most frequent
+        mirrored = compute_rfm_scores(rfm.assign(frequency=-rfm['recency']), n_bins=5)
+        assert (scored['R_score'] == mirrored['F_score']).all()
+
+    def test_compute_rfm_scores_ties(self):
+        """Test tied values share a score and a dominant value takes the lowest band."""
+        rfm = pd.DataFrame({
+            'customer_id': [f'C{i}' for i in range(10)],
+            'recency': [5, 5, 5, 40, 40, 90, 120, 200, 300, 365],
+            'frequency': [1, 1, 1, 1, 1, 1, 1, 2, 3, 9],
+            'monetary': [50.0] * 10,
+        })
+
+        scored = compute_rfm_scores(rfm, n_bins=5)
+
+        assert scored['F_score'].tolist() == [1, 1, 1, 1, 1, 1, 1, 4, 5, 5]
+        assert scored['R_score'].tolist() == [4, 4, 4, 3, 3, 3, 2, 2, 1, 1]
+        assert (scored['M_score'] == 1).all()
+
+    def test_compute_rfm_scores_worst_recency_ties(self):
+        """Test customers tied at the longest recency take the lowest R band."""
+        rfm = pd.DataFrame({
+            'customer_id': np.arange(100),
+            'recency': [300] * 50 + list(range(1, 51)),
+            'frequency': [1] * 100,
+            'monetary': [50.0] * 100,
+        })
+
+        scored = compute_rfm_scores(rfm, n_bins=5)
+
+        assert (scored['R_score'][:50] == 1).all()
+        assert scored['R_score'][50:].tolist() == [5] * 20 + [4] * 20 + [3] * 10
+
+    def test_compute_rfm_scores_with_sketched_quantiles(self):
+        """Test scores against shared sketched summaries stay within one band of the exact ones."""
+        rng = np.random.default_rng(7)
+        rfm = pd.DataFrame({
+            'customer_id': np.arange(20_000),
+            'recency': rng.integers(1, 730, 20_000),
+            'frequency': rng.geometric(0.3, 20_000),
+            'monetary': rng.lognormal(5.0, 1.0, 20_000),
+        })
+        quantiles = column_quantiles(rfm, exact_limit=1000)
+
+        exact = compute_rfm_scores(rfm)
+        sketched = compute_rfm_scores(rfm, quantiles=quantiles)
+
+        for column in ['R_score', 'F_score', 'M_score']:
+            difference = (sketched[column] - exact[column]).abs()
+            assert difference.max() <= 1
+            assert (difference == 0).mean() > 0.95
+
 
 class TestNormalizeRFM:
     """Test cases for RFM normalization."""
@@ -205,6 +383,14 @@ class TestRFMStatistics:
         assert stats['recency']['median'] == 30.0
         assert stats['recency']['min'] == 10.0
         assert stats['recency']['max'] == 50.0
+
+    def test_get_rfm_statistics_reuses_quantiles(self, sample_rfm):
+        """Test supplied quantile summaries give the same quartiles as the column."""
+        stats = get_rfm_statistics(sample_rfm, quantiles=column_quantiles(sample_rfm))
+
+        assert stats['monetary']['q25'] == sample_rfm['monetary'].quantile(0.25)
+        assert stats['monetary']['q75'] == sample_rfm['monetary'].quantile(0.75)
+        assert stats['frequency']['median'] == 15.0
     
     def test_get_rfm_distributions(self, sample_rfm):
         """Test distribution histogram data."""
@@ -0,0 +1,147 @@
+"""
+Unit tests for the out-of-core, partitioned RFM computation.
+"""
+import pytest
+import pandas as pd
+import numpy as np
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics import rfm_partitioned
+from app.analytics.rfm import compute_customer_features
+from app.analytics.rfm_partitioned import find_sources, partitioned_customer_features
+
+
+class TestPartitionedCustomerFeatures:
+    """Test cases for partitioned_customer_features."""
+
+    @pytest.fixture
+    def transactions(self):
+        """Transactions with multi-line invoices and text dates, as in an export."""
+        rng = np.random.default_rng(5)
+        n = 6000
+        invoice_numbers = rng.integers(0, 2500, n)
+        return pd.DataFrame({
+            'customer_id': (invoice_numbers % 400).astype(str),
+            'invoice_date': (
+                pd.Timestamp('2025-01-01') + pd.to_timedelta(invoice_numbers % 365, unit='D')
+            ).strftime('%Y-%m-%d'),
+            'invoice_id': [f'INV{i:05d}' for i in invoice_numbers],
+            'amount': rng.gamma(2.0, 30.0, n).round(2),
+        })
+
+    @pytest.fixture
+    def parts(self, transactions, tmp_path):
+        """The transactions split over a CSV, a Parquet and a Feather part file."""
+        directory = tmp_path / 'parts'
+        directory.mkdir()
+        transactions.iloc[:2000].to_csv(directory / 'part-0.csv', index=False)
+        transactions.iloc[2000:4000].to_parquet(directory / 'part-1.parquet', row_group_size=700)
+        transactions.iloc[4000:].reset_index(drop=True).to_feather(directory / 'part-2.feather')
+        (directory / 'notes.txt').write_text('not a transaction file')
+        return directory
+
+    @staticmethod
+    def expected_features(transactions, **kwargs):
+        features, _ = compute_customer_features(
+            transactions.assign(invoice_date=pd.to_datetime(transactions['invoice_date'])), **kwargs
+        )
+        return features
+
+    def test_matches_in_memory_features(self, transactions, parts, tmp_path):
+        """Test partitioning mixed part files gives the in-memory features and leaves no spill files."""
+        stats = {}
+        features = partitioned_customer_features(parts, partitions=7, workers=1, work_dir=tmp_path, stats=stats)
+
+        pd.testing.assert_frame_equal(features, self.expected_features(transactions), check_dtype=False)
+        assert stats['sources'] == 3
+        assert stats['rows'] == len(transactions)
+        assert stats['customers'] == 400
+        assert stats['largest_partition_rows'] < len(transactions)
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['parts']
+
+    def test_worker_processes_match_single_process(self, parts):
+        """Test the process pool gives the same features as running in-process."""
+        reference_date = pd.Timestamp('2026-01-31')
+        inline = partitioned_customer_features(parts, reference_date, partitions=4, workers=1)
+        pooled = partitioned_customer_features(parts, reference_date, partitions=4, workers=2)
+
+        pd.testing.assert_frame_equal(pooled, inline)
+
+    def test_rows_without_customer_or_invoice(self, transactions, tmp_path):
+        """Test rows without a customer are skipped and, without invoices, dated rows count as orders."""
+        source = tmp_path / 'export.csv'
+        transactions.assign(
+            customer_id=transactions['customer_id'].where(transactions.index % 10 != 0)
+        ).to_csv(source, index=False)
+        stats = {}
+
+        features = partitioned_customer_features(source, invoice_col=None, partitions=3, workers=1, stats=stats)
+
+        kept = transactions[transactions.index % 10 != 0]
+        expected = self.expected_features(kept, invoice_col=None)
+        pd.testing.assert_frame_equal(features, expected, check_dtype=False)
+        assert stats['rows_without_customer'] == len(transactions) - len(kept)
+
+    def test_date_format_inferred_once(self, transactions, tmp_path):
+        """Test day-first text dates are read with one inferred format, even where the head is ambiguous."""
+        dates = pd.to_datetime(transactions['invoice_date'])
+        ambiguous_first = np.argsort(dates.dt.day.to_numpy() > 12, kind='stable')
+        source = tmp_path / 'export.csv'
+        transactions.assign(invoice_date=dates.dt.strftime('%d/%m/%Y')).iloc[ambiguous_first].to_csv(source, index=False)
+        stats = {}
+
+        features = partitioned_customer_features(source, partitions=3, workers=1, stats=stats)
+
+        pd.testing.assert_frame_equal(features, self.expected_features(transactions), check_dtype=False)
+        assert stats['date_format'] == '%d/%m/%Y'
+
+    def test_csv_byte_ranges_start_on_records(self, tmp_path):
+        """Test byte ranges of a CSV never cut a quoted field, even one with newlines and quotes."""
+        rows = pd.DataFrame({
+            'customer_id': [f'C{i}' for i in range(400)],
+            'note': ['line one\nline "two"\n' * (i % 3) for i in range(400)],
+        })
+        path = tmp_path / 'notes.csv'
+        rows.to_csv(path, index=False)
+
+        ranges = rfm_partitioned._csv_byte_ranges(path, parts=9, block_size=1000)
+
+        header = list(rows.columns)
+        parsed = [
+            pd.concat(list(rfm_partitioned._iter_csv_range(path, header, header, 'utf-8', start, stop)))
+            for start, stop in ranges
+        ]
+        assert len(ranges) == 9
+        assert [start for start, _ in ranges[1:]] == [stop for _, stop in ranges[:-1]]
+        pd.testing.assert_frame_equal(
+            pd.concat(parsed, ignore_index=True).astype(object).fillna(''), rows.astype(object), check_dtype=False,
+        )
+
+    @pytest.mark.parametrize('file_format', ['csv', 'parquet'])
+    def test_single_file_scattered_in_parts(self, transactions, tmp_path, monkeypatch, file_format):
+        """Test one large export is split across the scatter workers and gives the same features."""
+        monkeypatch.setattr(rfm_partitioned, 'RFM_SPLIT_MB', 0)
+        source = tmp_path / f'export.{file_format}'
+        if file_format == 'csv':
+            transactions.to_csv(source, index=False)
+        else:
+            transactions.to_parquet(source, row_group_size=500)
+        stats = {}
+
+        features = partitioned_customer_features(source, partitions=5, workers=3, stats=stats)
+
+        pd.testing.assert_frame_equal(features, self.expected_features(transactions), check_dtype=False)
+        assert stats['sources'] == 1
+        assert stats['scatter_tasks'] == 3
+        assert stats['rows'] == len(transactions)
+
+    def test_missing_sources_and_columns(self, transactions, parts, tmp_path):
+        """Test missing files and columns raise ValueError."""
+        with pytest.raises(ValueError, match="not found"):
+            partitioned_customer_features(tmp_path / 'missing.csv', workers=1)
+        with pytest.raises(ValueError, match="missing column"):
+            partitioned_customer_features(parts, amount_col='total', workers=1)
+        assert [path.name for path in find_sources(parts)] == ['part-0.csv', 'part-1.parquet', 'part-2.feather']
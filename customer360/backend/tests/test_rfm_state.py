@@ -0,0 +1,197 @@
+"""
+Unit tests for the incremental per-tenant RFM state.
+"""
+import threading
+
+import pytest
+import pandas as pd
+import numpy as np
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.analytics import pipeline as pipeline_module
+from app.analytics.preprocessing import compact_frame, preprocess_transaction_data
+from app.analytics.rfm import compute_customer_features
+from app.analytics.rfm_state import RFMState, tenant_state_lock, transaction_fingerprints
+
+
+class TestRFMState:
+    """Test cases for RFMState."""
+
+    @pytest.fixture
+    def transactions(self):
+        """A year of transactions, sorted by date, with multi-line invoices."""
+        rng = np.random.default_rng(11)
+        n = 3000
+        invoice_numbers = np.sort(rng.integers(0, 2200, n))
+        df = pd.DataFrame({
+            'customer_id': (invoice_numbers % 180).astype(str),
+            'invoice_date': pd.Timestamp('2025-01-01') + pd.to_timedelta(invoice_numbers // 6, unit='D'),
+            'invoice_id': [f'INV{i:05d}' for i in invoice_numbers],
+            'amount': rng.gamma(2.0, 30.0, n).round(2),
+        })
+        return df
+
+    @staticmethod
+    def assert_features_equal(actual, expected):
+        pd.testing.assert_frame_equal(
+            actual.astype({'customer_id': object}), expected.astype({'customer_id': object}), check_dtype=False,
+        )
+
+    def test_overlapping_exports_match_full_history(self, transactions):
+        """Test rolling exports that repeat earlier weeks give the full-history features."""
+        dates = transactions['invoice_date']
+        exports = [
+            transactions[dates < '2025-05-01'],
+            transactions[(dates >= '2025-03-01') & (dates < '2025-09-01')],
+            transactions[dates >= '2025-07-01'],
+        ]
+        state = RFMState()
+        ingested = [state.update(compact_frame(export.copy())[0]) for export in exports]
+
+        expected, _ = compute_customer_features(transactions)
+        self.assert_features_equal(state.features(), expected)
+        assert sum(stats['new_rows'] for stats in ingested) == len(transactions)
+        assert ingested[1]['duplicate_rows'] == int(((dates >= '2025-03-01') & (dates < '2025-05-01')).sum())
+        assert len(state.fingerprints) == transactions['invoice_id'].nunique()
+
+    def test_same_upload_twice_changes_nothing(self, transactions):
+        """Test re-ingesting a file only records skipped rows."""
+        state = RFMState()
+        state.update(transactions)
+        before = state.aggregates.copy()
+
+        stats = state.update(transactions)
+
+        assert stats == {'rows': len(transactions), 'new_rows': 0, 'duplicate_rows': len(transactions), 'new_customers': 0}
+        pd.testing.assert_frame_equal(state.aggregates, before)
+
+    def test_new_reference_date_only_moves_recency(self, transactions):
+        """Test features for a later reference date shift recency and nothing else."""
+        state = RFMState()
+        state.update(transactions)
+        reference = state.reference_date()
+
+        now = state.features()
+        later = state.features(reference + pd.Timedelta(days=30))
+
+        assert (later['recency'] - now['recency'] == 30).all()
+        pd.testing.assert_frame_equal(later.drop(columns='recency'), now.drop(columns='recency'))
+
+    def test_save_and_load_round_trip(self, transactions, tmp_path):
+        """Test a saved state loads back identical and a missing file is empty."""
+        path = tmp_path / 'state.npz'
+        state = RFMState()
+        state.update(transactions)
+        state.save(path)
+
+        loaded = RFMState.load(path)
+
+        pd.testing.assert_frame_equal(loaded.aggregates, state.aggregates)
+        np.testing.assert_array_equal(loaded.fingerprints, state.fingerprints)
+        assert loaded.summary()['batches'] == 1
+        assert len(RFMState.load(tmp_path / 'missing.npz')) == 0
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_overlapping_jobs_keep_both_uploads(self, transactions, tmp_path):
+        """Test a job waits for the tenant lock, so neither upload's transactions are lost."""
+        path = tmp_path / "user_1.npz"
+        first, second = transactions.iloc[:1500], transactions.iloc[1500:]
+
+        def fold(batch):
+            with tenant_state_lock(path):
+                state = RFMState.load(path)
+                state.update(batch)
+                state.save(path)
+
+        with tenant_state_lock(path):
+            state = RFMState.load(path)
+            waiting = threading.Thread(target=fold, args=(second,))
+            waiting.start()
+            waiting.join(timeout=0.3)
+            assert waiting.is_alive()
+            state.update(first)
+            state.save(path)
+        waiting.join(timeout=10)
+
+        expected, _ = compute_customer_features(transactions)
+        self.assert_features_equal(RFMState.load(path).features(), expected)
+
+    def test_row_positions_point_at_customers(self, transactions):
+        """Test each delta row finds its customer among everyone on record."""
+        state = RFMState()
+        state.update(transactions.iloc[:2000])
+        delta = compact_frame(transactions.iloc[2000:].copy())[0]
+        state.update(delta)
+
+        positions = state.row_positions(delta)
+
+        features = state.features()
+        assert (positions >= 0).all()
+        assert (features['customer_id'].to_numpy()[positions] == delta['customer_id'].astype(str).to_numpy()).all()
+
+    def test_fingerprints_without_invoices(self, transactions):
+        """Test rows without an invoice ID are told apart by customer, date and amount."""
+        rows = transactions.iloc[:4].assign(invoice_id=[None, None, 'INV1', 'INV1'])
+
+        with_invoices = transaction_fingerprints(rows)
+        without_invoices = transaction_fingerprints(rows.drop(columns='invoice_id'))
+
+        assert with_invoices[2] == with_invoices[3]
+        assert with_invoices[0] != with_invoices[1]
+        np.testing.assert_array_equal(with_invoices[:2], without_invoices[:2])
+
+
+class TestIncrementalPipeline:
+    """Test cases for folding uploads into the stored state from the pipeline."""
+
+    @pytest.fixture
+    def upload(self, tmp_path):
+        """A small export with customer, date and amount columns."""
+        path = tmp_path / 'week.csv'
+        pd.DataFrame({
+            'customer': ['C1', 'C2', 'C3', 'C1'],
+            'date': ['2025-01-01', '2025-01-02', '2025-01-03', '2025-01-04'],
+            'amount': [50.0, 59.0, 20.0, 35.0],
+        }).to_csv(path, index=False)
+        return path
+
+    @staticmethod
+    def run_incremental(upload, tmp_path, monkeypatch, column_mapping):
+        # Read the upload directly rather than through the shared frame cache
+        monkeypatch.setattr(
+            pipeline_module, 'cached_preprocess_transaction_data',
+            lambda file_path, column_mapping, **kwargs: preprocess_transaction_data(file_path, column_mapping),
+        )
+        state_path = tmp_path / 'user_1.npz'
+        pipeline = pipeline_module.SegmentationPipeline(
+            file_path=str(upload),
+            output_dir=str(tmp_path / 'out'),
+            job_id='job-1',
+            column_mapping=column_mapping,
+            rfm_state_path=str(state_path),
+        )
+        return pipeline, state_path
+
+    def test_synthetic_customer_ids_rejected(self, upload, tmp_path, monkeypatch):
+        """Test row-number customer IDs are never merged into the stored history."""
+        pipeline, state_path = self.run_incremental(upload, tmp_path, monkeypatch, {
+            'invoice_date': 'date', 'amount': 'amount', 'allow_synthetic_customer_id': True,
+        })
+
+        with pytest.raises(ValueError, match="needs a mapped customer ID column"):
+            pipeline.run()
+        assert not state_path.exists()
+        assert pipeline.results['meta']['status'] == 'failed'
+
+    def test_synthetic_invoice_dates_rejected(self, upload, tmp_path, monkeypatch):
+        """Test dates made up around today are never fingerprinted into the stored history."""
+        pipeline, state_path = self.run_incremental(upload, tmp_path, monkeypatch, {
+            'customer_id': 'customer', 'amount': 'amount', 'allow_synthetic_invoice_date': True,
+        })
+
+        with pytest.raises(ValueError, match="needs a mapped invoice date column"):
+            pipeline.run()
+        assert not state_path.exists()
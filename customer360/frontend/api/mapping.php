@@ -258,6 +258,8 @@ function handleGetColumns() {
         'total_rows' => $upload['total_rows'] ?? null,
         'raw_rows' => $upload['raw_rows'] ?? null,
         'removed_blank_rows' => $upload['removed_blank_rows'] ?? null,
+        'mapping_source' => $upload['mapping_source'] ?? 'suggested',
+        'remembered_options' => $upload['remembered_options'] ?? null,
         'mapping_validation' => $_SESSION['mapping_validation'] ?? null
     ]);
 }
@@ -110,6 +110,9 @@ if ($action === 'preview') {
         'total_rows' => $preview['total_rows'] ?? null,
         'raw_rows' => $preview['raw_rows'] ?? null,
         'removed_blank_rows' => $preview['removed_blank_rows'] ?? null,
+        'row_count_estimated' => $preview['row_count_estimated'] ?? false,
+        'mapping_source' => $preview['mapping_source'] ?? 'suggested',
+        'remembered_options' => $preview['remembered_options'] ?? null,
     ];
 
     jsonResponse([
@@ -122,6 +125,9 @@ if ($action === 'preview') {
         'total_rows' => $preview['total_rows'] ?? null,
         'raw_rows' => $preview['raw_rows'] ?? null,
         'removed_blank_rows' => $preview['removed_blank_rows'] ?? null,
+        'row_count_estimated' => $preview['row_count_estimated'] ?? false,
+        'mapping_source' => $preview['mapping_source'] ?? 'suggested',
+        'remembered_options' => $preview['remembered_options'] ?? null,
     ]);
 }
 
@@ -25,6 +25,10 @@ $columnProfiles = $upload['column_profiles'] ?? [];
 $rawRows = $upload['raw_rows'] ?? null;
 $totalRows = $upload['total_rows'] ?? null;
 $removedBlankRows = $upload['removed_blank_rows'] ?? 0;
+$rowCountEstimated = !empty($upload['row_count_estimated']);
+// A layout the user mapped before comes back with the parsing rules it ran with.
+$mappingRemembered = ($upload['mapping_source'] ?? 'suggested') === 'memory';
+$rememberedOptions = $upload['remembered_options'] ?? null;
 $hasUploadPreview = $uploadedFile !== '' && !empty($availableColumns);
 
 if (!$hasUploadPreview) {
@@ -148,11 +152,15 @@ $optionalFields = [
                 <p class="text-[10px] uppercase tracking-[0.24em] text-slate-400">Build 9355edc-plus</p>
                 <?php if ($totalRows !== null || $rawRows !== null): ?>
                 <p class="text-xs uppercase tracking-[0.2em] text-slate-500">
-                    Parsed rows: <?php echo number_format((int) ($totalRows ?? 0)); ?>
+                    Parsed rows: <?php echo $rowCountEstimated ? '~' : ''; ?><?php echo number_format((int) ($totalRows ?? 0)); ?>
                     <?php if ($rawRows !== null): ?> / raw rows: <?php echo number_format((int) $rawRows); ?><?php endif; ?>
                     <?php if ((int) $removedBlankRows > 0): ?> / blank rows removed: <?php echo number_format((int) $removedBlankRows); ?><?php endif; ?>
+                    <?php if ($rowCountEstimated): ?> (estimated from a sample)<?php endif; ?>
                 </p>
                 <?php endif; ?>
+                <?php if ($mappingRemembered): ?>
+                <p class="text-sm text-[#536e93]">This file has the same columns as one you mapped before, so your previous mapping and parsing rules are filled in below.</p>
+                <?php endif; ?>
             </div>
             <div id="warningBanner" class="@container">
                 <div class="flex flex-col items-start justify-between gap-4 rounded-lg border border-yellow-200 bg-yellow-50 dark:bg-yellow-900/20 dark:border-yellow-800 p-4 sm:flex-row sm:items-center">
@@ -803,7 +811,40 @@ $optionalFields = [
             updateMappingStatus();
         }
 
+        function applyRememberedOptions() {
+            const remembered = <?php echo json_encode($rememberedOptions); ?>;
+            if (!remembered) return;
+
+            const controls = {
+                amount_source_mode: 'amountSourceMode',
+                invoice_date_format: 'invoiceDateFormat',
+                decimal_separator: 'decimalSeparator',
+                thousands_separator: 'thousandsSeparator',
+                currency_symbol: 'currencySymbol',
+                negative_amount_policy: 'negativeAmountPolicy',
+                dayfirst: 'dayfirstFlag',
+                allow_synthetic_customer_id: 'allowSyntheticCustomerId',
+                allow_synthetic_invoice_date: 'allowSyntheticInvoiceDate'
+            };
+
+            Object.entries(controls).forEach(([option, id]) => {
+                const el = document.getElementById(id);
+                if (!el || !(option in remembered) || remembered[option] === null) return;
+                if (el.type === 'checkbox') {
+                    el.checked = Boolean(remembered[option]);
+                    return;
+                }
+                const value = String(remembered[option]);
+                // A detected date format may not be one of the preset choices
+                if (el.tagName === 'SELECT' && !Array.from(el.options).some((opt) => opt.value === value)) {
+                    el.add(new Option(value, value));
+                }
+                el.value = value;
+            });
+        }
+
         document.addEventListener('DOMContentLoaded', function() {
+            applyRememberedOptions();
             updateAmountMode();
             applySuggestedMapping();
             updateMappingStatus();